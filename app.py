@@ -1,7 +1,8 @@
 import os
 import uuid
 import json
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, make_response, g
+import logging
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, make_response, g, send_file
 
 # =============================================
 # 🆕 FUNCIÓN SAAS - CREAR TENANT AUTOMÁTICAMENTE
@@ -16,10 +17,9 @@ def crear_tenant_saas(nombre_panaderia, subdominio, email_contacto=None):
         # Importar módulos necesarios
         import sqlite3
         import os
-        import shutil
         
         # 1. REGISTRAR EN BD MAESTRA
-        conn_maestra = sqlite3.connect('tenant_master.db')
+        conn_maestra = conectar_sqlite('tenant_master.db')
         cursor_maestra = conn_maestra.cursor()
         
         # Verificar si el subdominio ya existe
@@ -45,16 +45,16 @@ def crear_tenant_saas(nombre_panaderia, subdominio, email_contacto=None):
             # Usar plantilla profesional
             plantilla = 'databases_tenants/tenant_plantilla.db'
             if os.path.exists(plantilla):
-                shutil.copy2(plantilla, ruta_bd)
+                copiar_bd(plantilla, ruta_bd)
                 print(f"✅ BD creada desde plantilla: {ruta_bd}")
             else:
                 # Fallback a BD principal
-                shutil.copy2('databases_tenants/panaderia_principal.db', ruta_bd)
+                copiar_bd('databases_tenants/panaderia_principal.db', ruta_bd)
                 print(f"✅ BD creada desde principal: {ruta_bd}")
         
         # 3. CONFIGURAR TENANT EN SU BD (REEMPLAZA usuarios_global)
         # Ahora se configura directamente en la BD del tenant, no en tabla global
-        conn_tenant = sqlite3.connect(ruta_bd)
+        conn_tenant = conectar_sqlite(ruta_bd)
         cursor_tenant = conn_tenant.cursor()
         
         # Configurar panadería en su propia BD
@@ -76,6 +76,7 @@ def crear_tenant_saas(nombre_panaderia, subdominio, email_contacto=None):
         
         conn_maestra.commit()
         conn_maestra.close()
+        directorio_tenants.invalidar()
         
         print(f"🎉 Nuevo tenant SaaS creado: {nombre_panaderia} (ID: {tenant_id})")
         print(f"   📁 Archivo: {nombre_bd}")
@@ -109,7 +110,7 @@ def crear_usuarios_tenant_siempre(tenant_id, tenant_db_path, nombre_panaderia):
         caracteres = string.ascii_letters + string.digits + "!@#$%"
         contrasena_temp = ''.join(secrets.choice(caracteres) for _ in range(10))
         
-        conn = sqlite3.connect(tenant_db_path)
+        conn = conectar_sqlite(tenant_db_path)
         cursor = conn.cursor()
         
         # Verificar si ya existen usuarios
@@ -168,7 +169,27 @@ from tenant_context import TenantContext
 from security_utils import validate_tenant_access, safe_tenant_query, check_tenant_ownership
 
 # SAAS MIDDLEWARE - Arquitectura Multi-Tenant
-from middleware_saas import init_tenants_app, gestor_tenants
+from middleware_saas import init_tenants_app, gestor_tenants, directorio_tenants
+from tenant_engines import init_registro_engines, registro_engines
+from secuencia_pos import init_secuencia_pos, secuencia_pos
+from perfil_tenant import (
+    init_cache_perfiles, cache_perfiles, cache_suscripciones, obtener_perfil_tenant,
+    configuracion_tenant, invalidar_configuracion_tenant
+)
+from catalogo_productos import init_catalogo_productos, catalogo_productos, parsear_clave_producto, TIPO_EXTERNO
+from utilidades.rangos_fechas import filtro_fechas, rango_dias, marcas_tiempo, hoy_tenant, zona_horaria_valida
+from rotaciones import rotaciones_actualizadas_hoy
+from utilidades.consultas_filtradas import detalles_de_venta, detalles_productos_externos
+from resumen_ventas import (acumular_venta, acumular_productos_venta, totales_periodo, totales_por_dia,
+                            contar_productos_donados, clave_producto, resumen_productos, unidades_por_nombre, productos_mas_vendidos,
+                            top_productos, unidades_por_categoria, ventas_por_hora, analisis_productos,
+                            cierre_por_producto, ventas_con_unidades)
+from registro_logs import init_logging
+from conexion_sqlite import init_conexiones_sqlite, conectar_sqlite, copiar_bd, eliminar_bd
+from cache_permisos import init_cache_permisos, cache_permisos
+from detector_n_mas_1 import init_detector_n_mas_1
+from cola_reportes import init_cola_reportes, cola_reportes, generar_pdf
+from cache_reportes import init_cache_reportes
 
 from flask_login import LoginManager, login_required, current_user, login_user, logout_user
 from flask_migrate import Migrate
@@ -198,6 +219,22 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 # 🆕 CREAR APLICACIÓN FLASK
 app = Flask(__name__)
+
+# 📝 LOGGING ESTRUCTURADO (niveles por módulo, cola no bloqueante, archivo JSON opcional)
+app.config['LOG_NIVEL'] = os.environ.get('LOG_NIVEL', 'INFO')
+app.config['LOG_NIVELES_MODULOS'] = {
+    'middleware_saas': 'WARNING',
+    'consultas_filtradas': 'WARNING',
+    'app.pos': 'INFO',
+    'app.reportes': 'INFO'
+}
+app.config['LOG_FORMATO'] = os.environ.get('LOG_FORMATO', 'texto')
+app.config['LOG_ARCHIVO_JSON'] = os.environ.get('LOG_ARCHIVO_JSON')
+init_logging(app)
+
+logger_pos = logging.getLogger('app.pos')
+logger_reportes = logging.getLogger('app.reportes')
+logger_tenants = logging.getLogger('middleware_saas')
 TenantContext.initialize_app(app)
 # INICIALIZAR SISTEMA SAAS MULTI-TENANT
 init_tenants_app(app)
@@ -208,6 +245,63 @@ app.config['PERMANENT_SESSION_LIFETIME'] = 3600
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///C:/Users/Mauricio/Desktop/panaderia_sistema/panaderia_profesional/databases_tenants/panaderia_principal.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# ⚡ PERFIL DE PRAGMAs PARA TODAS LAS CONEXIONES SQLITE (engines y sqlite3 directo)
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,     # KiB por conexión
+    'busy_timeout': 5000,         # ms
+    'temp_store': 'MEMORY'
+}
+init_conexiones_sqlite(app)
+
+# 🆕 ENGINES POR TENANT (un pool por BD, con límite LRU)
+app.config['TENANT_DATABASES_DIR'] = 'databases_tenants'
+app.config['TENANT_ENGINES_MAX'] = 32
+app.config['TENANT_ENGINE_OPTIONS'] = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_recycle': 3600
+}
+init_registro_engines(app)
+
+# 🆕 CONSECUTIVOS POS POR BLOQUES (1 = sin bloques, reserva dentro de la venta)
+app.config['POS_TAMANO_LOTE_CONSECUTIVOS'] = 10
+init_secuencia_pos(app)
+
+# 🆕 CACHÉ DEL PERFIL LEGAL/MARCA DE CADA PANADERÍA (segundos)
+app.config['PERFIL_TENANT_TTL'] = 300
+app.config['SUSCRIPCION_TTL'] = 60
+init_cache_perfiles(app)
+
+# 🕒 ZONA HORARIA PARA PANADERÍAS SIN ConfiguracionPanaderia.zona_horaria
+app.config['ZONA_HORARIA_POR_DEFECTO'] = 'America/Bogota'
+
+# 📇 ÍNDICE EN MEMORIA DEL CATÁLOGO PARA /buscar_producto
+app.config['CATALOGO_TTL'] = 60
+app.config['CATALOGO_LIMITE_RESULTADOS'] = 50
+init_catalogo_productos(app)
+
+# 🔐 PERMISOS EFECTIVOS COMPILADOS POR USUARIO (segundos, respaldo multi-proceso)
+app.config['PERMISOS_TTL'] = 300
+init_cache_permisos(app)
+
+# 🐢 DETECTOR DE CARGAS PEREZOSAS N+1 (None = solo con app.debug)
+app.config['DETECTAR_N_MAS_1'] = {'1': True, '0': False}.get(os.environ.get('DETECTAR_N_MAS_1'))
+app.config['N_MAS_1_UMBRAL'] = 10
+init_detector_n_mas_1(app)
+
+# 🖨️ COLA DE REPORTES PDF EN SEGUNDO PLANO (hilos del pool, horas que se conservan los PDF)
+app.config['REPORTES_DIRECTORIO'] = 'reportes_generados'
+app.config['REPORTES_TRABAJADORES'] = 2
+app.config['REPORTES_RETENCION_HORAS'] = 24
+init_cola_reportes(app)
+
+# 📄 CACHÉ DE REPORTES PDF POR VERSIÓN DE DATOS (días sin uso antes de borrar un PDF)
+app.config['REPORTES_CACHE_DIAS'] = 30
+init_cache_reportes(app)
+
 # =============================================
 # IMPORTAR DB PRIMERO, LUEGO MODELOS
 
@@ -219,12 +313,12 @@ from models import db
 # 🆕 AHORA IMPORTAR TODOS LOS MODELOS
 from models import Usuario, Producto, Venta, DetalleVenta, MateriaPrima, Receta, RecetaIngrediente, Panaderia,  ConfiguracionPanaderia
 from models import OrdenProduccion, Categoria, Proveedor, HistorialCompra, HistorialInventario
-from models import ConfiguracionProduccion, HistorialRotacionProducto, ControlVidaUtil, Factura
+from models import ConfiguracionProduccion, ControlVidaUtil, Factura
 from models import ProductoExterno, CompraExterna, RegistroDiario, SaldoBanco, PagoIndividual, DepositoBancario
 from models import JornadaVentas, CierreDiario, obtener_jornada_activa, cerrar_jornada_actual, obtener_ventas_dia, obtener_historial_cierres
 from models import ConsecutivoPOS, ConfiguracionSistema, Cliente
-from models import calcular_rotacion_automatica, actualizar_rotaciones_automaticas
-from models import calcular_tendencia_ventas, analizar_productos_periodo, calcular_rotacion_automatica_por_nombre
+from models import calcular_rotacion_automatica
+from models import calcular_tendencia_ventas
 from models import calcular_proyeccion_ventas, generar_recomendacion_stock, generar_alertas_inteligentes
 from models import LogSistema, RegistroFinanciero
 from models import obtener_productos_sin_ventas_recientes, ActivoFijo, HistorialMantenimiento, CATEGORIAS_ACTIVOS
@@ -247,6 +341,21 @@ migrate = Migrate(app, db)
 
 @login_manager.user_loader
 def load_user(user_id):
+    # current_user puede cargarse antes o después de que antes_de_cada_peticion tome
+    # g.tenant del subdominio (o ?tenant / X-Tenant-ID): el usuario se lee siempre de la
+    # BD del tenant de su sesión, y si la petición ya apunta a otro tenant queda sin autenticar
+    panaderia_id = session.get('panaderia_id')
+    if panaderia_id:
+        tenant_sesion = directorio_tenants.buscar_por_id(panaderia_id, solo_activos=True)
+        if not tenant_sesion:
+            logger_tenants.warning("⚠️ Tenant de la sesión no encontrado o inactivo (panaderia_id: %s)", panaderia_id)
+            return None
+        tenant_peticion = getattr(g, 'tenant', None)
+        if tenant_peticion and tenant_peticion.get('base_datos') != tenant_sesion.get('base_datos'):
+            logger_tenants.warning("⚠️ Sesión del tenant %s usada en el tenant %s: petición sin autenticar",
+                                   tenant_sesion.get('subdominio'), tenant_peticion.get('subdominio'))
+            return None
+        g.tenant = tenant_sesion
     return db.session.get(Usuario, int(user_id))
 
 # =============================================
@@ -328,7 +437,6 @@ def licencia_premium_requerida():
     from functools import wraps
     from flask import flash, redirect, url_for
     from flask_login import current_user
-    from models import ConfiguracionPanaderia
     
     def decorator(f):
         @wraps(f)
@@ -337,15 +445,8 @@ def licencia_premium_requerida():
                 flash('Debes iniciar sesión', 'warning')
                 return redirect(url_for('login'))
             
-            # Obtener configuración del tenant actual
-            config = ConfiguracionPanaderia.query.filter_by(
-                tenant_id=current_user.panaderia_id
-            ).first()
-            
-            if not config:
-                config = ConfiguracionPanaderia.query.filter_by(
-                    panaderia_id=current_user.panaderia_id
-                ).first()
+            # Obtener configuración del tenant actual (memorizada en la petición)
+            config = configuracion_tenant(current_user.panaderia_id)
             
             # Verificar si tiene licencia Premium
             if config and config.tipo_licencia == 'nube_basica':
@@ -363,8 +464,6 @@ def licencia_premium_requerida():
 @app.context_processor
 def inject_permisos():
     """Inyectar funciones de permisos en todos los templates"""
-    from models import ConfiguracionPanaderia
-    
     def usuario_puede(modulo, accion):
         if not current_user.is_authenticated:
             return False
@@ -380,16 +479,8 @@ def inject_permisos():
             return []
         return current_user.obtener_modulos_permitidos()
     
-    # Obtener configuración del tenant actual
-    config = None
-    if current_user.is_authenticated:
-        config = ConfiguracionPanaderia.query.filter_by(
-            tenant_id=current_user.panaderia_id
-        ).first()
-        if not config:
-            config = ConfiguracionPanaderia.query.filter_by(
-                panaderia_id=current_user.panaderia_id
-            ).first()
+    # Obtener configuración del tenant actual (memorizada en la petición)
+    config = configuracion_tenant() if current_user.is_authenticated else None
     
     return dict(
         usuario_puede=usuario_puede,
@@ -411,33 +502,25 @@ def antes_de_cada_peticion():
     # PRIMERO: Detección por subdominio (siempre disponible)
     tenant_detectado = gestor_tenants.obtener_tenant_desde_request()
     if tenant_detectado:
-        print(f"🔍 Tenant detectado por subdominio: {tenant_detectado['nombre']}")
+        logger_tenants.debug("🔍 Tenant detectado por subdominio: %s", tenant_detectado['nombre'])
+        # load_user lo compara con el tenant de la sesión al cargar current_user
+        g.tenant = tenant_detectado
     
     # SEGUNDO: Si hay usuario autenticado, priorizar su tenant
     # Verificar de forma segura si current_user está disponible
     try:
         if hasattr(current_user, 'is_authenticated') and current_user.is_authenticated and hasattr(current_user, 'panaderia_id'):
             try:
-                import sqlite3
-                conn = sqlite3.connect('tenant_master.db')
-                cursor = conn.cursor()
-                cursor.execute('SELECT id, nombre, subdominio, base_datos FROM tenants WHERE id = ? AND activo = 1', (current_user.panaderia_id,))
-                
-                tenant_data = cursor.fetchone()
-                conn.close()
+                tenant_data = directorio_tenants.buscar_por_id(current_user.panaderia_id, solo_activos=True)
                 
                 if tenant_data:
-                    tenant_detectado = {
-                        'id': tenant_data[0],
-                        'nombre': tenant_data[1],
-                        'subdominio': tenant_data[2],
-                        'base_datos': tenant_data[3]
-                    }
-                    print(f"🔍 Tenant detectado por usuario: {tenant_detectado['nombre']} (panaderia_id: {current_user.panaderia_id})")
+                    tenant_detectado = tenant_data
+                    logger_tenants.debug("🔍 Tenant detectado por usuario: %s (panaderia_id: %s)",
+                                         tenant_detectado['nombre'], current_user.panaderia_id)
             except Exception as e:
-                print(f"⚠️ Error detectando tenant por usuario: {e}")
+                logger_tenants.warning("⚠️ Error detectando tenant por usuario: %s", e)
     except Exception as e:
-        print(f"⚠️ current_user no disponible aún: {e}")
+        logger_tenants.warning("⚠️ current_user no disponible aún: %s", e)
     
     # TERCERO: Si no hay tenant detectado, usar principal por defecto
     if not tenant_detectado:
@@ -447,14 +530,13 @@ def antes_de_cada_peticion():
             'subdominio': 'principal',
             'base_datos': 'panaderia_principal.db'
         }
-        print("🔍 Tenant por defecto: Panadería Principal")
+        logger_tenants.debug("🔍 Tenant por defecto: Panadería Principal")
     
     # Configurar en contexto global
+    # La sesión de SQLAlchemy toma el engine de g.tenant (ver tenant_engines.py)
     g.tenant = tenant_detectado
-    
-    # Configurar SQLAlchemy para el tenant detectado
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///databases_tenants/{tenant_detectado['base_datos']}"
-    print(f"🔧 SaaS - BD configurada: {tenant_detectado['base_datos']}")
+    g.db_path = registro_engines.ruta_bd(tenant_detectado['base_datos'])
+    logger_tenants.debug("🔧 SaaS - BD configurada: %s", tenant_detectado['base_datos'])
     
     """Middleware global unificado - VERSIÓN MEJORADA"""
     # 1. Establecer información de usuario y panadería
@@ -464,21 +546,17 @@ def antes_de_cada_peticion():
     # 2. Verificar suscripción (solo si current_user está disponible)
     try:
         if hasattr(current_user, 'is_authenticated') and current_user.is_authenticated and hasattr(current_user, 'panaderia_id'):
-            from models import obtener_configuracion_panaderia
-
             try:
-                config = obtener_configuracion_panaderia(current_user.panaderia_id)
-                if config is not None:
-                    config.actualizar_estado_suscripcion()
-
-                    if config.tipo_licencia != 'local' and not config.suscripcion_activa:
-                        rutas_permitidas = ['logout', 'static', 'suscripcion_vencida', 'login']
-                        if request.endpoint and not any(ruta in request.endpoint for ruta in rutas_permitidas):
-                            return redirect(url_for('suscripcion_vencida'))
+                # Estado en caché de TTL corto: sin consulta en la mayoría de peticiones
+                estado = cache_suscripciones.obtener(current_user.panaderia_id)
+                if estado.bloquea_acceso:
+                    rutas_permitidas = ['logout', 'static', 'suscripcion_vencida', 'login']
+                    if request.endpoint and not any(ruta in request.endpoint for ruta in rutas_permitidas):
+                        return redirect(url_for('suscripcion_vencida'))
             except Exception as e:
-                print(f"⚠️ Error verificando suscripción: {e}")
+                logger_tenants.warning("⚠️ Error verificando suscripción: %s", e)
     except Exception as e:
-        print(f"⚠️ current_user no disponible para verificación de suscripción: {e}")
+        logger_tenants.warning("⚠️ current_user no disponible para verificación de suscripción: %s", e)
 
 
 # =============================================
@@ -488,8 +566,8 @@ def antes_de_cada_peticion():
 with app.app_context():
     db.create_all()
     
-    # Verificar si ya existe un usuario admin
-    admin = Usuario.query.filter_by(username='admin').first()
+    # Verificar si ya existe un usuario admin (solo el id: la BD puede estar sin migrar aún)
+    admin = db.session.query(Usuario.id).filter_by(username='admin').first()
     if not admin:
         hashed_password = generate_password_hash('admin123')
         admin_user = Usuario(
@@ -665,9 +743,20 @@ def diagnosticar_recetas(panaderia_id):
 
 def obtener_panaderia_actual():
     """Obtener panadería actual considerando acceso remoto SOLO para super usuario"""
+    # Memorizado en g: se llama varias veces por petición. La clave incluye los valores
+    # de sesión para que iniciar/terminar el acceso remoto se refleje de inmediato.
+    clave = (session.get('panaderia_remota'), session.get('panaderia_id'))
+    memo = g.get('_panaderia_actual')
+    if memo is not None and memo[0] == clave:
+        return memo[1]
+    
     if es_super_usuario() and 'panaderia_remota' in session:
-        return session['panaderia_remota']
-    return session.get('panaderia_id')
+        panaderia_id = session['panaderia_remota']
+    else:
+        panaderia_id = session.get('panaderia_id')
+    
+    g._panaderia_actual = (clave, panaderia_id)
+    return panaderia_id
 
 # ✅ ✅ ✅ FIN DE diagnosticar_recetas ✅ ✅ ✅
 # Ruta para el login - SOLO UNA VEZ
@@ -682,14 +771,13 @@ def login():
         password = request.form['password']
         
         print(f"🔍 [LOGIN] Buscando usuario: {username}")
-        print(f"🔍 [LOGIN] URI de BD: {app.config['SQLALCHEMY_DATABASE_URI']}")
-        
         # 🔧 CORREGIDO: Buscar usuario en la BD del tenant
         from flask import g
+        print(f"🔍 [LOGIN] BD del tenant: {getattr(g, 'db_path', None)}")
         if hasattr(g, 'db_path') and g.db_path:
             # Usar la BD del tenant detectada
             import sqlite3
-            conn_tenant = sqlite3.connect(g.db_path)
+            conn_tenant = conectar_sqlite(g.db_path)
             cursor_tenant = conn_tenant.cursor()
             cursor_tenant.execute("SELECT id, username, password_hash, panaderia_id, rol FROM usuarios WHERE username = ?", (username,))
             user_data = cursor_tenant.fetchone()
@@ -729,16 +817,8 @@ def login():
                 from models import ConfiguracionPanaderia
                 from datetime import datetime
                 
-                # Obtener configuración de la panadería del usuario
-                config = ConfiguracionPanaderia.query.filter_by(
-                    tenant_id=user.panaderia_id
-                ).first()
-                
-                # Si no encuentra por tenant_id, buscar por panaderia_id
-                if not config:
-                    config = ConfiguracionPanaderia.query.filter_by(
-                        panaderia_id=user.panaderia_id
-                    ).first()
+                # Obtener configuración de la panadería del usuario (tenant_id o panaderia_id)
+                config = configuracion_tenant(user.panaderia_id)
                 
                 # Verificar si la licencia es de tipo local (permanente) o tiene fecha de expiración
                 if config and config.tipo_licencia != 'local' and config.fecha_expiracion:
@@ -758,6 +838,8 @@ def login():
                 # =============================================
                 
                 login_user(user)
+                # Permisos efectivos compilados de nuevo en cada login
+                cache_permisos.invalidar(user.id)
                 session['user_id'] = user.id
                 session['username'] = user.username
                 session['rol'] = user.rol
@@ -967,81 +1049,71 @@ def debug_punto_venta():
 def buscar_producto():
     """Búsqueda unificada de productos (panadería + externos) - VERSIÓN FUNCIONAL"""
     query = request.args.get('q', '').lower()
-        # 🔍 DIAGNÓSTICO COMPLETO
     user_id = session.get('user_id')
     panaderia_id = obtener_panaderia_actual()
-    print(f"🔍 DIAGNÓSTICO buscar_producto:")
-    print(f"   👤 User ID: {user_id}")
-    print(f"   🏪 Panadería ID: {panaderia_id}")
-    print(f"   👑 Es super usuario: {es_super_usuario()}")
-    print(f"   🔍 Query: '{query}'")
+    logger_pos.debug("🔍 buscar_producto - usuario %s, panadería %s, query '%s'", user_id, panaderia_id, query)
     
     # ✅ ✅ ✅ NUEVO: BLOQUE SUPER USUARIO (AGREGA ESTO) ✅ ✅ ✅
     if es_super_usuario():
-        print("🔍 Super usuario realizando búsqueda - retornando vacío")
+        logger_pos.debug("🔍 Super usuario realizando búsqueda - retornando vacío")
         return jsonify([])  # Super usuario no ve productos en búsqueda
     # ✅ ✅ ✅ FIN BLOQUE SUPER USUARIO ✅ ✅ ✅
     
     try:
-        resultados = []
-        
-        print(f"🔍 Iniciando búsqueda con query: '{query}'")
-        
-        # PRODUCTOS DE PANADERÍA
-        from utilidades.consultas_filtradas import productos_activos_con_stock
-        productos_panaderia = productos_activos_con_stock().all()
-        print(f"🍞 Productos panadería encontrados: {len(productos_panaderia)}")
+        # 📇 Búsqueda sobre el índice en memoria del catálogo (sin consultar la BD)
+        limite = request.args.get('limite', type=int)
+        resultados = catalogo_productos.buscar(panaderia_id, query, limite)
         
-        # PRODUCTOS EXTERNOS
-        from utilidades.consultas_filtradas import productos_externos_activos_con_stock
-        productos_externos = productos_externos_activos_con_stock().all()
-        print(f"🥤 Productos externos encontrados: {len(productos_externos)}")
-        
-        # AGREGAR PRODUCTOS DE PANADERÍA
-        for producto in productos_panaderia:
-            nombre_lower = producto.nombre.lower()
-            if query in nombre_lower or query == '':
-                resultados.append({
-                    'id': producto.id,
-                    'nombre': producto.nombre,
-                    'precio': float(producto.precio_venta),
-                    'stock_actual': producto.stock_actual,
-                    'categoria': getattr(producto.categoria, 'nombre', 'Panadería') if hasattr(producto, 'categoria') and producto.categoria else 'Panadería',
-                    'tipo_producto': getattr(producto, 'tipo_producto', 'produccion'),
-                    'es_externo': False
-                })
-                print(f"✅ Agregado panadería: {producto.nombre}")
-        
-        # AGREGAR PRODUCTOS EXTERNOS
-        for producto in productos_externos:
-            nombre_lower = producto.nombre.lower()
-            if query in nombre_lower or query == '':
-                resultados.append({
-                    'id': producto.id + 10000,  # Offset para evitar conflictos
-                    'nombre': producto.nombre,
-                    'precio': float(producto.precio_venta),
-                    'stock_actual': producto.stock_actual,
-                    'categoria': producto.categoria,
-                    'tipo_producto': 'produccion',  # Mismo tipo para compatibilidad
-                    'es_externo': True,
-                    'producto_externo_id': producto.id
-                })
-                print(f"✅ Agregado externo: {producto.nombre}")
-        
-        print(f"🎯 Total resultados: {len(resultados)}")
-        
-        # DEBUG: Mostrar primeros resultados
-        for i, r in enumerate(resultados[:3]):
-            print(f"  {i+1}. {r['nombre']} (ID: {r['id']}, Precio: {r['precio']})")
+        logger_pos.debug("🎯 Total resultados: %s", len(resultados))
         
         return jsonify(resultados)
         
     except Exception as e:
-        print(f"❌ Error en búsqueda de productos: {e}")
-        import traceback
-        traceback.print_exc()
+        logger_pos.exception("❌ Error en búsqueda de productos: %s", e)
         return jsonify([])
 
+# 📇 Catálogo versionado para el punto de venta (snapshot + cambios incrementales)
+@app.route('/api/catalogo/snapshot')
+@login_required
+@modulo_requerido('punto_venta')
+@tenant_required
+def catalogo_snapshot():
+    """Catálogo visible completo con la versión a la que corresponde"""
+    if es_super_usuario():
+        return jsonify({'success': True, 'instancia': None, 'version': 0, 'productos': []})
+    
+    try:
+        datos = catalogo_productos.snapshot(obtener_panaderia_actual())
+        return jsonify(dict(datos, success=True))
+    except Exception as e:
+        logger_pos.exception("❌ Error obteniendo snapshot del catálogo")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/catalogo/cambios')
+@login_required
+@modulo_requerido('punto_venta')
+@tenant_required
+def catalogo_cambios():
+    """
+    Cambios de stock/precio desde la versión indicada (?instancia=...&desde=N).
+    Si la versión ya no está disponible responde reiniciar=true y la terminal
+    debe volver a pedir el snapshot.
+    """
+    if es_super_usuario():
+        return jsonify({'success': True, 'reiniciar': False, 'version': 0, 'cambios': []})
+    
+    try:
+        instancia = request.args.get('instancia', '')
+        desde = request.args.get('desde', 0, type=int)
+        version, cambios = catalogo_productos.cambios_desde(obtener_panaderia_actual(), instancia, desde)
+        
+        if cambios is None:
+            return jsonify({'success': True, 'reiniciar': True, 'version': version})
+        return jsonify({'success': True, 'reiniciar': False, 'version': version, 'cambios': cambios})
+    except Exception as e:
+        logger_pos.exception("❌ Error obteniendo cambios del catálogo")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/debug_productos_punto_venta')
 @login_required
 @modulo_requerido('punto_venta')
@@ -1071,75 +1143,16 @@ def debug_productos_punto_venta():
 
 
 def obtener_consecutivo_pos():
-    """Obtiene y incrementa el consecutivo POS DIRECTAMENTE desde la BD del tenant"""
-    try:
-        import sqlite3
-        from flask import g
-        
-        # 1. Obtener panaderia_id
-        panaderia_id = current_user.panaderia_id
-        print(f"🔢 [CONSECUTIVO] Panadería ID: {panaderia_id}")
-        
-        # 2. Obtener la ruta de la BD del tenant
-        if hasattr(g, 'db_path') and g.db_path:
-            bd_tenant = g.db_path
-        else:
-            # Buscar en tenant_master.db
-            conn_master = sqlite3.connect('tenant_master.db')
-            cursor_master = conn_master.cursor()
-            cursor_master.execute("SELECT base_datos FROM tenants WHERE id = ?", (panaderia_id,))
-            tenant = cursor_master.fetchone()
-            conn_master.close()
-            if tenant:
-                bd_tenant = f"databases_tenants/{tenant[0]}"
-            else:
-                bd_tenant = f"databases_tenants/panaderia_sqlalchemy.db"
-        
-        print(f"📁 [CONSECUTIVO] BD: {bd_tenant}")
-        
-        # 3. Conectar DIRECTAMENTE a la BD del tenant
-        conn = sqlite3.connect(bd_tenant)
-        cursor = conn.cursor()
-        
-        # 4. Verificar tabla
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='consecutivos_pos'")
-        if not cursor.fetchone():
-            cursor.execute('''
-                CREATE TABLE consecutivos_pos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    panaderia_id INTEGER NOT NULL,
-                    numero_actual INTEGER DEFAULT 0
-                )
-            ''')
-        
-        # 5. Obtener y actualizar consecutivo
-        cursor.execute("SELECT numero_actual FROM consecutivos_pos WHERE panaderia_id = ?", (panaderia_id,))
-        resultado = cursor.fetchone()
-        
-        if resultado:
-            nuevo_numero = resultado[0] + 1
-        else:
-            nuevo_numero = 1
-            cursor.execute("""
-                INSERT INTO consecutivos_pos (panaderia_id, numero_actual)
-                VALUES (?, ?)
-            """, (panaderia_id, 0))
-        
-        # Actualizar el consecutivo
-        cursor.execute("""
-            UPDATE consecutivos_pos 
-            SET numero_actual = ? 
-            WHERE panaderia_id = ?
-        """, (nuevo_numero, panaderia_id))
-        conn.commit()
-        conn.close()
-        
-        print(f"✅ [CONSECUTIVO] Nuevo: {nuevo_numero}")
-        return nuevo_numero
-        
-    except Exception as e:
-        print(f"❌ [CONSECUTIVO] Error: {e}")
-        return 1  # Fallback seguro
+    """
+    Obtiene el siguiente consecutivo POS de la panadería actual.
+    Con POS_TAMANO_LOTE_CONSECUTIVOS > 1 sale de un bloque arrendado en memoria
+    (ver secuencia_pos.py); con 1 se reserva dentro de la transacción de la venta.
+    """
+    panaderia_id = current_user.panaderia_id
+    
+    nuevo_numero = secuencia_pos.siguiente_numero(panaderia_id)
+    logger_pos.debug("✅ [CONSECUTIVO] Panadería %s - Nuevo: %s", panaderia_id, nuevo_numero)
+    return nuevo_numero
 
 
 def obtener_configuracion_sistema():
@@ -1187,6 +1200,23 @@ def obtener_configuracion_sistema():
             'tipo_facturacion': 'POS'
         })()
 
+@app.route('/api/consecutivos_pos/lotes')
+@login_required
+@permisos_requeridos('reportes', 'ver_todos')
+@tenant_required
+def auditoria_lotes_consecutivos():
+    """Rangos de consecutivos POS asignados por proceso, con números usados y huecos"""
+    limite = request.args.get('limite', 50, type=int)
+    try:
+        return jsonify({
+            'success': True,
+            'tamano_lote': secuencia_pos.tamano_lote,
+            'lotes': secuencia_pos.auditar_lotes(current_user.panaderia_id, limite)
+        })
+    except Exception as e:
+        print(f"❌ [CONSECUTIVO] Error auditando lotes: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 def reiniciar_consecutivo_pos():
     """
     ⚠️ SOLO PARA PRUEBAS: Reinicia el consecutivo a 0
@@ -1204,6 +1234,37 @@ def reiniciar_consecutivo_pos():
     
 
 
+def cargar_productos_carrito(carrito, panaderia_id):
+    """
+    Carga en dos consultas IN (...) todos los productos del carrito.
+    Cada item trae la clave tipada del producto ('P:123' / 'E:45').
+    Retorna (claves, internos, externos): la clave (tipo, id) de cada item y
+    diccionarios id -> producto por tipo.
+    """
+    claves = [parsear_clave_producto(item['id']) for item in carrito]
+    ids_internos = {producto_id for tipo, producto_id in claves if tipo != TIPO_EXTERNO}
+    ids_externos = {producto_id for tipo, producto_id in claves if tipo == TIPO_EXTERNO}
+    
+    internos = {}
+    if ids_internos:
+        internos = {
+            p.id: p for p in Producto.query.filter(
+                Producto.id.in_(ids_internos),
+                Producto.panaderia_id == panaderia_id
+            ).all()
+        }
+    
+    externos = {}
+    if ids_externos:
+        externos = {
+            p.id: p for p in ProductoExterno.query.filter(
+                ProductoExterno.id.in_(ids_externos),
+                ProductoExterno.panaderia_id == panaderia_id
+            ).all()
+        }
+    
+    return claves, internos, externos
+
 # ✅ RUTA ACTUALIZADA: /registrar_venta con aprendizaje automático
     
 @app.route('/registrar_venta', methods=['POST'])
@@ -1212,17 +1273,18 @@ def reiniciar_consecutivo_pos():
 @tenant_required
 def registrar_venta():
     """Registrar venta - VERSIÓN CORREGIDA MULTI-TENANT"""
-    print("🛒 DEBUG - INICIANDO REGISTRO DE VENTA")
-    print(f"👤 User ID en sesión: {session.get('user_id')}")
+    logger_pos.debug("🛒 DEBUG - INICIANDO REGISTRO DE VENTA")
+    logger_pos.debug("👤 User ID en sesión: %s", session.get('user_id'))
     
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'No autorizado'})
     
+    consecutivo_pos = None
     try:
         # 🎯 OBTENER USUARIO ACTUAL PARA panaderia_id
         usuario_actual = db.session.get(Usuario, session["user_id"])
         panaderia_id = usuario_actual.panaderia_id
-        print(f"🏪 DEBUG - Panadería ID del usuario: {panaderia_id}")
+        logger_pos.debug("🏪 DEBUG - Panadería ID del usuario: %s", panaderia_id)
         
         data = request.get_json()
         carrito = data.get('carrito', [])
@@ -1234,10 +1296,10 @@ def registrar_venta():
         es_donacion = data.get('es_donacion', False)
         motivo_donacion = data.get('motivo_donacion', '')
         
-        print(f'🛒 Datos de venta recibidos - Cliente: {cliente_id}, Tipo: {tipo_documento_solicitado}, Donación: {es_donacion}')
+        logger_pos.debug('🛒 Datos de venta recibidos - Cliente: %s, Tipo: %s, Donación: %s', cliente_id, tipo_documento_solicitado, es_donacion)
         
-        # 🆕 OBTENER CONFIGURACIÓN DEL SISTEMA
-        config = obtener_configuracion_sistema()
+        # 🆕 OBTENER PERFIL DE LA PANADERÍA (configuración + datos legales, en caché)
+        config = obtener_perfil_tenant(panaderia_id)
         
         # 🆕 VALIDACIÓN PARA FACTURA ELECTRÓNICA
         if tipo_documento_solicitado == 'ELECTRONICA':
@@ -1260,32 +1322,51 @@ def registrar_venta():
             texto_legal = "Factura electrónica de venta - Régimen simplificado"
         else:
             tipo_documento = 'POS'
-            consecutivo_pos = obtener_consecutivo_pos()
+            consecutivo_pos = None  # Se reserva dentro de la transacción, tras validar el carrito
             texto_legal = "Documento equivalente POS – No válido como factura electrónica de venta"
         
+        # 📦 CARGAR TODOS LOS PRODUCTOS DEL CARRITO (2 CONSULTAS EN TOTAL)
+        try:
+            claves_carrito, productos_internos, productos_externos = cargar_productos_carrito(carrito, current_user.panaderia_id)
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Producto inválido en el carrito'})
+        
+        # Resolver cada línea y validar stock (acumulando líneas repetidas del mismo producto)
+        lineas = []
+        cantidades_pedidas = {}
+        for item, clave in zip(carrito, claves_carrito):
+            cantidad = item['cantidad']
+            
+            tipo, producto_id = clave
+            if tipo == TIPO_EXTERNO:
+                producto = productos_externos.get(producto_id)
+            else:
+                producto = productos_internos.get(producto_id)
+            
+            cantidades_pedidas[clave] = cantidades_pedidas.get(clave, 0) + cantidad
+            if not producto or producto.stock_actual < cantidades_pedidas[clave]:
+                return jsonify({
+                    'success': False, 
+                    'error': f'Stock insuficiente: {producto.nombre if producto else "Producto"}'
+                })
+            
+            lineas.append((tipo == TIPO_EXTERNO, producto, cantidad))
+        
         # 🎁 CALCULAR TOTAL (CERO SI ES DONACIÓN)
         total_venta = 0
         if not es_donacion:
-            for item in carrito:
-                producto_id = item['id']
-                cantidad = item['cantidad']
-                
-                if producto_id > 10000:
-                    producto_externo_id = producto_id - 10000
-                    producto = ProductoExterno.query.filter_by(id=producto_externo_id, panaderia_id=current_user.panaderia_id).first()
-                    if producto:
-                        total_venta += cantidad * producto.precio_venta
-                else:
-                    producto = Producto.query.filter_by(id=producto_id, panaderia_id=current_user.panaderia_id).first()
-                    if producto:
-                        total_venta += cantidad * producto.precio_venta
+            for _, producto, cantidad in lineas:
+                total_venta += cantidad * producto.precio_venta
         else:
             total_venta = 0
-            print(f"🎁 REGISTRANDO DONACIÓN - Motivo: {motivo_donacion}")
+            logger_pos.debug("🎁 REGISTRANDO DONACIÓN - Motivo: %s", motivo_donacion)
+        
+        # 🔢 RESERVAR CONSECUTIVO POS (misma transacción que la venta)
+        if tipo_documento == 'POS':
+            consecutivo_pos = obtener_consecutivo_pos()
         
-        # 🎯 FECHA/HORA CON TIMEZONE CORRECTO (Colombia UTC-5)
-        tz_colombia = timezone(timedelta(hours=-5))
-        fecha_hora = datetime.now(tz_colombia)
+        # 🕒 HORA LOCAL, UTC Y FECHA DE NEGOCIO EN LA ZONA HORARIA DE LA PANADERÍA
+        fecha_hora, fecha_hora_utc, fecha_negocio = marcas_tiempo(panaderia_id)
         
         # 🆕 CREAR VENTA
         nueva_venta = Venta(
@@ -1299,123 +1380,63 @@ def registrar_venta():
             texto_legal=texto_legal,
             es_donacion=es_donacion,
             motivo_donacion=motivo_donacion,
-            fecha_hora=fecha_hora
+            fecha_hora=fecha_hora,
+            fecha_hora_utc=fecha_hora_utc,
+            fecha_negocio=fecha_negocio
         )
         db.session.add(nueva_venta)
         db.session.flush()
         
-        print(f"✅ Venta creada con panaderia_id: {nueva_venta.panaderia_id}")
-        print(f"📅 Fecha registrada: {fecha_hora}")
+        # 📊 RESUMEN DIARIO EN LA MISMA TRANSACCIÓN
+        acumular_venta(nueva_venta)
         
-        # ⭐⭐⭐ CORRECCIÓN MULTI-TENANT: OBTENER DATOS DE PANADERÍA DESDE LA BD DEL TENANT ⭐⭐⭐
-        import sqlite3
-        import os
+        logger_pos.debug("✅ Venta creada con panaderia_id: %s", nueva_venta.panaderia_id)
+        logger_pos.debug("📅 Fecha registrada: %s", fecha_hora)
         
-        nombre_panaderia = f"Panadería {panaderia_id}"
-        nit_panaderia = "NIT_NO_REGISTRADO"
-        direccion_panaderia = "Dirección no registrada"
-        telefono_panaderia = "Teléfono no registrado"
-        
-        # ✅ OBTENER DATOS DESDE tenant_master.db
-        try:
-            conn_master = sqlite3.connect('tenant_master.db')
-            cursor_master = conn_master.cursor()
-            cursor_master.execute("SELECT base_datos FROM tenants WHERE id = ?", (panaderia_id,))
-            tenant = cursor_master.fetchone()
-            conn_master.close()
-            
-            if tenant:
-                bd_tenant_path = os.path.join('databases_tenants', tenant[0])
-                print(f"🔍 Conectando a BD tenant: {bd_tenant_path}")
-                
-                if os.path.exists(bd_tenant_path):
-                    conn_tenant = sqlite3.connect(bd_tenant_path)
-                    cursor_tenant = conn_tenant.cursor()
-                    
-                    cursor_tenant.execute("""
-                        SELECT nombre_panaderia, nit, direccion, telefono_contacto 
-                        FROM configuracion_panaderia 
-                        WHERE panaderia_id = ?
-                    """, (panaderia_id,))
-                    
-                    config_tenant = cursor_tenant.fetchone()
-                    conn_tenant.close()
-                    
-                    if config_tenant:
-                        nombre_panaderia = config_tenant[0] or f"Panadería {panaderia_id}"
-                        nit_panaderia = config_tenant[1] or "NIT_NO_REGISTRADO"
-                        direccion_panaderia = config_tenant[2] or "Dirección no registrada"
-                        telefono_panaderia = config_tenant[3] or "Teléfono no registrado"
-                        print(f"🏪 Datos obtenidos desde BD tenant: {nombre_panaderia}")
-                    else:
-                        print(f"⚠️ No hay configuración para panadería_id {panaderia_id}")
-                else:
-                    print(f"⚠️ BD del tenant no existe: {bd_tenant_path}")
-            else:
-                print(f"⚠️ No se encontró tenant con ID {panaderia_id}")
-                
-        except Exception as e:
-            print(f"⚠️ Error obteniendo datos del tenant: {e}")
+        # 🏪 DATOS DE LA PANADERÍA PARA LA FACTURA (desde el perfil en caché)
+        nombre_panaderia = config.nombre_factura
+        nit_panaderia = config.nit_factura
+        direccion_panaderia = config.direccion_factura
+        telefono_panaderia = config.telefono_factura
         
         detalles_venta = []
         
-        # 🎁 PROCESAR CADA PRODUCTO DEL CARRITO
-        for item in carrito:
-            producto_id = item['id']
-            cantidad = item['cantidad']
+        # 🎁 PROCESAR CADA PRODUCTO DEL CARRITO (productos ya cargados y validados)
+        for es_externo, producto, cantidad in lineas:
+            producto.stock_actual -= cantidad
+            precio_unitario = producto.precio_venta
             
-            if producto_id > 10000:
-                producto_externo_id = producto_id - 10000
-                producto = ProductoExterno.query.filter_by(id=producto_externo_id, panaderia_id=current_user.panaderia_id).first()
-                
-                if not producto or producto.stock_actual < cantidad:
-                    return jsonify({
-                        'success': False, 
-                        'error': f'Stock insuficiente: {producto.nombre if producto else "Producto"}'
-                    })
-                
-                producto.stock_actual -= cantidad
-                
+            if es_externo:
                 if not es_donacion:
                     producto.total_ventas += cantidad
                     producto.total_ingresos += cantidad * producto.precio_venta
                     producto.utilidad_total += cantidad * (producto.precio_venta - producto.precio_compra)
                     producto.fecha_ultima_venta = datetime.now()
                 
-                precio_unitario = producto.precio_venta
-                
-                detalle = DetalleVenta(
-                    venta_id=nueva_venta.id,
-                    producto_id=None,
-                    producto_externo_id=producto_externo_id,
-                    cantidad=cantidad,
-                    precio_unitario=precio_unitario
-                )
-                detalles_venta.append(detalle)
-                
+                detalles_venta.append({
+                    'venta_id': nueva_venta.id,
+                    'panaderia_id': panaderia_id,
+                    'producto_id': None,
+                    'producto_externo_id': producto.id,
+                    'cantidad': cantidad,
+                    'precio_unitario': precio_unitario
+                })
             else:
-                producto = Producto.query.filter_by(id=producto_id, panaderia_id=current_user.panaderia_id).first()
-                
-                if not producto or producto.stock_actual < cantidad:
-                    return jsonify({
-                        'success': False, 
-                        'error': f'Stock insuficiente: {producto.nombre if producto else "Producto"}'
-                    })
-                
-                producto.stock_actual -= cantidad
-                precio_unitario = producto.precio_venta
-                
-                detalle = DetalleVenta(
-                    venta_id=nueva_venta.id,
-                    producto_id=producto_id,
-                    producto_externo_id=None,
-                    cantidad=cantidad,
-                    precio_unitario=precio_unitario
-                )
-                detalles_venta.append(detalle)
+                detalles_venta.append({
+                    'venta_id': nueva_venta.id,
+                    'panaderia_id': panaderia_id,
+                    'producto_id': producto.id,
+                    'producto_externo_id': None,
+                    'cantidad': cantidad,
+                    'precio_unitario': precio_unitario
+                })
+        
+        # Insertar todos los detalles en un solo executemany
+        if detalles_venta:
+            db.session.execute(db.insert(DetalleVenta), detalles_venta)
         
-        for detalle in detalles_venta:
-            db.session.add(detalle)
+        # 📊 RESUMEN POR PRODUCTO EN LA MISMA TRANSACCIÓN
+        acumular_productos_venta(nueva_venta, lineas)
         
         
         # 🆕 CREAR FACTURA O RECIBO SEGÚN CONFIGURACIÓN
@@ -1441,67 +1462,26 @@ def registrar_venta():
         if es_donacion:
             mensaje_exito = f'Donación registrada - {mensaje_exito}'
         
-        # CREAR FACTURA CON SQLITE DIRECTO (EVITA BD PRINCIPAL)
-        import sqlite3
-        from flask import g
+        # 🧾 CREAR FACTURA EN LA MISMA TRANSACCIÓN (engine del tenant)
+        factura = Factura(
+            panaderia_id=panaderia_id,
+            venta_id=nueva_venta.id,
+            numero_factura=numero_factura,
+            fecha_emision=datetime.now(),
+            subtotal=total_venta,
+            iva=0,
+            total=total_venta,
+            nombre_panaderia=nombre_panaderia,
+            nit_panaderia=nit_panaderia,
+            direccion_panaderia=direccion_panaderia,
+            telefono_panaderia=telefono_panaderia
+        )
+        db.session.add(factura)
         
-        # ✅ PRIMERO: Guardar la venta en la BD
+        # ✅ UN SOLO COMMIT: consecutivo, venta, detalles, stock y factura
         db.session.commit()
-        print(f"✅ Venta guardada en BD - ID: {nueva_venta.id}")
-        
-        # Obtener la ruta de la BD del tenant
-        if hasattr(g, 'db_path') and g.db_path:
-            bd_tenant = g.db_path
-        else:
-            # Buscar en tenant_master.db
-            conn_master = sqlite3.connect('tenant_master.db')
-            cursor_master = conn_master.cursor()
-            cursor_master.execute("SELECT base_datos FROM tenants WHERE id = ?", (panaderia_id,))
-            tenant = cursor_master.fetchone()
-            conn_master.close()
-            if tenant:
-                bd_tenant = f"databases_tenants/{tenant[0]}"
-            else:
-                bd_tenant = f"databases_tenants/panaderia_sqlalchemy.db"
-        
-        print(f"📁 [FACTURA] BD: {bd_tenant}")
-        
-        # Conectar DIRECTAMENTE a la BD del tenant
-        conn_tenant = sqlite3.connect(bd_tenant)
-        cursor_tenant = conn_tenant.cursor()
-        
-        # Insertar factura DIRECTAMENTE en la BD del tenant
-        cursor_tenant.execute("""
-            INSERT INTO facturas (
-                panaderia_id, venta_id, numero_factura, fecha_emision,
-                subtotal, iva, total, nombre_panaderia,
-                nit_panaderia, direccion_panaderia, telefono_panaderia
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            panaderia_id,
-            nueva_venta.id,
-            numero_factura,
-            datetime.now(),
-            total_venta,
-            0,
-            total_venta,
-            nombre_panaderia,
-            nit_panaderia,
-            direccion_panaderia,
-            telefono_panaderia
-        ))
-        
-        # Obtener el ID de la factura insertada
-        factura_id = cursor_tenant.lastrowid
-        conn_tenant.commit()
-        conn_tenant.close()
-        
-        print(f"✅ Factura creada: {numero_factura} (Panadería: {panaderia_id} - {nombre_panaderia})")
-        
-        # Crear objeto factura para la respuesta
-        factura = Factura()
-        factura.id = factura_id
-        factura.numero_factura = numero_factura
+        logger_pos.debug("✅ Venta guardada en BD - ID: %s", nueva_venta.id)
+        logger_pos.debug("✅ Factura creada: %s (Panadería: %s - %s)", numero_factura, panaderia_id, nombre_panaderia)
         
         respuesta = {
             'success': True,
@@ -1522,24 +1502,24 @@ def registrar_venta():
             cliente = Cliente.query.filter_by(id=cliente_id, panaderia_id=current_user.panaderia_id).first()
             if cliente:
                 respuesta['cliente'] = cliente.to_dict()
-                print(f'✅ Cliente incluido: {cliente.nombre}')
+                logger_pos.debug('✅ Cliente incluido: %s', cliente.nombre)
         
         if 'carrito' in session:
             session.pop('carrito')
             session.modified = True
         
         if es_donacion:
-            print(f'🎁 DONACIÓN REGISTRADA - ID: {nueva_venta.id}')
+            logger_pos.info('🎁 DONACIÓN REGISTRADA - ID: %s', nueva_venta.id)
         else:
-            print(f'✅ Venta registrada - ID: {nueva_venta.id}, Total: ${total_venta}')
+            logger_pos.info('✅ Venta registrada - ID: %s, Total: $%s', nueva_venta.id, total_venta)
         
         return jsonify(respuesta)
         
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Error al registrar venta: {e}")
-        import traceback
-        traceback.print_exc()
+        # Devolver el consecutivo al bloque en memoria para no dejar hueco
+        secuencia_pos.devolver(current_user.panaderia_id, consecutivo_pos)
+        logger_pos.exception("❌ Error al registrar venta: %s", e)
         return jsonify({'success': False, 'error': str(e)})
 # =============================================
 # 🆕 RUTAS API PARA GESTIÓN DE CLIENTES
@@ -1731,6 +1711,7 @@ def configuracion_facturacion():
             config.regimen_empresa = request.form.get('regimen_empresa', 'Simplificado')
             
             db.session.commit()
+            cache_perfiles.invalidar(config.panaderia_id)
             flash('✅ Configuración actualizada correctamente', 'success')
             
         except Exception as e:
@@ -1747,7 +1728,7 @@ def exportar_xml_venta(venta_id):
     """
     try:
         venta = Venta.query.filter_by(id=venta_id, panaderia_id=current_user.panaderia_id).first_or_404()
-        detalles = DetalleVenta.query.filter_by(venta_id=venta_id, panaderia_id=current_user.panaderia_id).all()
+        detalles = detalles_de_venta(venta_id, current_user.panaderia_id).all()
         
         # Verificar que existan detalles
         if not detalles:
@@ -1786,7 +1767,7 @@ def debug_xml(venta_id):
     """Debug del XML generado"""
     try:
         venta = Venta.query.filter_by(id=venta_id, panaderia_id=current_user.panaderia_id).first_or_404()
-        detalles = DetalleVenta.query.filter_by(venta_id=venta_id, panaderia_id=current_user.panaderia_id).all()
+        detalles = detalles_de_venta(venta_id, current_user.panaderia_id).all()
         config = obtener_configuracion_sistema()
         
         xml_content = generar_xml_ubl_21(venta, config, detalles)
@@ -1820,8 +1801,8 @@ def imprimir_factura_electronica(venta_id):
     """Genera la representación impresa de la factura electrónica"""
     try:
         venta = Venta.query.filter_by(id=venta_id, panaderia_id=current_user.panaderia_id).first_or_404()
-        detalles = DetalleVenta.query.filter_by(venta_id=venta_id, panaderia_id=current_user.panaderia_id).all()
-        config = obtener_configuracion_sistema()
+        detalles = detalles_de_venta(venta_id, current_user.panaderia_id).all()
+        config = obtener_perfil_tenant(current_user.panaderia_id)
         
         # 🆕 DEBUG: Verificar datos del cliente
         print(f"🔍 DEBUG Factura Electrónica - Venta ID: {venta_id}")
@@ -1868,13 +1849,9 @@ def recibo_pos(venta_id):
         if hasattr(g, 'db_path') and g.db_path:
             bd_tenant = g.db_path
         else:
-            conn_master = sqlite3.connect('tenant_master.db')
-            cursor_master = conn_master.cursor()
-            cursor_master.execute("SELECT base_datos FROM tenants WHERE id = ?", (panaderia_id,))
-            tenant = cursor_master.fetchone()
-            conn_master.close()
+            tenant = directorio_tenants.buscar_por_id(panaderia_id)
             if tenant:
-                bd_tenant = f"databases_tenants/{tenant[0]}"
+                bd_tenant = f"databases_tenants/{tenant['base_datos']}"
             else:
                 bd_tenant = f"databases_tenants/panaderia_sqlalchemy.db"
         
@@ -1885,7 +1862,7 @@ def recibo_pos(venta_id):
         
         # PRIMERO: Buscar en la BD del tenant
         print(f"📁 [RECIBO] Buscando en BD tenant: {bd_tenant}")
-        conn = sqlite3.connect(bd_tenant)
+        conn = conectar_sqlite(bd_tenant)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute("""
@@ -1904,7 +1881,7 @@ def recibo_pos(venta_id):
         else:
             # SEGUNDO: Buscar en la BD principal
             print(f"📁 [RECIBO] Buscando en BD principal: {bd_principal}")
-            conn = sqlite3.connect(bd_principal)
+            conn = conectar_sqlite(bd_principal)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("""
@@ -1955,7 +1932,7 @@ def recibo_pos(venta_id):
             print(f"📅 [RECIBO] Fecha original: {venta.fecha_hora}")
         
         # Obtener detalles de la venta (usando la BD donde se encontró)
-        conn = sqlite3.connect(bd_usada)
+        conn = conectar_sqlite(bd_usada)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute("""
@@ -2007,7 +1984,7 @@ def recibo_pos(venta_id):
         
         conn.close()
         
-        config = obtener_configuracion_sistema()
+        config = obtener_perfil_tenant(panaderia_id)
         
         return render_template('recibo_pos.html', 
                              venta=venta, 
@@ -3474,6 +3451,14 @@ def produccion_diaria():
     recetas_con_stock = []
     alertas = []
     
+    # Ventas del día de todas las recetas en una sola lectura del resumen por producto
+    hoy = hoy_tenant()
+    try:
+        ventas_dia = unidades_por_nombre(panaderia_actual, hoy)
+    except Exception as e:
+        print(f"Error calculando ventas hoy: {e}")
+        ventas_dia = {}
+    
     for receta in recetas_activas:
         # Calcular stock actual (usar función real o 0 si no existe)
         try:
@@ -3498,11 +3483,7 @@ def produccion_diaria():
         stock_minimo_personalizado = config.stock_minimo
         
         # Calcular ventas del día actual
-        try:
-            hoy = datetime.now().date()
-            ventas_hoy = calcular_ventas_hoy(receta.nombre, hoy)
-        except:
-            ventas_hoy = 0
+        ventas_hoy = ventas_dia.get(receta.nombre, 0)
         
         # Proyección de agotamiento
         proyeccion_horas = None
@@ -3549,10 +3530,10 @@ def produccion_diaria():
     ).order_by(OrdenProduccion.fecha_produccion.desc()).limit(10).all()
     
     # ✅ Obtener órdenes completadas del día SOLO de esta panadería
-    hoy = datetime.now().date()
+    hoy = hoy_tenant()
     ordenes_completadas_hoy_db = OrdenProduccion.query.filter(
         OrdenProduccion.estado == 'COMPLETADA',
-        db.func.date(OrdenProduccion.fecha_fin) == hoy,
+        filtro_fechas(OrdenProduccion.fecha_negocio, hoy),
         OrdenProduccion.panaderia_id == panaderia_actual  # ← FILTRO MULTICLIENTE
     ).all()
     
@@ -3622,16 +3603,12 @@ def configurar_stock_producto(receta_id):
 def calcular_ventas_ultima_semana(nombre_receta):
     """Calcular ventas de los últimos 7 días para una receta"""
     try:
-        fecha_inicio = datetime.now().date() - timedelta(days=7)
-        
-        ventas_semana = db.session.query(
-            db.func.sum(DetalleVenta.cantidad)
-        ).join(Producto).join(Venta).filter(
-            Producto.nombre == nombre_receta,
-            Venta.fecha_hora >= fecha_inicio
-        ).scalar() or 0
+        hoy = hoy_tenant()
+        ventas_semana = unidades_por_nombre(
+            obtener_panaderia_actual(), hoy - timedelta(days=7), hoy, nombres=[nombre_receta]
+        )
         
-        return ventas_semana
+        return ventas_semana.get(nombre_receta, 0)
     except Exception as e:
         print(f"Error calculando ventas semana: {e}")
         return 0
@@ -3840,65 +3817,20 @@ def debug_produccion():
 def calcular_rotacion_automatica(producto_id, dias_historial=30):
     """Calcula la rotación diaria automática basada en historial real"""
     try:
-        fecha_inicio = datetime.now().date() - timedelta(days=dias_historial)
+        hoy = hoy_tenant()
+        clave = clave_producto(producto_id)
         
-        # Obtener ventas de los últimos 'dias_historial' días
-        ventas_totales = db.session.query(
-            db.func.sum(DetalleVenta.cantidad)
-        ).join(Venta).filter(
-            DetalleVenta.producto_id == producto_id,
-            Venta.fecha_hora >= fecha_inicio
-        ).scalar() or 0
+        # Ventas de los últimos 'dias_historial' días (una lectura de ventas_producto_diarias)
+        resumen = resumen_productos(None, hoy - timedelta(days=dias_historial), hoy, claves=[clave]).get(clave)
         
         # Calcular promedio diario (excluyendo días sin ventas)
-        dias_con_ventas = db.session.query(
-            db.func.count(db.distinct(db.func.date(Venta.fecha_hora)))
-        ).join(DetalleVenta).filter(
-            DetalleVenta.producto_id == producto_id,
-            Venta.fecha_hora >= fecha_inicio
-        ).scalar() or 1  # Evitar división por cero
-        
-        rotacion_promedio = ventas_totales / dias_con_ventas
+        rotacion_promedio = resumen.promedio_dia_con_ventas if resumen else 0
         
         return round(rotacion_promedio, 2)
     except Exception as e:
         print(f"❌ Error calculando rotación automática: {e}")
         return 10.0  # Valor por defecto
 
-def actualizar_rotaciones_automaticas():
-    """Actualiza automáticamente todas las rotaciones basado en datos históricos"""
-    try:
-        productos_activos = Producto.query.filter_by(activo=True, panaderia_id=current_user.panaderia_id).all()
-        actualizaciones = 0
-        
-        for producto in productos_activos:
-            if producto.receta:  # Solo productos con receta
-                config = ConfiguracionProduccion.query.filter_by(receta_id=producto.receta.id, panaderia_id=current_user.panaderia_id).first()
-                if config:
-                    nueva_rotacion = calcular_rotacion_automatica(producto.id)
-                    
-                    # Solo actualizar si hay cambio significativo (> 10%)
-                    cambio_significativo = abs(config.rotacion_diaria_esperada - nueva_rotacion) > (config.rotacion_diaria_esperada * 0.1)
-                    
-                    if cambio_significativo:
-                        config.rotacion_diaria_esperada = nueva_rotacion
-                        actualizaciones += 1
-                        
-                        # ✅ CORREGIDO: HistorialRotacionProducto (no historicalRotacionProducto)
-                        historial = HistorialRotacionProducto(
-                            producto_id=producto.id,
-                            rotacion_real=nueva_rotacion
-                        )
-                        db.session.add(historial)
-        
-        db.session.commit()
-        print(f"✅ Rotaciones automáticas actualizadas: {actualizaciones} productos")
-        return actualizaciones
-    except Exception as e:
-        db.session.rollback()
-        print(f"❌ Error actualizando rotaciones automáticas: {e}")
-        return 0
-
 def actualizar_control_vida_util():
     """Actualiza el control de vida útil de todos los productos"""
     try:
@@ -3992,18 +3924,9 @@ def calcular_stock_vitrina(receta_id):
 def calcular_ventas_hoy(nombre_receta, fecha):
     """Calcular ventas del día actual para una receta"""
     try:
-        inicio_dia = datetime.combine(fecha, datetime.min.time())
-        fin_dia = datetime.combine(fecha, datetime.max.time())
-        
-        ventas_hoy = db.session.query(
-            db.func.sum(DetalleVenta.cantidad)
-        ).join(Producto).join(Venta).filter(
-            Producto.nombre == nombre_receta,
-            Venta.fecha_hora >= inicio_dia,
-            Venta.fecha_hora <= fin_dia
-        ).scalar() or 0
+        ventas_hoy = unidades_por_nombre(obtener_panaderia_actual(), fecha, nombres=[nombre_receta])
         
-        return ventas_hoy
+        return ventas_hoy.get(nombre_receta, 0)
         
     except Exception as e:
         print(f"Error calculando ventas hoy: {e}")
@@ -4180,12 +4103,12 @@ def reporte_produccion_diaria():
         flash('No se pudo determinar la panadería', 'error')
         return redirect(url_for('dashboard'))
     
-    hoy = datetime.now().date()
+    hoy = hoy_tenant()
     
     # ✅ Órdenes completadas hoy (CON FILTRO POR TENANT)
     ordenes_hoy = OrdenProduccion.query.filter(
         OrdenProduccion.estado == 'COMPLETADA',
-        db.func.date(OrdenProduccion.fecha_fin) == hoy,
+        filtro_fechas(OrdenProduccion.fecha_negocio, hoy),
         OrdenProduccion.panaderia_id == panaderia_id  # ✅ FILTRO MULTI-TENANT
     ).all()
     
@@ -4330,7 +4253,7 @@ def imprimir_factura(factura_id):
     """Generar vista imprimible - Versión mejorada que detecta tipo de documento"""
     try:
         venta = Venta.query.filter_by(id=factura_id, panaderia_id=current_user.panaderia_id).first_or_404()
-        detalles = DetalleVenta.query.filter_by(venta_id=factura_id, panaderia_id=current_user.panaderia_id).all()
+        detalles = detalles_de_venta(factura_id, current_user.panaderia_id).all()
         config = obtener_configuracion_sistema()
         
         # 🆕 DETECTAR TIPO DE DOCUMENTO Y USAR TEMPLATE APROPIADO
@@ -4616,11 +4539,8 @@ def reporte_ventas_externas():
     fecha_inicio = request.args.get('fecha_inicio')
     fecha_fin = request.args.get('fecha_fin')
     
-    # 👇 CONSULTA BASE CON FILTRO POR TENANT
-    query = DetalleVenta.query.join(ProductoExterno).join(Venta).filter(
-        DetalleVenta.producto_externo_id.isnot(None),
-        Venta.panaderia_id == panaderia_id  # ✅ FILTRO POR TENANT
-    )
+    # 👇 CONSULTA BASE CON FILTRO POR TENANT (producto_externo cargado en el mismo JOIN)
+    query = detalles_productos_externos(panaderia_id)
     
     # Filtrar por fechas si se proporcionan
     if fecha_inicio and fecha_fin:
@@ -4687,11 +4607,8 @@ def exportar_ventas_externas():
         flash('No se pudo determinar la panadería', 'error')
         return redirect(url_for('dashboard'))
     
-    # 👇 CONSULTA CON FILTRO POR TENANT
-    detalles_venta = DetalleVenta.query.join(ProductoExterno).join(Venta).filter(
-        DetalleVenta.producto_externo_id.isnot(None),
-        Venta.panaderia_id == panaderia_id  # ✅ FILTRO POR TENANT
-    ).all()
+    # 👇 CONSULTA CON FILTRO POR TENANT (producto_externo cargado en el mismo JOIN)
+    detalles_venta = detalles_productos_externos(panaderia_id).all()
     
     from reportlab.lib.pagesizes import letter
     from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
@@ -4811,9 +4728,7 @@ def dashboard_externos():
     # Ventas del último mes
     un_mes_atras = datetime.now() - timedelta(days=30)
 
-    ventas_recientes = DetalleVenta.query.join(ProductoExterno).join(Venta).filter(
-        DetalleVenta.producto_externo_id.isnot(None),
-        Venta.panaderia_id == panaderia_id,  # ✅ FILTRO POR TENANT
+    ventas_recientes = detalles_productos_externos(panaderia_id).filter(
         Venta.fecha_hora >= un_mes_atras
     ).all()
 
@@ -5019,12 +4934,12 @@ def estado_cierre_diario():
     if 'user_id' not in session:
         return jsonify({'error': 'No autorizado'}), 401
     
-    hoy = datetime.now().date()
+    hoy = hoy_tenant()
     jornada = obtener_jornada_activa()
     
-    # Obtener ventas del día actual
-    ventas_hoy = obtener_ventas_dia(hoy)
-    total_hoy = sum(venta.total for venta in ventas_hoy)
+    # Totales del día actual desde el resumen diario
+    totales_hoy = totales_periodo(current_user.panaderia_id, hoy)
+    total_hoy = totales_hoy.total_ventas
     
     # Verificar si ya se hizo cierre hoy
     cierre_hoy = CierreDiario.query.filter_by(panaderia_id=current_user.panaderia_id, fecha=hoy).first()
@@ -5033,7 +4948,7 @@ def estado_cierre_diario():
         'fecha': hoy.isoformat(),
         'jornada_activa': jornada.estado == 'ACTIVA',
         'total_ventas_hoy': total_hoy,
-        'total_transacciones': len(ventas_hoy),
+        'total_transacciones': totales_hoy.cantidad_transacciones,
         'cierre_realizado': cierre_hoy is not None,
         'hora_actual': datetime.now().strftime('%H:%M')
     })
@@ -5133,8 +5048,8 @@ def pagina_cierre_diario():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    hoy = datetime.now().date()
     panaderia_id = current_user.panaderia_id  # ✅ OBTENER ID DE PANADERÍA ACTUAL
+    hoy = hoy_tenant(panaderia_id)  # Mismo día de negocio que registra realizar_cierre
     
     # ✅ FILTRAR SOLO POR PANADERÍA DEL USUARIO ACTUAL
     cierre_hoy = CierreDiario.query.filter_by(
@@ -5164,7 +5079,7 @@ def realizar_cierre():
         
         # ✅ OBTENER PANADERÍA ACTUAL DEL USUARIO
         panaderia_id = current_user.panaderia_id
-        fecha_actual = datetime.now().date()
+        fecha_actual = hoy_tenant()
         
         # ✅ VERIFICAR SI YA EXISTE CIERRE PARA HOY
         cierre_existente = CierreDiario.query.filter_by(
@@ -5178,21 +5093,12 @@ def realizar_cierre():
                 'error': 'Ya se realizó el cierre diario para hoy en esta panadería'
             }), 400
         
-        # ✅ OBTENER VENTAS DEL DÍA
-        ventas_hoy = Venta.query.filter(
-            Venta.panaderia_id == panaderia_id,
-            func.date(Venta.fecha_hora) == fecha_actual,
-            
-        ).all()
-        
-        # ✅ CALCULAR TOTALES
-        total_ventas = sum(venta.total for venta in ventas_hoy)
-        total_efectivo = sum(venta.total for venta in ventas_hoy 
-                           if venta.metodo_pago == 'efectivo')
-        total_transferencias = sum(venta.total for venta in ventas_hoy 
-                                 if venta.metodo_pago == 'transferencia')
-        total_tarjetas = sum(venta.total for venta in ventas_hoy 
-                           if venta.metodo_pago == 'tarjeta')
+        # ✅ TOTALES DEL DÍA DESDE EL RESUMEN DIARIO
+        totales_hoy = totales_periodo(panaderia_id, fecha_actual)
+        total_ventas = totales_hoy.total_ventas
+        total_efectivo = totales_hoy.total_metodo('efectivo')
+        total_transferencias = totales_hoy.total_metodo('transferencia')
+        total_tarjetas = totales_hoy.total_metodo('tarjeta')
         
         # ✅ CREAR REGISTRO DE CIERRE DIARIO
         nuevo_cierre = CierreDiario(
@@ -5201,7 +5107,7 @@ def realizar_cierre():
             total_ventas=total_ventas,
             total_efectivo=total_efectivo,
             total_transferencia=total_transferencias,
-            total_transacciones=len(ventas_hoy),
+            total_transacciones=totales_hoy.cantidad_transacciones,
             
         )
         
@@ -5317,9 +5223,7 @@ def realizar_cierre():
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error en realizar_cierre: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger_pos.exception("❌ Error en realizar_cierre")
         return jsonify({
             'success': False,
             'error': f'Error al realizar cierre: {str(e)}'
@@ -5347,14 +5251,14 @@ def obtener_ventas_dia(fecha, panaderia_id=None):
         # ✅ FILTRAR VENTAS SOLO DE ESTA PANADERÍA Y DÍA
         ventas = Venta.query.filter(
             Venta.panaderia_id == panaderia_id,
-            func.date(Venta.fecha_hora) == fecha,
+            filtro_fechas(Venta.fecha_negocio, fecha),
             1==1  # Filtro de estado eliminado porque el modelo no tiene este campo
         ).all()
         
         return ventas
         
     except Exception as e:
-        print(f"Error en obtener_ventas_dia: {str(e)}")
+        logger_pos.exception("❌ Error en obtener_ventas_dia")
         return []
 
 @app.route('/reporte/cierre_caja')
@@ -5367,81 +5271,53 @@ def reporte_cierre_caja():
         return redirect(url_for('login'))
     
     # 🆕 USAR 1 FECHA SOLAMENTE + FECHAS DE COMPARACIÓN
-    fecha_str = request.args.get('fecha', datetime.now().date().isoformat())
+    fecha_str = request.args.get('fecha', hoy_tenant().isoformat())
     
     try:
         # 🆕 CONVERTIR FECHA ÚNICA
         fecha_consultada = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-        hoy = datetime.now().date()
+        hoy = hoy_tenant()
         ayer = hoy - timedelta(days=1)
         
-        inicio_dia = datetime.combine(fecha_consultada, datetime.min.time())
-        fin_dia = datetime.combine(fecha_consultada, datetime.max.time())
+        inicio_dia, fin_dia = rango_dias(fecha_consultada)
         
         # 🆕 OBTENER panaderia_id DEL USUARIO ACTUAL
         usuario_actual = db.session.get(Usuario, session["user_id"])
         panaderia_id = usuario_actual.panaderia_id
         
-        print(f"🔍 DEBUG: Generando reporte para panaderia_id: {panaderia_id}")
-        print(f"📅 Fecha consultada: {fecha_consultada}")
-        print(f"📅 Rango: {inicio_dia} a {fin_dia}")
+        logger_reportes.debug("🔍 DEBUG: Generando reporte para panaderia_id: %s", panaderia_id)
+        logger_reportes.debug("📅 Fecha consultada: %s", fecha_consultada)
+        logger_reportes.debug("📅 Rango: %s a %s", inicio_dia, fin_dia)
         
-        # 🆕 DEBUG: VER TODAS LAS VENTAS EN LA BD (SIN FILTROS)
-        print("🔎 DEBUG - TODAS las ventas en la BD:")
         panaderia_id = obtener_panaderia_actual()
-        todas_ventas = Venta.query.filter_by(panaderia_id=panaderia_id).all()
-        for v in todas_ventas:
-            print(f"   Venta ID: {v.id}, Fecha: {v.fecha_hora}, Panadería: {v.panaderia_id}, Total: ${v.total}")
-        
-        # 🆕 CONSULTAS CON FILTRO MULTICLIENTE
-        ventas_dia = Venta.query.filter(
-            db.func.date(Venta.fecha_hora) == fecha_consultada,  # 🎯 SOLO POR FECHA
-            Venta.panaderia_id == panaderia_id
-        ).all()
-        
-        print(f"📊 Ventas encontradas con filtros: {len(ventas_dia)}")
-        for v in ventas_dia:
-            print(f"   ✅ Venta encontrada: ID {v.id}, Fecha: {v.fecha_hora}, Total: ${v.total}")
-        
-        # 🎁 SEPARAR VENTAS NORMALES VS DONACIONES
-        ventas_normales = [v for v in ventas_dia if not v.es_donacion]
-        donaciones = [v for v in ventas_dia if v.es_donacion]
         
-        print(f"💰 Ventas normales: {len(ventas_normales)}")
-        print(f"🎁 Donaciones: {len(donaciones)}")
+        # 🆕 TOTALES DEL DÍA DESDE EL RESUMEN DIARIO (CON FILTRO MULTICLIENTE)
+        totales = totales_periodo(panaderia_id, fecha_consultada)
         
-        # 🎁 CALCULAR MÉTRICAS SEPARADAS
-        total_ventas_normales = sum(venta.total for venta in ventas_normales)
-        total_transacciones = len(ventas_dia)
+        # 🎁 MÉTRICAS SEPARADAS: VENTAS NORMALES VS DONACIONES
+        total_ventas_normales = totales.total_ventas
+        total_transacciones = totales.cantidad_transacciones
+        transacciones_normales = totales.cantidad_ventas
         
-        print(f"💵 Total ventas normales: ${total_ventas_normales}")
-        print(f"🔢 Total transacciones: {total_transacciones}")
+        logger_reportes.debug("💰 Ventas normales: %s", transacciones_normales)
+        logger_reportes.debug("🎁 Donaciones: %s", totales.cantidad_donaciones)
+        logger_reportes.debug("💵 Total ventas normales: $%s", total_ventas_normales)
+        logger_reportes.debug("🔢 Total transacciones: %s", total_transacciones)
         
         # Calcular métricas por método de pago (SOLO VENTAS NORMALES)
-                # Calcular métricas por método de pago (SOLO VENTAS NORMALES)
-                # Calcular métricas por método de pago (SOLO VENTAS NORMALES)
         ventas_por_metodo = {}
-        for venta in ventas_normales:
-            metodo = venta.metodo_pago
+        for metodo, total in totales.por_metodo.items():
             # ✅ CONVERTIR 'tarjeta' a 'transferencia' (unificar métodos)
             if metodo == 'tarjeta':
                 metodo = 'transferencia'
-            
-            if metodo not in ventas_por_metodo:
-                ventas_por_metodo[metodo] = 0
-            ventas_por_metodo[metodo] += venta.total
+            if total:
+                ventas_por_metodo[metodo] = ventas_por_metodo.get(metodo, 0) + total
         
-        print(f"💳 Ventas por método: {ventas_por_metodo}")
+        logger_reportes.debug("💳 Ventas por método: %s", ventas_por_metodo)
         
         # 🆕 OBTENER COMPARATIVA CON DÍA ANTERIOR
         dia_anterior = fecha_consultada - timedelta(days=1)
-        ventas_dia_anterior = Venta.query.filter(
-            db.func.date(Venta.fecha_hora) == dia_anterior,
-            Venta.panaderia_id == panaderia_id  # 🎯 FILTRO MULTICLIENTE
-        ).all()
-        
-        ventas_dia_anterior_normales = [v for v in ventas_dia_anterior if not v.es_donacion]
-        total_dia_anterior = sum(venta.total for venta in ventas_dia_anterior_normales)
+        total_dia_anterior = totales_periodo(panaderia_id, dia_anterior).total_ventas
         
         # Calcular tendencia
         if total_dia_anterior > 0:
@@ -5449,138 +5325,67 @@ def reporte_cierre_caja():
         else:
             tendencia = 100 if total_ventas_normales > 0 else 0
         
-        print(f"📈 Tendencia: {tendencia}%")
+        logger_reportes.debug("📈 Tendencia: %s%%", tendencia)
         
-        # 🆕 PRODUCTOS MÁS VENDIDOS (INCLUYENDO DONACIONES)
-        detalles_dia = DetalleVenta.query.join(Venta).filter(
-            Venta.fecha_hora >= inicio_dia,
-            Venta.fecha_hora <= fin_dia,
-            Venta.panaderia_id == panaderia_id  # 🎯 FILTRO MULTICLIENTE
-        ).all()
+        # 🎯 --- MÉTRICAS FINANCIERAS CON COSTOS REALES (UN GROUP BY POR PRODUCTO) ---
+        # [(nombre, es_donacion, unidades, ingresos, costo)]
+        filas_productos = cierre_por_producto(panaderia_id, fecha_consultada)
         
-        print(f"📦 Detalles de venta encontrados: {len(detalles_dia)}")
+        logger_reportes.debug("📦 Productos del día (vendidos/donados): %s", len(filas_productos))
         
-        productos_vendidos = {}
-        for detalle in detalles_dia:
-            if detalle.producto:
-                nombre = detalle.producto.nombre
-            elif detalle.producto_externo:
-                nombre = detalle.producto_externo.nombre
-            else:
-                continue
-                
-            if nombre not in productos_vendidos:
-                productos_vendidos[nombre] = 0
-            productos_vendidos[nombre] += detalle.cantidad
-        
-        productos_top = sorted(productos_vendidos.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        # 🎯 --- INICIO: MÉTRICAS FINANCIERAS CON COSTOS REALES ---
-        print("💰 CALCULANDO MÉTRICAS FINANCIERAS CON COSTOS REALES...")
-        
-        # 🎯 1. CALCULAR COSTOS E INGRESOS CON FUENTES REALES
         costo_total_inventario = 0
         ingresos_totales = 0
         total_productos_vendidos = 0
-
-        # 🆕 VARIABLES PARA ANÁLISIS POR PRODUCTO
+        
+        # 🆕 ANÁLISIS POR PRODUCTO (VENTAS + DONACIONES)
+        productos_vendidos = {}
         ingresos_por_producto = {}
         costos_por_producto = {}
         utilidades_por_producto = {}
-
-        # 🆕 NUEVAS VARIABLES PARA PRODUCTOS SEPARADOS
-        productos_vendidos_lista = []
-        productos_donados_detalle = []
-
-        # 🆕 CONTADORES CORREGIDOS PARA DONACIONES
-        total_unidades_donadas = 0
-        total_productos_donados_unicos = 0
-
-        for detalle in detalles_dia:
-            # 🎯 OBTENER PRECIO DE COSTO CON FUENTES REALES
-            precio_costo = 0
-            fuente_costo = "No identificada"
-            
-            if detalle.producto:
-                # 📦 PRODUCTO DE PANADERÍA CON RECETA
-                producto = detalle.producto
-                if producto.receta and hasattr(producto.receta, 'costo_unitario') and producto.receta.costo_unitario:
-                    # 🎯 USAR COSTO UNITARIO REAL DE LA RECETA
-                    precio_costo = producto.receta.costo_unitario
-                    fuente_costo = "receta.costo_unitario (real)"
-                    print(f"✅ Producto {producto.nombre} - Costo real: ${precio_costo} desde receta")
-                    
-                elif hasattr(producto, 'costo_compra') and producto.costo_compra:
-                    precio_costo = producto.costo_compra
-                    fuente_costo = "producto.costo_compra"
-                else:
-                    # Estimación de reserva
-                    precio_costo = detalle.precio_unitario * 0.4
-                    fuente_costo = "estimación (40%)"
-                    
-            elif detalle.producto_externo:
-                # 🥤 PRODUCTO EXTERNO
-                producto = detalle.producto_externo
-                precio_costo = producto.precio_compra if hasattr(producto, 'precio_compra') else 0
-                fuente_costo = "producto_externo.precio_compra"
-            
-            # 🎯 CALCULAR COSTO TOTAL Y INGRESOS
-            costo_detalle = precio_costo * detalle.cantidad
-            ingreso_detalle = detalle.precio_unitario * detalle.cantidad
-            
-            costo_total_inventario += costo_detalle
-            ingresos_totales += ingreso_detalle
-            total_productos_vendidos += detalle.cantidad
-            
-            # 🆕 ACUMULAR POR PRODUCTO PARA ANÁLISIS DETALLADO
-            if detalle.producto:
-                nombre_producto = detalle.producto.nombre
-            else:
-                nombre_producto = detalle.producto_externo.nombre
-            
-            if nombre_producto not in ingresos_por_producto:
-                ingresos_por_producto[nombre_producto] = 0
-                costos_por_producto[nombre_producto] = 0
-                utilidades_por_producto[nombre_producto] = 0
-            
-            ingresos_por_producto[nombre_producto] += ingreso_detalle
-            costos_por_producto[nombre_producto] += costo_detalle
-            utilidades_por_producto[nombre_producto] += (ingreso_detalle - costo_detalle)
+        
+        # 🆕 PRODUCTOS SEPARADOS
+        productos_vendidos_final = []
+        productos_donados_final = []
+        
+        for nombre, es_donacion, cantidad, ingresos, costo in filas_productos:
+            costo_total_inventario += costo
+            ingresos_totales += ingresos
+            total_productos_vendidos += cantidad
             
-            # 🆕 SEPARAR PRODUCTOS VENDIDOS VS DONADOS
-            es_donacion = detalle.venta.es_donacion if detalle.venta else False
+            productos_vendidos[nombre] = productos_vendidos.get(nombre, 0) + cantidad
+            ingresos_por_producto[nombre] = ingresos_por_producto.get(nombre, 0) + ingresos
+            costos_por_producto[nombre] = costos_por_producto.get(nombre, 0) + costo
+            utilidades_por_producto[nombre] = utilidades_por_producto.get(nombre, 0) + (ingresos - costo)
             
             if not es_donacion:
                 # PRODUCTO VENDIDO (GENERA INGRESOS REALES)
-                productos_vendidos_lista.append({
-                    'nombre': nombre_producto,
-                    'cantidad': detalle.cantidad,
-                    'ingresos': ingreso_detalle,
-                    'costo': costo_detalle,
-                    'utilidad': ingreso_detalle - costo_detalle,
-                    'margen': ((ingreso_detalle - costo_detalle) / ingreso_detalle * 100) if ingreso_detalle > 0 else 0
+                productos_vendidos_final.append({
+                    'nombre': nombre,
+                    'cantidad': cantidad,
+                    'ingresos': ingresos,
+                    'costo': costo,
+                    'utilidad': ingresos - costo,
+                    'margen': ((ingresos - costo) / ingresos * 100) if ingresos > 0 else 0
                 })
             else:
                 # PRODUCTO DONADO (NO GENERA INGRESOS REALES)
-                productos_donados_detalle.append({
-                    'nombre': nombre_producto,
-                    'cantidad': detalle.cantidad,
-                    'valor_mercado': ingreso_detalle,  # Valor que habría generado
-                    'costo_real': costo_detalle  # Costo real de producción
+                productos_donados_final.append({
+                    'nombre': nombre,
+                    'cantidad': cantidad,
+                    'valor_mercado': ingresos,  # Valor que habría generado
+                    'costo_real': costo  # Costo real de producción
                 })
-                # 🆕 CONTAR UNIDADES DONADAS
-                total_unidades_donadas += detalle.cantidad
-            
-            # Debug detallado
-            print(f"   📊 {nombre_producto} - Cant: {detalle.cantidad} - Precio: ${detalle.precio_unitario} - Costo: ${precio_costo} - Fuente: {fuente_costo} - Donación: {es_donacion}")
-
-        print(f"📦 Costo total inventario: ${costo_total_inventario:.0f}")
-        print(f"💰 Ingresos totales: ${ingresos_totales:.0f}")
-        print(f"🎯 Total productos vendidos: {total_productos_vendidos}")
+        
+        # 🆕 PRODUCTOS MÁS VENDIDOS (INCLUYENDO DONACIONES)
+        productos_top = sorted(productos_vendidos.items(), key=lambda x: x[1], reverse=True)[:5]
+        
+        logger_reportes.debug("📦 Costo total inventario: $%.0f", costo_total_inventario)
+        logger_reportes.debug("💰 Ingresos totales: $%.0f", ingresos_totales)
+        logger_reportes.debug("🎯 Total productos vendidos: %s", total_productos_vendidos)
 
         # 🎯 2. CALCULAR MARGEN PROMEDIO CON COSTOS REALES (SOLO VENTAS NORMALES)
-        ingresos_ventas_normales = sum(item['ingresos'] for item in productos_vendidos_lista)
-        costos_ventas_normales = sum(item['costo'] for item in productos_vendidos_lista)
+        ingresos_ventas_normales = sum(item['ingresos'] for item in productos_vendidos_final)
+        costos_ventas_normales = sum(item['costo'] for item in productos_vendidos_final)
         
         if ingresos_ventas_normales > 0:
             margen_promedio = ((ingresos_ventas_normales - costos_ventas_normales) / ingresos_ventas_normales) * 100
@@ -5591,11 +5396,7 @@ def reporte_cierre_caja():
         utilidad_neta = ingresos_ventas_normales - costos_ventas_normales
 
         # 🎯 4. CALCULAR TICKET PROMEDIO
-        transacciones_normales = len(ventas_normales)
-        if transacciones_normales > 0:
-            ticket_promedio = total_ventas_normales / transacciones_normales
-        else:
-            ticket_promedio = 0
+        ticket_promedio = totales.ticket_promedio
 
         # 🎯 5. CALCULAR PRODUCTOS POR VENTA
         if transacciones_normales > 0:
@@ -5603,94 +5404,43 @@ def reporte_cierre_caja():
         else:
             productos_por_venta = 0
 
-        print(f"📈 Margen promedio REAL: {margen_promedio:.1f}%")
-        print(f"💵 Utilidad neta REAL: ${utilidad_neta:.0f}")
-        print(f"🎫 Ticket promedio: ${ticket_promedio:.0f}")
-        print(f"📦 Productos por venta: {productos_por_venta:.1f}")
-        
-        # 🆕 AGRUPAR PRODUCTOS VENDIDOS POR NOMBRE
-        productos_vendidos_agrupados = {}
-        for producto in productos_vendidos_lista:
-            nombre = producto['nombre']
-            if nombre not in productos_vendidos_agrupados:
-                productos_vendidos_agrupados[nombre] = {
-                    'nombre': nombre,
-                    'cantidad': 0,
-                    'ingresos': 0,
-                    'costo': 0,
-                    'utilidad': 0
-                }
-            
-            productos_vendidos_agrupados[nombre]['cantidad'] += producto['cantidad']
-            productos_vendidos_agrupados[nombre]['ingresos'] += producto['ingresos']
-            productos_vendidos_agrupados[nombre]['costo'] += producto['costo']
-            productos_vendidos_agrupados[nombre]['utilidad'] += producto['utilidad']
+        logger_reportes.debug("📈 Margen promedio REAL: %.1f%%", margen_promedio)
+        logger_reportes.debug("💵 Utilidad neta REAL: $%.0f", utilidad_neta)
+        logger_reportes.debug("🎫 Ticket promedio: $%.0f", ticket_promedio)
+        logger_reportes.debug("📦 Productos por venta: %.1f", productos_por_venta)
         
-        # CALCULAR MARGEN PARA CADA PRODUCTO AGRUPADO
-        for producto in productos_vendidos_agrupados.values():
-            if producto['ingresos'] > 0:
-                producto['margen'] = (producto['utilidad'] / producto['ingresos']) * 100
-            else:
-                producto['margen'] = 0
-        
-        productos_vendidos_final = list(productos_vendidos_agrupados.values())
-        
-        # 🆕 AGRUPAR PRODUCTOS DONADOS POR NOMBRE
-        productos_donados_agrupados = {}
-        for producto in productos_donados_detalle:
-            nombre = producto['nombre']
-            if nombre not in productos_donados_agrupados:
-                productos_donados_agrupados[nombre] = {
-                    'nombre': nombre,
-                    'cantidad': 0,
-                    'valor_mercado': 0,
-                    'costo_real': 0
-                }
-            
-            productos_donados_agrupados[nombre]['cantidad'] += producto['cantidad']
-            productos_donados_agrupados[nombre]['valor_mercado'] += producto['valor_mercado']
-            productos_donados_agrupados[nombre]['costo_real'] += producto['costo_real']
-        
-        productos_donados_final = list(productos_donados_agrupados.values())
-        
-        # 🆕 CALCULAR TOTALES CORREGIDOS PARA DONACIONES
+        # 🆕 CALCULAR TOTALES PARA DONACIONES
         total_productos_donados_unicos = len(productos_donados_final)
         total_unidades_donadas = sum(item['cantidad'] for item in productos_donados_final)
         valor_total_donaciones = sum(item['valor_mercado'] for item in productos_donados_final)
         
-        print(f"🆕 PRODUCTOS VENDIDOS: {len(productos_vendidos_final)} productos únicos")
-        for producto in productos_vendidos_final[:3]:
-            print(f"   💰 {producto['nombre']} - Cant: {producto['cantidad']} - Ingresos: ${producto['ingresos']:.0f} - Utilidad: ${producto['utilidad']:.0f}")
-        
-        print(f"🆕 PRODUCTOS DONADOS: {total_productos_donados_unicos} productos únicos, {total_unidades_donadas} unidades totales")
-        for producto in productos_donados_final[:3]:
-            print(f"   🎁 {producto['nombre']} - Cant: {producto['cantidad']} - Valor: ${producto['valor_mercado']:.0f} - Costo: ${producto['costo_real']:.0f}")
+        logger_reportes.debug("🆕 PRODUCTOS VENDIDOS: %s productos únicos", len(productos_vendidos_final))
+        logger_reportes.debug("🆕 PRODUCTOS DONADOS: %s productos únicos, %s unidades totales", total_productos_donados_unicos, total_unidades_donadas)
         
-        # 🎁 DATOS DE DONACIONES CORREGIDOS
-        total_donaciones = len(donaciones)  # Número de transacciones de donación
+        # 🎁 DATOS DE DONACIONES
+        total_donaciones = totales.cantidad_donaciones  # Número de transacciones de donación
         productos_donados = total_unidades_donadas  # Número total de unidades donadas
         
-        print(f"💰 Valor total donaciones: ${valor_total_donaciones}")
-        print(f"🎁 Transacciones de donación: {total_donaciones}")
-        print(f"📦 Unidades donadas totales: {productos_donados}")
-        
-        # 🆕 PREPARAR VENTAS DETALLADAS PARA TABLA
-        ventas_detalladas = []
-        for venta in ventas_dia:
-            cantidad_productos = sum(detalle.cantidad for detalle in venta.detalles)
-            ventas_detalladas.append({
-                'id': venta.id,
-                'fecha_hora': venta.fecha_hora,
-                'metodo_pago': venta.metodo_pago,
-                'total': venta.total,
-                'es_donacion': venta.es_donacion,
-                'cantidad_productos': cantidad_productos
-            })
+        logger_reportes.debug("💰 Valor total donaciones: $%s", valor_total_donaciones)
         
-        print(f"✅ Reporte generado exitosamente")
-        print(f"🎁 Total donaciones (transacciones): {total_donaciones}")
-        print(f"📦 Productos donados (unidades): {productos_donados}")
-        print(f"💰 Valor donaciones: ${valor_total_donaciones}")
+        # 🆕 VENTAS DETALLADAS PARA TABLA (UNA CONSULTA CON LAS UNIDADES DE CADA VENTA)
+        ventas_detalladas = [
+            {
+                'id': venta_id,
+                'fecha_hora': fecha_hora,
+                'metodo_pago': metodo_pago,
+                'total': total,
+                'es_donacion': es_donacion,
+                'cantidad_productos': unidades
+            }
+            for venta_id, fecha_hora, metodo_pago, total, es_donacion, unidades
+            in ventas_con_unidades(panaderia_id, fecha_consultada)
+        ]
+        
+        logger_reportes.debug("✅ Reporte generado exitosamente")
+        logger_reportes.debug("🎁 Total donaciones (transacciones): %s", total_donaciones)
+        logger_reportes.debug("📦 Productos donados (unidades): %s", productos_donados)
+        logger_reportes.debug("💰 Valor donaciones: $%s", valor_total_donaciones)
         
         # 🆕 ENVIAR DATOS COMPLETOS AL TEMPLATE
         return render_template('cierre_caja.html',
@@ -5725,7 +5475,7 @@ def reporte_cierre_caja():
                             
     
     except Exception as e:
-        print(f"❌ ERROR en reporte_cierre_caja: {str(e)}")
+        logger_reportes.exception("❌ ERROR en reporte_cierre_caja: %s", e)
         flash(f'Error generando reporte: {str(e)}', 'error')
         return redirect(url_for('dashboard'))
     
@@ -5748,7 +5498,7 @@ def reporte_ventas():
     fecha_fin_str = request.args.get('fecha_fin')
     periodo = request.args.get('periodo', 'semana')
     
-    hoy = datetime.now().date()
+    hoy = hoy_tenant()
     
     if fecha_inicio_str and fecha_fin_str:
         fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
@@ -5763,35 +5513,20 @@ def reporte_ventas():
         flash('La fecha de inicio no puede ser mayor que la fecha fin', 'error')
         fecha_inicio = fecha_fin - timedelta(days=7)
     
-    # ✅ Obtener ventas del período (CON FILTRO POR TENANT)
-    ventas_periodo = Venta.query.filter(
-        db.func.date(Venta.fecha_hora) >= fecha_inicio,
-        db.func.date(Venta.fecha_hora) <= fecha_fin,
-        Venta.panaderia_id == panaderia_id  # ✅ FILTRO MULTI-TENANT
-    ).all()
-    
-    ventas_normales = [v for v in ventas_periodo if not v.es_donacion]
-    donaciones = [v for v in ventas_periodo if v.es_donacion]
-    
-    total_ventas_normales = sum(venta.total for venta in ventas_normales)
-    total_transacciones = len(ventas_periodo)
+    # ✅ Totales del período desde el resumen diario (CON FILTRO POR TENANT)
+    totales = totales_periodo(panaderia_id, fecha_inicio, fecha_fin)
     
-    total_ventas = total_ventas_normales
-    promedio_venta = total_ventas_normales / len(ventas_normales) if ventas_normales else 0
+    total_ventas_normales = totales.total_ventas
+    total_transacciones = totales.cantidad_transacciones
+    promedio_venta = totales.ticket_promedio
     
-    tendencia = calcular_tendencia_ventas(fecha_inicio, fecha_fin)
+    tendencia = calcular_tendencia_ventas(fecha_inicio, fecha_fin, panaderia_id)
     
     # ✅ Productos más vendidos del período (CON FILTRO POR TENANT)
-    detalles_periodo = DetalleVenta.query.join(Venta).filter(
-        db.func.date(Venta.fecha_hora) >= fecha_inicio,
-        db.func.date(Venta.fecha_hora) <= fecha_fin,
-        Venta.panaderia_id == panaderia_id  # ✅ FILTRO MULTI-TENANT
-    ).all()
-    
-    productos_analisis = analizar_productos_periodo(detalles_periodo)
+    productos_analisis = analisis_productos(panaderia_id, fecha_inicio, fecha_fin)
     
-    total_donaciones = len(donaciones)
-    productos_donados = sum(len(v.detalles) for v in donaciones)
+    total_donaciones = totales.cantidad_donaciones
+    productos_donados = contar_productos_donados(panaderia_id, fecha_inicio, fecha_fin)
     
     return render_template('ventas_periodo.html',
                          periodo=periodo,
@@ -5820,6 +5555,8 @@ def reporte_productos_populares():
         flash('No se pudo determinar la panadería', 'error')
         return redirect(url_for('dashboard'))
     
+    hoy = hoy_tenant(panaderia_id)
+    
     # Obtener parámetros de fecha o usar valores por defecto
     fecha_inicio_str = request.args.get('fecha_inicio')
     fecha_fin_str = request.args.get('fecha_fin')
@@ -5828,69 +5565,29 @@ def reporte_productos_populares():
         fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
         fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d').date()
     else:
-        fecha_fin = datetime.now().date()
+        # Ventana por fecha de negocio: ventas_producto_diarias está indexado por ella
+        fecha_fin = hoy
         fecha_inicio = fecha_fin - timedelta(days=30)
     
-    # Actualizar rotaciones automáticas antes de generar reporte
-    actualizaciones = actualizar_rotaciones_automaticas()
+    # Rotaciones recalculadas hoy por la tarea programada (scripts/recalcular_rotaciones.py)
+    actualizaciones = rotaciones_actualizadas_hoy(panaderia_id)
     
-    # ✅ Obtener productos más vendidos del período (CON FILTRO POR TENANT)
-    detalles = DetalleVenta.query.join(Venta).filter(
-        Venta.fecha_hora >= fecha_inicio,
-        Venta.fecha_hora <= fecha_fin,
-        Venta.panaderia_id == panaderia_id  # ✅ FILTRO MULTI-TENANT
-    ).all()
+    # ✅ Top 20 del período desde el resumen por producto (CON FILTRO POR TENANT)
+    productos_ordenados = productos_mas_vendidos(panaderia_id, fecha_inicio, fecha_fin, limite=20)
     
-    # Analizar productos
-    analisis_productos = {}
-    
-    for detalle in detalles:
-        if detalle.producto:
-            producto_id = detalle.producto.id
-            nombre = detalle.producto.nombre
-            tipo = 'Producción'
-        elif detalle.producto_externo:
-            producto_id = detalle.producto_externo.id
-            nombre = detalle.producto_externo.nombre
-            tipo = 'Externo'
-        else:
-            continue
-        
-        if producto_id not in analisis_productos:
-            analisis_productos[producto_id] = {
-                'nombre': nombre,
-                'tipo': tipo,
-                'cantidad_vendida': 0,
-                'ingresos_totales': 0,
-                'rotacion_promedio': 0
-            }
-        
-        analisis_productos[producto_id]['cantidad_vendida'] += detalle.cantidad
-        analisis_productos[producto_id]['ingresos_totales'] += detalle.cantidad * detalle.precio_unitario
-    
-    # Ordenar por cantidad vendida
-    productos_ordenados = sorted(analisis_productos.values(), 
-                               key=lambda x: x['cantidad_vendida'], 
-                               reverse=True)
-    
-    # Agregar datos de rotación automática
-    for producto in productos_ordenados[:20]:
-        rotacion = calcular_rotacion_automatica_por_nombre(producto['nombre'])
-        producto['rotacion_promedio'] = rotacion
+    # Rotación automática (últimos 30 días) de esos productos en una sola lectura
+    rotaciones = resumen_productos(panaderia_id, hoy - timedelta(days=30), hoy,
+                                   claves=[producto['clave'] for producto in productos_ordenados])
+    for producto in productos_ordenados:
+        resumen = rotaciones.get(producto['clave'])
+        producto['rotacion_promedio'] = round(resumen.cantidad / 30.0, 2) if resumen else 0
     
     # ✅ OBTENER DATOS DE DONACIONES (CON FILTRO POR TENANT)
-    ventas_periodo = Venta.query.filter(
-        Venta.fecha_hora >= fecha_inicio,
-        Venta.fecha_hora <= fecha_fin,
-        Venta.panaderia_id == panaderia_id  # ✅ FILTRO MULTI-TENANT
-    ).all()
-    
-    donaciones = [v for v in ventas_periodo if v.es_donacion]
-    total_donaciones = len(donaciones)
-    productos_donados = sum(len(v.detalles) for v in donaciones)
+    total_donaciones = totales_periodo(panaderia_id, fecha_inicio, fecha_fin).cantidad_donaciones
+    productos_donados = contar_productos_donados(panaderia_id, fecha_inicio, fecha_fin)
     
     return render_template('productos_populares.html',
-                         productos=productos_ordenados[:20],
+                         productos=productos_ordenados,
                          fecha_inicio=fecha_inicio,
                          fecha_fin=fecha_fin,
                          actualizaciones_ml=actualizaciones,
@@ -5940,15 +5637,16 @@ def reporte_analisis_predictivo():
     alertas = generar_alertas_inteligentes(panaderia_id)
     
     # ✅ OBTENER DATOS DE DONACIONES RECIENTES (CON FILTRO POR TENANT)
-    fecha_inicio = datetime.now().date() - timedelta(days=30)
-    donaciones_recientes = Venta.query.filter(
-        Venta.fecha_hora >= fecha_inicio,
+    # Misma ventana (fecha de negocio del tenant) para donaciones y productos donados
+    hoy = hoy_tenant(panaderia_id)
+    fecha_inicio = hoy - timedelta(days=30)
+    total_donaciones_30dias = Venta.query.filter(
+        filtro_fechas(Venta.fecha_negocio, fecha_inicio, hoy),
         Venta.es_donacion == True,
         Venta.panaderia_id == panaderia_id  # ✅ FILTRO MULTI-TENANT
-    ).all()
-    
-    total_donaciones_30dias = len(donaciones_recientes)
-    productos_donados_30dias = sum(len(v.detalles) for v in donaciones_recientes)
+    ).count()
+    # Un COUNT de las líneas de detalle en lugar de cargar venta.detalles por cada donación
+    productos_donados_30dias = contar_productos_donados(panaderia_id, fecha_inicio, hoy)
     
     return render_template('analisis_predictivo.html',
                      productos_analisis=productos_analisis,
@@ -5982,7 +5680,7 @@ def reporte_ventas_avanzado():
     periodo = request.args.get('periodo', 'semana_actual')
     
     # 🎯 OBTENER FECHAS CON VALORES POR DEFECTO
-    hoy = datetime.now().date()
+    hoy = hoy_tenant()
     
     if fecha_inicio_str and fecha_fin_str:
         fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').date()
@@ -6010,74 +5708,42 @@ def reporte_ventas_avanzado():
     # 📊 SECCIÓN 1: DATOS DE VENTAS REALES
     # =====================================================================
     
-    # 🎯 OBTENER VENTAS DEL PERÍODO (INCLUYENDO DONACIONES)
-    ventas_periodo = Venta.query.filter(
-        db.func.date(Venta.fecha_hora) >= fecha_inicio,
-        db.func.date(Venta.fecha_hora) <= fecha_fin,
-        Venta.panaderia_id == panaderia_id  # 🎯 FILTRO MULTICLIENTE
-    ).all()
+    # 🎯 MÉTRICAS BÁSICAS DESDE EL RESUMEN DIARIO (INCLUYENDO DONACIONES)
+    totales = totales_periodo(panaderia_id, fecha_inicio, fecha_fin)
+    total_ventas_normales = totales.total_ventas
+    total_transacciones = totales.cantidad_transacciones
     
-    # 🎁 SEPARAR VENTAS NORMALES VS DONACIONES
-    ventas_normales = [v for v in ventas_periodo if not v.es_donacion]
-    donaciones = [v for v in ventas_periodo if v.es_donacion]
-    
-    # 🎯 CALCULAR MÉTRICAS BÁSICAS DE VENTAS
-    total_ventas_normales = sum(venta.total for venta in ventas_normales)
-    total_transacciones = len(ventas_periodo)
-    
-    # 🎯 CALCULAR PROMEDIO DE VENTA (SOLO VENTAS NORMALES)
-    promedio_venta = total_ventas_normales / len(ventas_normales) if ventas_normales else 0
+    # 🎯 PROMEDIO DE VENTA (SOLO VENTAS NORMALES)
+    promedio_venta = totales.ticket_promedio
     
     # 🎁 DATOS DE DONACIONES
-    total_donaciones = len(donaciones)
-    productos_donados = sum(len(v.detalles) for v in donaciones)
+    total_donaciones = totales.cantidad_donaciones
+    productos_donados = contar_productos_donados(panaderia_id, fecha_inicio, fecha_fin)
+    
+    # 💳 TOTALES POR MÉTODO DE PAGO
+    ventas_por_metodo = sorted(totales.por_metodo.items(), key=lambda item: item[1], reverse=True)
     
     print(f"💰 Ventas: ${total_ventas_normales:.2f}, Transacciones: {total_transacciones}")
     
     # =====================================================================
-    # 📈 NUEVOS CÁLCULOS PARA GRÁFICOS Y DATOS REALES
+    # 📈 NUEVOS CÁLCULOS PARA GRÁFICOS Y DATOS REALES (CONSULTAS AGRUPADAS)
     # =====================================================================
     
-    # 🎯 TOP 5 PRODUCTOS MÁS VENDIDOS (REALES - CON VALIDACIÓN)
-    from collections import Counter
-    productos_vendidos = []
-    
-    for venta in ventas_normales:
-        for item in venta.detalles:
-            # ✅ VALIDAR QUE EL PRODUCTO NO SEA None - ESTO EVITA EL ERROR
-            if item.producto is not None:
-                productos_vendidos.append({
-                    'nombre': item.producto.nombre,
-                    'cantidad': item.cantidad,
-                    'categoria': getattr(item.producto, 'categoria', 'Sin Categoría')
-                })
-            else:
-                print(f"⚠️  DetalleVenta {item.id} tiene producto None, omitiendo...")
-    
-    # Contar productos más vendidos
-    contador_productos = Counter()
-    for producto in productos_vendidos:
-        contador_productos[producto['nombre']] += producto['cantidad']
+    # 🎯 TOP 5 PRODUCTOS MÁS VENDIDOS: [(nombre, unidades)]
+    top_5_productos = top_productos(panaderia_id, fecha_inicio, fecha_fin, limite=5)
+    top_productos_labels = [nombre for nombre, _ in top_5_productos]
+    top_productos_data = [unidades for _, unidades in top_5_productos]
     
-    # Obtener top 5 productos (o menos si no hay suficientes)
-    top_5_productos = contador_productos.most_common(5)
-    top_productos_labels = [producto[0] for producto in top_5_productos]
-    top_productos_data = [producto[1] for producto in top_5_productos]
+    # 🎯 DISTRIBUCIÓN POR CATEGORÍA: [(categoría, unidades)]
+    categorias = unidades_por_categoria(panaderia_id, fecha_inicio, fecha_fin)
+    categorias_labels = [categoria for categoria, _ in categorias]
+    categorias_data = [unidades for _, unidades in categorias]
     
-    # 🎯 DISTRIBUCIÓN POR CATEGORÍA
-    categorias_counter = Counter()
-    for producto in productos_vendidos:
-        categoria = producto['categoria']
-        categorias_counter[categoria] += producto['cantidad']
+    # 🎯 DISTRIBUCIÓN POR HORA: [(hora, ventas, total)]
+    distribucion_horaria = ventas_por_hora(panaderia_id, fecha_inicio, fecha_fin)
     
-    categorias_labels = list(categorias_counter.keys())
-    categorias_data = list(categorias_counter.values())
-    
-    # 🎯 TENDENCIA DIARIA DE VENTAS
-    ventas_por_dia = {}
-    for venta in ventas_normales:
-        fecha = venta.fecha_hora.date()
-        ventas_por_dia[fecha] = ventas_por_dia.get(fecha, 0) + venta.total
+    # 🎯 TENDENCIA DIARIA DE VENTAS (RESUMEN DIARIO)
+    ventas_por_dia = {fila.fecha: fila.total for fila in totales_por_dia(panaderia_id, fecha_inicio, fecha_fin)}
     
     # Ordenar por fecha y llenar vacíos
     todas_fechas = []
@@ -6093,14 +5759,7 @@ def reporte_ventas_avanzado():
     periodo_anterior_inicio = fecha_inicio - (fecha_fin - fecha_inicio)
     periodo_anterior_fin = fecha_inicio - timedelta(days=1)
     
-    ventas_periodo_anterior = Venta.query.filter(
-        Venta.panaderia_id == panaderia_id,
-        db.func.date(Venta.fecha_hora) >= periodo_anterior_inicio,
-        db.func.date(Venta.fecha_hora) <= periodo_anterior_fin,
-        Venta.es_donacion == False
-    ).all()
-    
-    total_ventas_anterior = sum(v.total for v in ventas_periodo_anterior)
+    total_ventas_anterior = totales_periodo(panaderia_id, periodo_anterior_inicio, periodo_anterior_fin).total_ventas
     
     if total_ventas_anterior > 0:
         tendencia_porcentaje = ((total_ventas_normales - total_ventas_anterior) / total_ventas_anterior * 100)
@@ -6117,7 +5776,7 @@ def reporte_ventas_avanzado():
     
     # 🎯 TENDENCIA (usando tu función existente)
     try:
-        tendencia_ml = calcular_tendencia_ventas(fecha_inicio, fecha_fin)
+        tendencia_ml = calcular_tendencia_ventas(fecha_inicio, fecha_fin, panaderia_id)
         print(f"📈 Tendencia ML: {tendencia_ml:.1f}%")
     except Exception as e:
         print(f"⚠️  Error en tendencia ML: {e}")
@@ -6133,13 +5792,7 @@ def reporte_ventas_avanzado():
     
     # 🎯 ANÁLISIS DE PRODUCTOS
     try:
-        detalles_periodo = DetalleVenta.query.join(Venta).filter(
-            db.func.date(Venta.fecha_hora) >= fecha_inicio,
-            db.func.date(Venta.fecha_hora) <= fecha_fin,
-            Venta.panaderia_id == panaderia_id
-        ).all()
-        
-        productos_analisis = analizar_productos_periodo(detalles_periodo)
+        productos_analisis = analisis_productos(panaderia_id, fecha_inicio, fecha_fin)
         print(f"📦 Productos analizados: {len(productos_analisis)}")
     except Exception as e:
         print(f"⚠️  Error en análisis productos: {e}")
@@ -6157,16 +5810,10 @@ def reporte_ventas_avanzado():
     elif tendencia_porcentaje < 0:
         recomendaciones.append("Revisar estrategia comercial - tendencia negativa detectada")
     
-    if len(ventas_normales) > 0:
-        # Análisis de horarios pico
-        ventas_por_hora = Counter()
-        for venta in ventas_normales:
-            hora = venta.fecha_hora.hour
-            ventas_por_hora[hora] += 1
-        
-        if ventas_por_hora:
-            hora_pico = ventas_por_hora.most_common(1)[0][0]
-            recomendaciones.append(f"Optimizar personal para horario pico: {hora_pico}:00")
+    if distribucion_horaria:
+        # Análisis de horarios pico (la hora con más ventas)
+        hora_pico = max(distribucion_horaria, key=lambda fila: fila[1])[0]
+        recomendaciones.append(f"Optimizar personal para horario pico: {hora_pico}:00")
     
     print(f"✅ [VENTAS_AVANZADO] Reporte generado exitosamente")
     print(f"📊 Productos en top: {len(top_productos_labels)}, Categorías: {len(categorias_labels)}")
@@ -6243,8 +5890,9 @@ def reporte_ventas_avanzado():
                          porcentaje_donaciones=porcentaje_donaciones,
                          
                          # Datos para secciones
-                         ventas_detalle=ventas_periodo,
-                         productos_vendidos=productos_vendidos,
+                         ventas_por_metodo=ventas_por_metodo,
+                         distribucion_horaria=distribucion_horaria,
+                         productos_vendidos=top_5_productos,
                          recomendaciones=recomendaciones,
                          
                          # 🆕 DÍAS DE ACTIVIDAD PARA IA
@@ -6444,7 +6092,7 @@ def control_diario():
     proveedores = Proveedor.query.filter_by(panaderia_id=current_user.panaderia_id).all()
     
     # Obtener pagos de hoy CON FILTRO TENANT
-    hoy = date.today()
+    hoy = hoy_tenant()
     pagos_hoy = PagoIndividual.query.filter_by(panaderia_id=current_user.panaderia_id, fecha_pago=hoy).all()
     registro_hoy = RegistroDiario.query.filter_by(panaderia_id=current_user.panaderia_id, fecha=hoy).first()
     
@@ -6490,7 +6138,10 @@ def registrar_pago_individual():
                     proveedor_id = None
         
         # Crear nuevo pago CON FILTRO TENANT
+        fecha_registro, fecha_registro_utc, _ = marcas_tiempo(current_user.panaderia_id)
         nuevo_pago = PagoIndividual(panaderia_id=current_user.panaderia_id,  # ← CORREGIDO: current_user.panaderia_id
+            fecha_registro=fecha_registro,
+            fecha_registro_utc=fecha_registro_utc,
             categoria=categoria,
             proveedor_id=proveedor_id,
             monto=monto,
@@ -6607,6 +6258,75 @@ from reportes import GeneradorReportes
 from io import BytesIO
 
 
+def responder_reporte_pdf(tipo, panaderia_id, nombre_archivo, **parametros):
+    """
+    PDF de un reporte de GeneradorReportes. Con ?asincrono=1 lo encola en cola_reportes
+    y responde 202 con el id del trabajo; sin él lo genera en la misma petición
+    (enlaces directos y marcadores siguen funcionando).
+    """
+    if request.args.get('asincrono') == '1':
+        trabajo = cola_reportes.encolar(tipo, panaderia_id, nombre_archivo,
+                                        usuario_id=current_user.id, **parametros)
+        return jsonify(estado_trabajo_reporte_dict(trabajo)), 202
+
+    return Response(
+        generar_pdf(tipo, panaderia_id, **parametros),
+        mimetype='application/pdf',
+        headers={
+            'Content-Disposition': f'attachment; filename={nombre_archivo}'
+        }
+    )
+
+def estado_trabajo_reporte_dict(trabajo):
+    datos = {
+        'trabajo_id': trabajo.id,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'nombre_archivo': trabajo.nombre_archivo,
+        'url_estado': url_for('estado_trabajo_reporte', trabajo_id=trabajo.id),
+        'error': trabajo.error
+    }
+    if trabajo.estado == 'listo':
+        datos['url_descarga'] = url_for('descargar_trabajo_reporte', trabajo_id=trabajo.id)
+    return datos
+
+def trabajo_reporte_del_tenant(trabajo_id):
+    """El trabajo si pertenece a la BD y panadería de la petición actual, si no None"""
+    trabajo = cola_reportes.obtener(trabajo_id)
+    if trabajo is None:
+        return None
+    tenant = getattr(g, 'tenant', None) or {}
+    if trabajo.base_datos != tenant.get('base_datos') or trabajo.panaderia_id != obtener_panaderia_actual():
+        return None
+    return trabajo
+
+@app.route('/reportes/trabajos/<trabajo_id>')
+@login_required
+@modulo_requerido('reportes')
+@tenant_required
+def estado_trabajo_reporte(trabajo_id):
+    """Estado de un reporte encolado (para consultar cada pocos segundos)"""
+    trabajo = trabajo_reporte_del_tenant(trabajo_id)
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado o vencido'}), 404
+    return jsonify(estado_trabajo_reporte_dict(trabajo))
+
+@app.route('/reportes/trabajos/<trabajo_id>/pdf')
+@login_required
+@modulo_requerido('reportes')
+@tenant_required
+def descargar_trabajo_reporte(trabajo_id):
+    """Descarga del PDF de un reporte encolado que ya terminó"""
+    trabajo = trabajo_reporte_del_tenant(trabajo_id)
+    ruta = cola_reportes.ruta_pdf(trabajo_id)
+    if trabajo is None or trabajo.estado != 'listo' or not os.path.exists(ruta):
+        flash('❌ El reporte no existe o ya venció, vuelve a generarlo', 'error')
+        return redirect(url_for('reportes'))
+
+    return send_file(os.path.abspath(ruta), mimetype='application/pdf',
+                     as_attachment=True, download_name=trabajo.nombre_archivo)
+
+
 @app.route('/gestion_financiera')
 @login_required
 @permisos_requeridos('finanzas', 'ver')
@@ -6660,7 +6380,7 @@ def gestion_financiera():
     ).order_by(RegistroDiario.fecha.desc()).limit(7).all()
     
     # Obtener pagos de hoy
-    hoy = date.today()
+    hoy = hoy_tenant()
     pagos_hoy = PagoIndividual.query.filter_by(
         panaderia_id=current_user.panaderia_id,
         fecha_pago=hoy
@@ -6732,17 +6452,9 @@ def generar_reporte_estado_resultados():
             return redirect(url_for('reportes'))
         
         # ✅ PASAR panaderia_id a la función
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_estado_resultados(panaderia_id, fecha_inicio, fecha_fin)
-        
-        nombre_archivo = f"estado_resultados_{fecha_inicio}_{fecha_fin}.pdf"
-        
-        return Response(
-            pdf_buffer,
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        return responder_reporte_pdf(
+            'estado_resultados', panaderia_id, f"estado_resultados_{fecha_inicio}_{fecha_fin}.pdf",
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
         )
         
     except Exception as e:
@@ -6774,17 +6486,10 @@ def generar_reporte_flujo_caja():
             flash('❌ La fecha de inicio no puede ser mayor a la fecha fin', 'error')
             return redirect(url_for('reportes'))
         
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_flujo_caja(fecha_inicio, fecha_fin)
-        
-        nombre_archivo = f"flujo_caja_{fecha_inicio}_{fecha_fin}.pdf"
-        
-        return Response(
-            pdf_buffer,
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        panaderia_id = obtener_panaderia_actual()
+        return responder_reporte_pdf(
+            'flujo_caja', panaderia_id, f"flujo_caja_{fecha_inicio}_{fecha_fin}.pdf",
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
         )
         
     except Exception as e:
@@ -6818,17 +6523,10 @@ def generar_reporte_libro_diario():
             flash('❌ La fecha de inicio no puede ser mayor a la fecha fin', 'error')
             return redirect(url_for('reportes'))
         
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_libro_diario(fecha_inicio, fecha_fin)
-        
-        nombre_archivo = f"libro_diario_{fecha_inicio}_{fecha_fin}.pdf"
-        
-        return Response(
-            pdf_buffer,
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        panaderia_id = obtener_panaderia_actual()
+        return responder_reporte_pdf(
+            'libro_diario', panaderia_id, f"libro_diario_{fecha_inicio}_{fecha_fin}.pdf",
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
         )
         
     except Exception as e:
@@ -6856,27 +6554,10 @@ def generar_reporte_conciliacion():
         
         print(f"🔍 Generando conciliación para fecha: {fecha_corte}, saldo: {saldo_extracto}")
         
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_conciliacion_bancaria(fecha_corte, saldo_extracto)
-        
-        # Verificar que el buffer no esté vacío
-        buffer_size = pdf_buffer.getbuffer().nbytes
-        print(f"📊 Tamaño del buffer PDF: {buffer_size} bytes")
-        
-        if buffer_size == 0:
-            raise Exception("El PDF generado está vacío")
-        
-        nombre_archivo = f"conciliacion_bancaria_{fecha_corte}.pdf"
-        
-        # Obtener los datos del buffer
-        pdf_data = pdf_buffer.getvalue()
-        
-        return Response(
-            pdf_data,
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        # generar_pdf verifica que el PDF no esté vacío
+        return responder_reporte_pdf(
+            'conciliacion', obtener_panaderia_actual(), f"conciliacion_bancaria_{fecha_corte}.pdf",
+            fecha_corte=fecha_corte, saldo_extracto=saldo_extracto
         )
         
     except Exception as e:
@@ -6925,21 +6606,9 @@ def generar_reporte_analisis_gastos():
             return redirect(url_for('reportes'))
         
         # ✅ PASAR panaderia_id a la función
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_analisis_gastos(panaderia_id, fecha_inicio, fecha_fin)
-        
-        # Verificar que el buffer no esté vacío
-        if pdf_buffer.getbuffer().nbytes == 0:
-            raise Exception("El PDF generado está vacío")
-        
-        nombre_archivo = f"analisis_gastos_{fecha_inicio}_a_{fecha_fin}.pdf"
-        
-        return Response(
-            pdf_buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        return responder_reporte_pdf(
+            'analisis_gastos', panaderia_id, f"analisis_gastos_{fecha_inicio}_a_{fecha_fin}.pdf",
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
         )
         
     except Exception as e:
@@ -6983,17 +6652,9 @@ def generar_reporte_tendencia_ventas():
             return redirect(url_for('reportes'))
         
         # ✅ PASAR panaderia_id a la función
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_tendencia_ventas(panaderia_id, fecha_inicio, fecha_fin)
-        
-        nombre_archivo = f"tendencia_ventas_{fecha_inicio}_a_{fecha_fin}.pdf"
-        
-        return Response(
-            pdf_buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        return responder_reporte_pdf(
+            'tendencia_ventas', panaderia_id, f"tendencia_ventas_{fecha_inicio}_a_{fecha_fin}.pdf",
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
         )
         
     except Exception as e:
@@ -7037,17 +6698,9 @@ def generar_reporte_ia_predictivo():
             return redirect(url_for('reportes'))
         
         # ✅ PASAR panaderia_id a la función
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_ia_predictivo(panaderia_id, fecha_inicio, fecha_fin)
-        
-        nombre_archivo = f"analisis_ia_predictivo_{fecha_inicio}_a_{fecha_fin}.pdf"
-        
-        return Response(
-            pdf_buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        return responder_reporte_pdf(
+            'ia_predictivo', panaderia_id, f"analisis_ia_predictivo_{fecha_inicio}_a_{fecha_fin}.pdf",
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
         )
         
     except Exception as e:
@@ -7092,17 +6745,9 @@ def generar_reporte_analisis_inventarios():
             return redirect(url_for('reportes'))
         
         # ✅ PASAR panaderia_id a la función
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_analisis_inventarios(panaderia_id, fecha_inicio, fecha_fin)
-        
-        nombre_archivo = f"analisis_inventarios_{fecha_inicio}_a_{fecha_fin}.pdf"
-        
-        return Response(
-            pdf_buffer.getvalue(),
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        return responder_reporte_pdf(
+            'analisis_inventarios', panaderia_id, f"analisis_inventarios_{fecha_inicio}_a_{fecha_fin}.pdf",
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
         )
         
     except Exception as e:
@@ -7119,8 +6764,6 @@ def generar_reporte_tesoreria_unificado():
     """Genera el Reporte Unificado de Tesorería - PDF"""
     try:
         from datetime import datetime
-        from reportes import GeneradorReportes
-        from flask import Response
         
         fecha_inicio = request.args.get('fecha_inicio')
         fecha_fin = request.args.get('fecha_fin')
@@ -7142,23 +6785,9 @@ def generar_reporte_tesoreria_unificado():
             flash('No se pudo determinar la panadería', 'error')
             return redirect(url_for('reportes'))
         
-        generador = GeneradorReportes()
-        pdf_buffer = generador.generar_reporte_tesoreria_unificado(
-        
-            panaderia_id=panaderia_id,
-            fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin,
-            nivel_detalle=nivel_detalle
-        )
-        
-        nombre_archivo = f"tesoreria_unificado_{fecha_inicio}_{fecha_fin}.pdf"
-        
-        return Response(
-            pdf_buffer,
-            mimetype='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename={nombre_archivo}'
-            }
+        return responder_reporte_pdf(
+            'tesoreria_unificado', panaderia_id, f"tesoreria_unificado_{fecha_inicio}_{fecha_fin}.pdf",
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, nivel_detalle=nivel_detalle
         )
         
     except Exception as e:
@@ -8190,7 +7819,9 @@ def editar_usuario(usuario_id):
             usuario.nombre_completo = request.form['nombre_completo']
             usuario.email = request.form.get('email', '')
             usuario.telefono = request.form.get('telefono', '')
-            usuario.rol = request.form['rol']
+            if usuario.rol != request.form['rol']:
+                usuario.rol = request.form['rol']
+                usuario.incrementar_version_permisos()
             usuario.activo = 'activo' in request.form
             
             # Si se proporcionó nueva contraseña
@@ -8302,7 +7933,9 @@ def guardar_permisos(usuario_id):
                     )
                     db.session.add(permiso)
         
+        usuario.incrementar_version_permisos()
         db.session.commit()
+        cache_permisos.invalidar(usuario.id)
         flash(f'✅ Permisos de {usuario.username} actualizados correctamente', 'success')
         
     except Exception as e:
@@ -8355,7 +7988,6 @@ def crear_cliente():
     import string
     import sqlite3
     import os
-    import shutil
     
     try:
         # Obtener datos del formulario
@@ -8461,13 +8093,13 @@ def crear_cliente():
         if not os.path.exists(bd_tenant_path):
             plantilla_path = os.path.join('databases_tenants', 'tenant_plantilla.db')
             if os.path.exists(plantilla_path):
-                shutil.copy2(plantilla_path, bd_tenant_path)
+                copiar_bd(plantilla_path, bd_tenant_path)
                 print(f"📋 Plantilla copiada a: {bd_tenant_path}")
             else:
                 print(f"⚠️ No se encontró plantilla en: {plantilla_path}")
         
         # Conectar a la BD del tenant
-        conn_tenant = sqlite3.connect(bd_tenant_path)
+        conn_tenant = conectar_sqlite(bd_tenant_path)
         cursor_tenant = conn_tenant.cursor()
         
         # Verificar que la tabla usuarios existe
@@ -8733,7 +8365,8 @@ def obtener_datos_cliente(cliente_id):
                 'fecha_expiracion': cliente.fecha_expiracion.strftime('%Y-%m-%d') if cliente.fecha_expiracion else None,
                 'dias_gracia': cliente.dias_gracia,
                 'razon_social': cliente.razon_social,
-                'nit': cliente.nit
+                'nit': cliente.nit,
+                'zona_horaria': cliente.zona_horaria
             }
         })
     except Exception as e:
@@ -8762,6 +8395,11 @@ def editar_cliente():
         cliente.razon_social = request.form.get('razon_social')
         cliente.nit = request.form.get('nit')
         
+        zona_horaria = (request.form.get('zona_horaria') or '').strip()
+        if zona_horaria and not zona_horaria_valida(zona_horaria):
+            return jsonify({'success': False, 'error': f'Zona horaria no válida: {zona_horaria}'})
+        cliente.zona_horaria = zona_horaria or None
+        
         # Manejar fecha de expiración
         fecha_expiracion = request.form.get('fecha_expiracion')
         if cliente.tipo_licencia != 'local' and fecha_expiracion:
@@ -8770,6 +8408,7 @@ def editar_cliente():
             cliente.fecha_expiracion = None
         
         db.session.commit()
+        invalidar_configuracion_tenant(cliente.id, cliente.tenant_id, cliente.panaderia_id)
         
         return jsonify({'success': True, 'message': 'Cliente actualizado correctamente'})
         
@@ -8815,6 +8454,7 @@ def obtener_datos_cliente_super(cliente_id):
                 'dias_gracia': cliente.dias_gracia,
                 'razon_social': cliente.razon_social,
                 'nit': cliente.nit,
+                'zona_horaria': cliente.zona_horaria,
                 'estado_suscripcion': estado_suscripcion
             }
         })
@@ -8846,6 +8486,11 @@ def editar_cliente_super():
         cliente.razon_social = request.form.get('razon_social')
         cliente.nit = request.form.get('nit')
         
+        zona_horaria = (request.form.get('zona_horaria') or '').strip()
+        if zona_horaria and not zona_horaria_valida(zona_horaria):
+            return jsonify({'success': False, 'error': f'Zona horaria no válida: {zona_horaria}'})
+        cliente.zona_horaria = zona_horaria or None
+        
         # Manejar fecha de expiración
         fecha_expiracion = request.form.get('fecha_expiracion')
         if cliente.tipo_licencia != 'local' and fecha_expiracion:
@@ -8854,6 +8499,7 @@ def editar_cliente_super():
             cliente.fecha_expiracion = None
         
         db.session.commit()
+        invalidar_configuracion_tenant(cliente.id, cliente.tenant_id, cliente.panaderia_id)
         
         return jsonify({'success': True, 'message': 'Cliente actualizado correctamente'})
         
@@ -8889,6 +8535,7 @@ def renovar_suscripcion_super():
             cliente.fecha_expiracion = None
         
         db.session.commit()
+        invalidar_configuracion_tenant(cliente.id, cliente.tenant_id, cliente.panaderia_id)
         
         return jsonify({'success': True, 'message': 'Suscripción renovada correctamente'})
         
@@ -8987,7 +8634,7 @@ def eliminar_cliente(tenant_id):
         # =============================================
         # 1. BUSCAR EN configuracion_panaderia POR tenant_id
         # =============================================
-        conn_principal = sqlite3.connect('databases_tenants/panaderia_principal.db')
+        conn_principal = conectar_sqlite('databases_tenants/panaderia_principal.db')
         cursor_principal = conn_principal.cursor()
         cursor_principal.execute(
             "SELECT id, nombre_panaderia FROM configuracion_panaderia WHERE tenant_id = ?",
@@ -9014,7 +8661,7 @@ def eliminar_cliente(tenant_id):
         # =============================================
         # 2. BUSCAR EN tenant_master POR tenant_id
         # =============================================
-        conn_master = sqlite3.connect('tenant_master.db')
+        conn_master = conectar_sqlite('tenant_master.db')
         cursor_master = conn_master.cursor()
         cursor_master.execute(
             "SELECT id, nombre, subdominio FROM tenants WHERE id = ?",
@@ -9035,12 +8682,13 @@ def eliminar_cliente(tenant_id):
             # Eliminar de tenant_master
             cursor_master.execute("DELETE FROM tenants WHERE id = ?", (master_id,))
             conn_master.commit()
+            directorio_tenants.invalidar()
             print(f"✅ [ELIMINAR] Eliminado de tenant_master")
             
-            # Eliminar archivo de BD
+            # Eliminar archivo de BD con su -wal/-shm (cerrando antes su pool de conexiones)
             db_file = f"databases_tenants/{subdominio}.db"
-            if os.path.exists(db_file):
-                os.remove(db_file)
+            registro_engines.descartar(f"{subdominio}.db")
+            if eliminar_bd(db_file):
                 print(f"✅ [ELIMINAR] BD eliminada: {db_file}")
         else:
             print(f"⚠️ [ELIMINAR] No encontrado en tenant_master (ya fue eliminado)")
@@ -9084,7 +8732,7 @@ def toggle_cliente(tenant_id):
         print(f"🔍 [TOGGLE] Iniciando toggle del tenant ID: {tenant_id}")
         
         # 1. Obtener estado actual en tenant_master
-        conn_master = sqlite3.connect('tenant_master.db')
+        conn_master = conectar_sqlite('tenant_master.db')
         cursor_master = conn_master.cursor()
         cursor_master.execute("SELECT activo FROM tenants WHERE id = ?", (tenant_id,))
         resultado = cursor_master.fetchone()
@@ -9102,10 +8750,11 @@ def toggle_cliente(tenant_id):
         cursor_master.execute("UPDATE tenants SET activo = ? WHERE id = ?", (nuevo_estado, tenant_id))
         conn_master.commit()
         conn_master.close()
+        directorio_tenants.invalidar()
         print(f"✅ Tenant actualizado en tenant_master.db")
         
         # 3. Actualizar configuracion_panaderia
-        conn_principal = sqlite3.connect('databases_tenants/panaderia_principal.db')
+        conn_principal = conectar_sqlite('databases_tenants/panaderia_principal.db')
         cursor_principal = conn_principal.cursor()
         
         # Actualizar por id o por tenant_id
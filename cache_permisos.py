@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+CACHÉ DE PERMISOS - Permisos efectivos de cada usuario compilados una sola vez
+"""
+
+import threading
+import time
+
+from flask import g, has_app_context
+
+
+class PermisosCompilados:
+    """
+    Permisos efectivos de un usuario (ROLES_PERMISOS del rol + permisos personalizados).
+
+    acciones: frozenset de (modulo, accion) permitidos
+    modulos:  frozenset de módulos accesibles
+    """
+
+    __slots__ = ('rol', 'version', 'acceso_total', 'acciones', 'modulos')
+
+    def __init__(self, rol, version, acceso_total=False, acciones=frozenset(), modulos=frozenset()):
+        self.rol = rol
+        self.version = version
+        self.acceso_total = acceso_total
+        self.acciones = acciones
+        self.modulos = modulos
+
+    def permite(self, modulo, accion):
+        return self.acceso_total or (modulo, accion) in self.acciones
+
+    def accede(self, modulo):
+        return self.acceso_total or modulo in self.modulos
+
+
+def compilar_permisos(rol, permisos_rol, personalizados, version=0):
+    """
+    rol:            rol del usuario
+    permisos_rol:   {modulo: [acciones]} de ROLES_PERMISOS para ese rol
+    personalizados: iterable de (modulo, accion, permitido) de PermisoUsuario
+    """
+    if rol == 'admin_cliente':
+        return PermisosCompilados(rol, version, acceso_total=True)
+
+    sobrescritos = {(modulo, accion): bool(permitido) for modulo, accion, permitido in personalizados}
+
+    # Permiso personalizado primero; si no existe, el del rol
+    acciones = {(m, a) for m, acciones_rol in permisos_rol.items() for a in acciones_rol}
+    acciones -= {clave for clave, permitido in sobrescritos.items() if not permitido}
+    acciones |= {clave for clave, permitido in sobrescritos.items() if permitido}
+
+    # Un módulo es accesible si es del rol o tiene algún permiso personalizado concedido
+    modulos = set(permisos_rol) | {m for (m, _), permitido in sobrescritos.items() if permitido}
+
+    return PermisosCompilados(rol, version, acciones=frozenset(acciones), modulos=frozenset(modulos))
+
+
+class CachePermisos:
+    """
+    Permisos compilados por (BD del tenant, usuario).
+
+    La versión de cada usuario vive en usuarios.permisos_version: guardar_permisos y
+    editar_usuario la incrementan en la BD, así que todos los procesos ven el cambio en
+    la siguiente petición del usuario (load_user ya trae la fila). Una entrada con
+    versión vieja o con un rol distinto al actual se recompila. Las entradas caducan
+    a los PERMISOS_TTL segundos.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self._entradas = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PERMISOS_TTL', self.ttl)
+        app.extensions['cache_permisos'] = self
+
+    @staticmethod
+    def _base_datos_actual():
+        if has_app_context():
+            tenant = getattr(g, 'tenant', None)
+            if tenant:
+                return tenant.get('base_datos')
+        return None
+
+    def obtener(self, usuario, cargar_personalizados, permisos_rol):
+        """
+        Permisos compilados del usuario. `cargar_personalizados()` sólo se ejecuta
+        (una consulta) cuando la entrada no existe o quedó obsoleta.
+        """
+        clave = (self._base_datos_actual(), usuario.id)
+        version = getattr(usuario, 'permisos_version', None) or 0
+        ahora = time.monotonic()
+
+        entrada = self._entradas.get(clave)
+        if entrada and entrada[0] > ahora:
+            permisos = entrada[1]
+            if permisos.version == version and permisos.rol == usuario.rol:
+                return permisos
+
+        personalizados = () if usuario.rol == 'admin_cliente' else cargar_personalizados()
+        permisos = compilar_permisos(usuario.rol, permisos_rol, personalizados, version)
+        with self._lock:
+            self._entradas[clave] = (ahora + self.ttl, permisos)
+        return permisos
+
+    def invalidar(self, usuario_id):
+        """
+        Descartar la entrada del usuario en este proceso (p. ej. en el login). Para que
+        los demás procesos recompilen, incrementar usuarios.permisos_version
+        (Usuario.incrementar_version_permisos).
+        """
+        clave = (self._base_datos_actual(), usuario_id)
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+
+# Instancia global de la caché de permisos
+cache_permisos = CachePermisos()
+
+def init_cache_permisos(app):
+    """Inicializar la aplicación con la caché de permisos"""
+    cache_permisos.init_app(app)
+    return cache_permisos
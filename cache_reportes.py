@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+CACHÉ DE REPORTES - PDF de GeneradorReportes direccionados por contenido
+
+La clave de un reporte es el hash de (BD del tenant, panadería, tipo, parámetros,
+nombre de la empresa, versión de los datos). La versión de los datos sale de
+versiones_datos: triggers de SQLite la incrementan por tabla, panadería y fecha en
+cada escritura, y la clave suma las versiones de los días del período. Un período
+cerrado conserva su clave y se sirve desde disco; uno abierto cambia de clave con cada
+venta, pago o cierre nuevo y se vuelve a renderizar. Una corrección con fecha pasada
+cambia la versión de ese día y con ella la clave de los reportes que lo incluyen; las
+reconstrucciones de ventas_diarias / ventas_producto_diarias (resumen_ventas) versionan
+los días que reescriben con el nombre de su tabla.
+
+Solo se cachean los reportes que dependen únicamente de las tablas de su período
+(DEPENDENCIAS); inventarios, conciliación e IA predictivo leen el stock y los saldos
+actuales y se generan siempre.
+
+Configuración (app.config):
+    REPORTES_CACHE_DIRECTORIO  carpeta de los PDF cacheados (<REPORTES_DIRECTORIO>/cache)
+    REPORTES_CACHE_DIAS        días sin uso tras los que se borra un PDF cacheado (30)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import g
+from sqlalchemy import func
+
+from models import db, VersionDatos
+from utilidades.rangos_fechas import a_fecha
+
+logger = logging.getLogger('cache_reportes')
+
+# Cambiar al modificar el formato de los PDF: invalida todo lo cacheado. Los reportes
+# cacheables no llevan hora de generación: un PDF cacheado se entrega tal cual
+VERSION_FORMATO = 2
+
+# tipo de cola_reportes.REPORTES: tablas de versiones_datos de las que depende
+DEPENDENCIAS = {
+    'estado_resultados': ('registros_diarios', 'ventas', 'pagos_individuales'),
+    'flujo_caja': ('registros_diarios', 'pagos_individuales'),
+    'libro_diario': ('registros_diarios', 'pagos_individuales'),
+    'analisis_gastos': ('pagos_individuales',),
+    'tendencia_ventas': ('ventas', 'ventas_diarias'),  # ventas_diarias: reconstrucciones del resumen
+    'tesoreria_unificado': ('registros_diarios', 'pagos_individuales'),
+}
+
+
+def _serializable(valor):
+    return valor.isoformat() if hasattr(valor, 'isoformat') else valor
+
+
+class CacheReportes:
+
+    def __init__(self, app=None):
+        self.directorio = os.path.join('reportes_generados', 'cache')
+        self.dias = 30
+        self._lock = threading.Lock()
+        self._ultima_limpieza = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        por_defecto = os.path.join(app.config.get('REPORTES_DIRECTORIO', 'reportes_generados'), 'cache')
+        self.directorio = app.config.get('REPORTES_CACHE_DIRECTORIO', por_defecto)
+        self.dias = app.config.get('REPORTES_CACHE_DIAS', self.dias)
+        app.extensions['cache_reportes'] = self
+
+    def version_datos(self, panaderia_id, tablas, fecha_inicio, fecha_fin):
+        """{tabla: [días con escrituras, suma de versiones]} del período (una consulta agrupada)"""
+        filas = db.session.query(
+            VersionDatos.tabla,
+            func.count(),
+            func.sum(VersionDatos.version)
+        ).filter(
+            VersionDatos.tabla.in_(tablas),
+            VersionDatos.panaderia_id == panaderia_id,
+            VersionDatos.fecha.between(fecha_inicio.isoformat(), fecha_fin.isoformat())
+        ).group_by(VersionDatos.tabla).all()
+
+        versiones = {tabla: [0, 0] for tabla in tablas}
+        for tabla, dias, suma in filas:
+            versiones[tabla] = [dias, int(suma or 0)]
+        return versiones
+
+    def clave(self, tipo, panaderia_id, parametros):
+        """Hash del contenido del reporte, o None si el tipo no se cachea"""
+        tablas = DEPENDENCIAS.get(tipo)
+        if tablas is None or 'fecha_inicio' not in parametros or 'fecha_fin' not in parametros:
+            return None
+
+        try:
+            from perfil_tenant import obtener_perfil_tenant
+
+            versiones = self.version_datos(panaderia_id, tablas,
+                                           a_fecha(parametros['fecha_inicio']), a_fecha(parametros['fecha_fin']))
+            contenido = {
+                'formato': VERSION_FORMATO,
+                'base_datos': (getattr(g, 'tenant', None) or {}).get('base_datos'),
+                'panaderia_id': panaderia_id,
+                'tipo': tipo,
+                'parametros': {clave: _serializable(valor) for clave, valor in parametros.items()},
+                'empresa': getattr(obtener_perfil_tenant(panaderia_id), 'nombre_panaderia', None),
+                'versiones': versiones,
+            }
+        except Exception as e:
+            # BD sin migrar (sin versiones_datos): el reporte se genera sin caché
+            logger.warning("⚠️ Sin caché para el reporte %s: %s", tipo, e)
+            return None
+
+        return hashlib.sha256(json.dumps(contenido, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f'{clave}.pdf')
+
+    def leer(self, clave):
+        """Bytes del PDF cacheado con esa clave, o None"""
+        if clave is None:
+            return None
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as archivo:
+                datos = archivo.read()
+            os.utime(ruta)  # La retención cuenta desde el último uso
+        except OSError:
+            return None
+        logger.debug("📄 Reporte servido desde la caché (%s)", clave[:12])
+        return datos
+
+    def guardar(self, clave, datos):
+        if clave is None:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(clave)
+        temporal = f'{ruta}.{threading.get_ident()}.tmp'
+        with open(temporal, 'wb') as archivo:
+            archivo.write(datos)
+        os.replace(temporal, ruta)
+        self.limpiar_vencidos()
+
+    def limpiar_vencidos(self, forzar=False):
+        """Borrar los PDF que nadie pidió en los últimos `dias` (como mucho una vez por hora)"""
+        ahora = time.time()
+        with self._lock:
+            if not forzar and ahora - self._ultima_limpieza < 3600:
+                return 0
+            self._ultima_limpieza = ahora
+
+        limite = ahora - self.dias * 86400
+        borrados = 0
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return 0
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+                    borrados += 1
+            except OSError:
+                continue
+
+        if borrados:
+            logger.info("🧹 Reportes cacheados sin uso eliminados: %s", borrados)
+        return borrados
+
+
+# Instancia global
+cache_reportes = CacheReportes()
+
+
+def init_cache_reportes(app):
+    cache_reportes.init_app(app)
+    return cache_reportes
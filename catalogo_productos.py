@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+CATÁLOGO DE PRODUCTOS - Índice en memoria para la búsqueda del punto de venta
+"""
+
+import logging
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import deque
+
+from flask import g, has_app_context
+from sqlalchemy import event, select
+
+from models import db, Producto, ProductoExterno
+from tenant_engines import SesionTenant
+
+logger = logging.getLogger('catalogo_productos')
+
+
+# Tipos de producto vendible: 'P' = Producto (panadería), 'E' = ProductoExterno
+TIPO_PANADERIA = 'P'
+TIPO_EXTERNO = 'E'
+
+# Compatibilidad con carritos guardados antes de las claves tipadas
+OFFSET_EXTERNOS_ANTIGUO = 10000
+
+
+def clave_producto(tipo, producto_id):
+    """Clave tipada del producto vendible: clave_producto('E', 45) -> 'E:45'"""
+    return f"{tipo}:{producto_id}"
+
+
+def parsear_clave_producto(valor):
+    """
+    'P:123' -> ('P', 123), 'E:45' -> ('E', 45).
+    Acepta también los IDs numéricos antiguos (externos con offset +10000).
+    Lanza ValueError si la clave no es válida.
+    """
+    if isinstance(valor, str) and ':' in valor:
+        tipo, _, numero = valor.partition(':')
+        tipo = tipo.upper()
+        if tipo not in (TIPO_PANADERIA, TIPO_EXTERNO):
+            raise ValueError(f"Tipo de producto desconocido: {valor}")
+        return tipo, int(numero)
+
+    numero = int(valor)
+    if numero > OFFSET_EXTERNOS_ANTIGUO:
+        return TIPO_EXTERNO, numero - OFFSET_EXTERNOS_ANTIGUO
+    return TIPO_PANADERIA, numero
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin tildes: 'Pan Francés' -> 'pan frances'"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto):
+    return re.findall(r'\w+', normalizar_texto(texto))
+
+
+class IndiceCatalogo:
+    """
+    Índice de los productos (panadería + externos) de una panadería.
+
+    - prefijos: prefijo de cada palabra del nombre -> claves de producto
+    - trigramas: trigrama del nombre completo -> claves (para coincidencias en medio
+      de una palabra, como hacía el antiguo `query in nombre`)
+
+    Guarda también los productos sin stock o inactivos; el filtro se aplica al buscar,
+    así un cambio de stock sólo actualiza la entrada sin tocar los índices.
+
+    Cada cambio visible para el punto de venta (stock, precio, nombre, aparición o
+    desaparición) incrementa `version` y queda en `cambios`, de donde las terminales
+    leen sólo lo ocurrido desde la última versión que conocen.
+    """
+
+    LARGO_MAXIMO_PREFIJO = 20
+    MAXIMO_CAMBIOS = 500
+
+    def __init__(self):
+        self.entradas = {}
+        self.prefijos = {}
+        self.trigramas = {}
+        self.lock = threading.RLock()
+
+        # Versionado: `instancia` cambia si el proceso se reinicia o el índice se crea de cero
+        self.instancia = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.cambios = deque(maxlen=self.MAXIMO_CAMBIOS)
+
+    # ---------- mantenimiento ----------
+
+    def agregar(self, clave, datos, anotar=True):
+        """Insertar o actualizar un producto (clave = (TIPO_PANADERIA|TIPO_EXTERNO, id))"""
+        with self.lock:
+            anterior = self.entradas.get(clave)
+            estado_anterior = self._estado_pos(anterior)
+
+            if anterior and anterior['nombre'] == datos['nombre']:
+                # Sólo cambió stock/precio/estado: no hace falta reindexar
+                anterior.update(datos)
+                entrada = anterior
+            else:
+                if anterior:
+                    self._desindexar(clave, anterior)
+                entrada = dict(datos)
+                entrada['nombre_normalizado'] = normalizar_texto(datos['nombre'])
+                entrada['tokens'] = tokenizar(datos['nombre'])
+                self.entradas[clave] = entrada
+                self._indexar(clave, entrada)
+
+            if anotar:
+                self._anotar_si_cambio(estado_anterior, entrada)
+
+    def quitar(self, clave):
+        with self.lock:
+            entrada = self.entradas.pop(clave, None)
+            if entrada:
+                self._desindexar(clave, entrada)
+                self._anotar_si_cambio(self._estado_pos(entrada), None, entrada)
+
+    # ---------- versionado de cambios ----------
+
+    @classmethod
+    def _estado_pos(cls, entrada):
+        """Lo que ve el punto de venta de un producto (None si no aparece)"""
+        if entrada is None or not cls._visible(entrada):
+            return None
+        return entrada['resultado']
+
+    def _anotar_si_cambio(self, estado_anterior, entrada, entrada_anterior=None):
+        estado_nuevo = self._estado_pos(entrada)
+        if estado_nuevo == estado_anterior:
+            return  # Cambio interno (costo, fechas...) o producto que sigue oculto
+
+        if estado_nuevo is not None:
+            cambio = dict(estado_nuevo, visible=True)
+        else:
+            origen = entrada or entrada_anterior
+            cambio = {'id': origen['resultado']['id'], 'visible': False}
+
+        self.version += 1
+        self.cambios.append((self.version, cambio))
+
+    def heredar(self, anterior):
+        """
+        Continuar la numeración de un índice anterior (recarga por TTL) anotando
+        como cambios las diferencias entre ambos, incluidas las hechas por otros procesos.
+        """
+        with anterior.lock, self.lock:
+            self.instancia = anterior.instancia
+            self.version = anterior.version
+            self.cambios = anterior.cambios
+            for clave in anterior.entradas.keys() | self.entradas.keys():
+                viejo = anterior.entradas.get(clave)
+                nuevo = self.entradas.get(clave)
+                self._anotar_si_cambio(self._estado_pos(viejo), nuevo, viejo)
+
+    def cambios_desde(self, version):
+        """
+        Cambios posteriores a `version` (el último por producto), o None si la
+        versión ya no está en el historial y la terminal debe recargar el catálogo.
+        """
+        with self.lock:
+            if version > self.version:
+                return None
+            if version == self.version:
+                return []
+            primera = self.cambios[0][0] if self.cambios else self.version + 1
+            if version < primera - 1:
+                return None
+
+            por_producto = {}
+            for numero, cambio in self.cambios:
+                if numero > version:
+                    por_producto.pop(cambio['id'], None)
+                    por_producto[cambio['id']] = cambio
+            return list(por_producto.values())
+
+    def snapshot(self):
+        """Catálogo visible completo junto con la versión a la que corresponde"""
+        with self.lock:
+            return {
+                'instancia': self.instancia,
+                'version': self.version,
+                'productos': self.buscar('')
+            }
+
+    def _claves_indice(self, entrada):
+        prefijos = set()
+        for token in entrada['tokens']:
+            for largo in range(1, min(len(token), self.LARGO_MAXIMO_PREFIJO) + 1):
+                prefijos.add(token[:largo])
+        nombre = entrada['nombre_normalizado']
+        trigramas = {nombre[i:i + 3] for i in range(len(nombre) - 2)}
+        return prefijos, trigramas
+
+    def _indexar(self, clave, entrada):
+        prefijos, trigramas = self._claves_indice(entrada)
+        for prefijo in prefijos:
+            self.prefijos.setdefault(prefijo, set()).add(clave)
+        for trigrama in trigramas:
+            self.trigramas.setdefault(trigrama, set()).add(clave)
+
+    def _desindexar(self, clave, entrada):
+        prefijos, trigramas = self._claves_indice(entrada)
+        for indice, valores in ((self.prefijos, prefijos), (self.trigramas, trigramas)):
+            for valor in valores:
+                claves = indice.get(valor)
+                if claves is not None:
+                    claves.discard(clave)
+                    if not claves:
+                        del indice[valor]
+
+    # ---------- búsqueda ----------
+
+    @staticmethod
+    def _visible(entrada):
+        return entrada['activo'] and (entrada['stock_actual'] or 0) > 0
+
+    def _candidatos_prefijo(self, tokens_query):
+        conjunto = None
+        for token in tokens_query:
+            claves = self.prefijos.get(token[:self.LARGO_MAXIMO_PREFIJO], set())
+            conjunto = set(claves) if conjunto is None else conjunto & claves
+            if not conjunto:
+                return set()
+        return conjunto or set()
+
+    def _candidatos_subcadena(self, query):
+        if len(query) < 3:
+            # Consultas muy cortas: revisar todo (el catálogo de una panadería es pequeño)
+            candidatos = self.entradas.keys()
+        else:
+            candidatos = None
+            for i in range(len(query) - 2):
+                claves = self.trigramas.get(query[i:i + 3], set())
+                candidatos = set(claves) if candidatos is None else candidatos & claves
+                if not candidatos:
+                    return set()
+        return {c for c in candidatos if query in self.entradas[c]['nombre_normalizado']}
+
+    def buscar(self, texto, limite=None):
+        """
+        Productos visibles que coinciden con el texto, ordenados por relevancia:
+        nombre exacto > nombre que empieza por la búsqueda > palabras que empiezan
+        por la búsqueda > coincidencia en medio de una palabra.
+        """
+        query = normalizar_texto(texto).strip()
+
+        with self.lock:
+            if not query:
+                # Sin texto: todo el catálogo visible, panadería primero y luego externos
+                claves = sorted(
+                    (c for c, e in self.entradas.items() if self._visible(e)),
+                    key=lambda c: (c[0] != TIPO_PANADERIA, c[1])
+                )
+                seleccion = claves[:limite] if limite else claves
+                return [self._resultado(self.entradas[c]) for c in seleccion]
+
+            tokens_query = tokenizar(query)
+            por_prefijo = self._candidatos_prefijo(tokens_query) if tokens_query else set()
+            por_subcadena = self._candidatos_subcadena(query)
+
+            puntuados = []
+            for clave in por_prefijo | por_subcadena:
+                entrada = self.entradas[clave]
+                if not self._visible(entrada):
+                    continue
+                nombre = entrada['nombre_normalizado']
+                if nombre == query:
+                    rango = 0
+                elif nombre.startswith(query):
+                    rango = 1
+                elif clave in por_prefijo:
+                    rango = 2
+                else:
+                    rango = 3
+                puntuados.append((rango, len(nombre), nombre, clave))
+
+            puntuados.sort()
+            if limite:
+                puntuados = puntuados[:limite]
+            return [self._resultado(self.entradas[p[3]]) for p in puntuados]
+
+    @staticmethod
+    def _resultado(entrada):
+        """Formato que espera el punto de venta (pos-moderno.js)"""
+        return dict(entrada['resultado'])
+
+
+def _datos_producto(producto):
+    return {
+        'nombre': producto.nombre,
+        'activo': bool(producto.activo),
+        'stock_actual': producto.stock_actual,
+        'resultado': {
+            'id': clave_producto(TIPO_PANADERIA, producto.id),
+            'nombre': producto.nombre,
+            'precio': float(producto.precio_venta or 0),
+            'stock_actual': producto.stock_actual,
+            'categoria': 'Panadería',
+            'tipo_producto': producto.tipo_producto or 'produccion',
+            'es_externo': False
+        }
+    }
+
+
+def _datos_producto_externo(producto):
+    return {
+        'nombre': producto.nombre,
+        'activo': bool(producto.activo),
+        'stock_actual': producto.stock_actual,
+        'resultado': {
+            'id': clave_producto(TIPO_EXTERNO, producto.id),
+            'nombre': producto.nombre,
+            'precio': float(producto.precio_venta or 0),
+            'stock_actual': producto.stock_actual,
+            'categoria': producto.categoria,
+            'tipo_producto': 'produccion',  # Mismo tipo para compatibilidad
+            'es_externo': True
+        }
+    }
+
+
+class CatalogoProductos:
+    """
+    Índices de catálogo por (BD del tenant, panadería), cargados bajo demanda.
+
+    Los cambios de Producto/ProductoExterno hechos con el ORM se aplican al índice
+    al confirmar la transacción (eventos de la sesión). Como respaldo para cambios
+    desde otros procesos, cada índice se recarga a los CATALOGO_TTL segundos; la
+    recarga conserva la versión y anota las diferencias como cambios.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.limite_resultados = 50
+        self._indices = {}
+        self._lock = threading.Lock()
+        self._eventos_registrados = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('CATALOGO_TTL', self.ttl)
+        self.limite_resultados = app.config.get('CATALOGO_LIMITE_RESULTADOS', self.limite_resultados)
+        app.extensions['catalogo_productos'] = self
+
+        if not self._eventos_registrados:
+            event.listen(SesionTenant, 'after_flush', self._registrar_cambios)
+            event.listen(SesionTenant, 'after_commit', self._aplicar_cambios)
+            event.listen(SesionTenant, 'after_rollback', self._descartar_cambios)
+            self._eventos_registrados = True
+
+    @staticmethod
+    def _base_datos_actual():
+        if has_app_context():
+            tenant = getattr(g, 'tenant', None)
+            if tenant:
+                return tenant.get('base_datos')
+        return None
+
+    # ---------- consulta ----------
+
+    def indice(self, panaderia_id):
+        """Índice de la panadería indicada (cargándolo si no existe o caducó)"""
+        clave = (self._base_datos_actual(), panaderia_id)
+        ahora = time.monotonic()
+
+        entrada = self._indices.get(clave)
+        if entrada and entrada[0] > ahora:
+            return entrada[1]
+
+        indice = self._cargar(panaderia_id)
+        if entrada:
+            indice.heredar(entrada[1])
+        with self._lock:
+            self._indices[clave] = (ahora + self.ttl, indice)
+        return indice
+
+    def buscar(self, panaderia_id, texto, limite=None):
+        """Búsqueda rankeada; sin texto devuelve todo el catálogo visible"""
+        if limite is None and texto.strip():
+            limite = self.limite_resultados
+        return self.indice(panaderia_id).buscar(texto, limite)
+
+    def snapshot(self, panaderia_id):
+        """Catálogo visible completo con su versión"""
+        return self.indice(panaderia_id).snapshot()
+
+    def cambios_desde(self, panaderia_id, instancia, version):
+        """
+        Cambios de stock/precio desde `version`. Devuelve (version_actual, cambios);
+        cambios es None si la terminal debe pedir un snapshot nuevo.
+        """
+        indice = self.indice(panaderia_id)
+        if instancia != indice.instancia:
+            return indice.version, None
+        return indice.version, indice.cambios_desde(version)
+
+    def invalidar(self, *panaderia_ids):
+        """
+        Forzar la recarga de los índices de las panaderías indicadas (todos si no se
+        indica ninguna). La recarga conserva la versión, así las terminales reciben
+        las diferencias en lugar de tener que recargar el catálogo.
+        """
+        with self._lock:
+            for clave, (_, indice) in list(self._indices.items()):
+                if not panaderia_ids or clave[1] in panaderia_ids:
+                    self._indices[clave] = (0, indice)
+
+    def _cargar(self, panaderia_id):
+        """Una consulta por tabla, sin cargar relaciones"""
+        indice = IndiceCatalogo()
+
+        productos = db.session.execute(
+            select(Producto).where(Producto.panaderia_id == panaderia_id).order_by(Producto.id)
+        ).scalars()
+        for producto in productos:
+            indice.agregar((TIPO_PANADERIA, producto.id), _datos_producto(producto), anotar=False)
+
+        externos = db.session.execute(
+            select(ProductoExterno).where(ProductoExterno.panaderia_id == panaderia_id).order_by(ProductoExterno.id)
+        ).scalars()
+        for producto in externos:
+            indice.agregar((TIPO_EXTERNO, producto.id), _datos_producto_externo(producto), anotar=False)
+
+        logger.info("📇 [CATÁLOGO] Índice cargado para panadería %s: %s productos", panaderia_id, len(indice.entradas))
+        return indice
+
+    # ---------- sincronización con la sesión ----------
+
+    def _registrar_cambios(self, session, flush_context):
+        """after_flush: guardar una foto de los productos creados, modificados o borrados"""
+        cambios = session.info.setdefault('catalogo_cambios', [])
+        base_datos = self._base_datos_actual()
+
+        for estado, objetos in (('guardado', session.new), ('guardado', session.dirty), ('borrado', session.deleted)):
+            for obj in objetos:
+                if isinstance(obj, Producto):
+                    clave, datos = (TIPO_PANADERIA, obj.id), _datos_producto
+                elif isinstance(obj, ProductoExterno):
+                    clave, datos = (TIPO_EXTERNO, obj.id), _datos_producto_externo
+                else:
+                    continue
+                foto = datos(obj) if estado == 'guardado' else None
+                cambios.append((base_datos, obj.panaderia_id, clave, foto))
+
+    def _aplicar_cambios(self, session):
+        """after_commit: aplicar los cambios a los índices ya cargados"""
+        cambios = session.info.pop('catalogo_cambios', None)
+        if not cambios:
+            return
+
+        for base_datos, panaderia_id, clave, foto in cambios:
+            entrada = self._indices.get((base_datos, panaderia_id))
+            if not entrada:
+                continue  # Índice no cargado: se leerá fresco en la próxima búsqueda
+            if foto is None:
+                entrada[1].quitar(clave)
+            else:
+                entrada[1].agregar(clave, foto)
+
+    def _descartar_cambios(self, session):
+        session.info.pop('catalogo_cambios', None)
+
+
+# Instancia global del catálogo
+catalogo_productos = CatalogoProductos()
+
+def init_catalogo_productos(app):
+    """Inicializar la aplicación con el índice de catálogo del punto de venta"""
+    catalogo_productos.init_app(app)
+    return catalogo_productos
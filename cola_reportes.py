@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+COLA DE REPORTES - Generación de los PDF de GeneradorReportes en segundo plano
+
+Las rutas generar_reporte_* con ?asincrono=1 encolan el reporte y responden de
+inmediato con el id del trabajo; un pool de hilos lo renderiza con ReportLab fuera
+de la petición. El navegador consulta el estado en /reportes/trabajos/<id> y
+descarga el PDF en /reportes/trabajos/<id>/pdf cuando queda listo.
+
+Cada trabajo guarda en REPORTES_DIRECTORIO su PDF (<id>.pdf) y su estado (<id>.json),
+así la consulta funciona aunque la atienda otro proceso. Los archivos con más de
+REPORTES_RETENCION_HORAS se borran al encolar trabajos nuevos. Si cache_reportes ya
+tiene el PDF (período sin escrituras nuevas) el trabajo queda listo al encolarlo.
+
+Configuración (app.config):
+    REPORTES_DIRECTORIO       carpeta de los PDF generados ('reportes_generados')
+    REPORTES_TRABAJADORES     hilos del pool (2)
+    REPORTES_RETENCION_HORAS  horas que se conservan los PDF (24)
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from flask import g
+
+from cache_reportes import cache_reportes
+
+logger = logging.getLogger('cola_reportes')
+
+# tipo: (método de GeneradorReportes, recibe panaderia_id)
+REPORTES = {
+    'estado_resultados': ('generar_reporte_estado_resultados', True),
+    'flujo_caja': ('generar_reporte_flujo_caja', True),
+    'libro_diario': ('generar_reporte_libro_diario', True),
+    'conciliacion': ('generar_reporte_conciliacion_bancaria', False),
+    'analisis_gastos': ('generar_reporte_analisis_gastos', True),
+    'tendencia_ventas': ('generar_reporte_tendencia_ventas', True),
+    'ia_predictivo': ('generar_reporte_ia_predictivo', True),
+    'analisis_inventarios': ('generar_reporte_analisis_inventarios', True),
+    'tesoreria_unificado': ('generar_reporte_tesoreria_unificado', True),
+}
+
+PENDIENTE = 'pendiente'
+PROCESANDO = 'procesando'
+LISTO = 'listo'
+ERROR = 'error'
+
+_ID_VALIDO = re.compile(r'^[0-9a-f]{32}$')
+
+
+def generar_pdf(tipo, panaderia_id, **parametros):
+    """
+    Bytes del PDF del reporte: de cache_reportes si los datos del período no cambiaron,
+    si no lo renderiza en la petición o hilo actual y lo deja en la caché.
+    """
+    from reportes import GeneradorReportes
+
+    # La clave se calcula antes de consultar: lo escrito durante el renderizado cambia la
+    # versión y la próxima petición no reutiliza este PDF
+    clave = cache_reportes.clave(tipo, panaderia_id, parametros)
+    datos = cache_reportes.leer(clave)
+    if datos is not None:
+        return datos
+
+    metodo, recibe_panaderia = REPORTES[tipo]
+    generador = GeneradorReportes(panaderia_id=panaderia_id)
+    if recibe_panaderia:
+        parametros['panaderia_id'] = panaderia_id
+
+    resultado = getattr(generador, metodo)(**parametros)
+    datos = resultado.getvalue() if hasattr(resultado, 'getvalue') else resultado
+    if not datos:
+        raise ValueError("El PDF generado está vacío")
+    cache_reportes.guardar(clave, datos)
+    return datos
+
+
+def _serializable(valor):
+    return valor.isoformat() if isinstance(valor, (date, datetime)) else valor
+
+
+class TrabajoReporte:
+    """Estado de un reporte encolado (lo que se guarda en <id>.json)"""
+
+    CAMPOS = ('id', 'tipo', 'estado', 'panaderia_id', 'base_datos', 'usuario_id',
+              'nombre_archivo', 'parametros', 'creado', 'terminado', 'error')
+
+    def __init__(self, **datos):
+        for campo in self.CAMPOS:
+            setattr(self, campo, datos.get(campo))
+
+    def a_dict(self):
+        return {campo: getattr(self, campo) for campo in self.CAMPOS}
+
+
+class ColaReportes:
+
+    def __init__(self, app=None):
+        self.app = None
+        self.directorio = 'reportes_generados'
+        self.trabajadores = 2
+        self.retencion_horas = 24
+        self._pool = None
+        self._trabajos = {}
+        self._lock = threading.Lock()
+        self._ultima_limpieza = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.directorio = app.config.get('REPORTES_DIRECTORIO', self.directorio)
+        self.trabajadores = app.config.get('REPORTES_TRABAJADORES', self.trabajadores)
+        self.retencion_horas = app.config.get('REPORTES_RETENCION_HORAS', self.retencion_horas)
+        app.extensions['cola_reportes'] = self
+
+    def _obtener_pool(self):
+        # El pool se crea con el primer trabajo: importar la app (scripts, migraciones) no arranca hilos
+        with self._lock:
+            if self._pool is None:
+                os.makedirs(self.directorio, exist_ok=True)
+                self._pool = ThreadPoolExecutor(max_workers=self.trabajadores,
+                                                thread_name_prefix='cola_reportes')
+            return self._pool
+
+    # ---------------------------------------------
+    # Archivos de cada trabajo
+    # ---------------------------------------------
+
+    def ruta_pdf(self, trabajo_id):
+        return os.path.join(self.directorio, f'{trabajo_id}.pdf')
+
+    def _ruta_estado(self, trabajo_id):
+        return os.path.join(self.directorio, f'{trabajo_id}.json')
+
+    def _escribir_pdf(self, trabajo, datos):
+        ruta = self.ruta_pdf(trabajo.id)
+        with open(f'{ruta}.tmp', 'wb') as archivo:
+            archivo.write(datos)
+        os.replace(f'{ruta}.tmp', ruta)
+        trabajo.estado = LISTO
+
+    def _guardar_estado(self, trabajo):
+        ruta = self._ruta_estado(trabajo.id)
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(trabajo.a_dict(), archivo, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    # ---------------------------------------------
+    # API
+    # ---------------------------------------------
+
+    def encolar(self, tipo, panaderia_id, nombre_archivo, usuario_id=None, **parametros):
+        """
+        Encolar un reporte de REPORTES para la BD del tenant de la petición actual.
+        parametros: los argumentos del método de GeneradorReportes (sin panaderia_id).
+        """
+        if tipo not in REPORTES:
+            raise ValueError(f"Tipo de reporte desconocido: {tipo}")
+
+        self.limpiar_vencidos()
+        tenant = dict(getattr(g, 'tenant', None) or {})
+        trabajo = TrabajoReporte(
+            id=uuid.uuid4().hex,
+            tipo=tipo,
+            estado=PENDIENTE,
+            panaderia_id=panaderia_id,
+            base_datos=tenant.get('base_datos'),
+            usuario_id=usuario_id,
+            nombre_archivo=nombre_archivo,
+            parametros={clave: _serializable(valor) for clave, valor in parametros.items()},
+            creado=datetime.utcnow().isoformat(),
+        )
+
+        pool = self._obtener_pool()
+        with self._lock:
+            self._trabajos[trabajo.id] = trabajo
+
+        # Período sin cambios desde la última vez: el trabajo nace terminado
+        cacheado = cache_reportes.leer(cache_reportes.clave(tipo, panaderia_id, parametros))
+        if cacheado is not None:
+            self._escribir_pdf(trabajo, cacheado)
+            trabajo.terminado = trabajo.creado
+            self._guardar_estado(trabajo)
+            logger.info("📄 Reporte %s servido desde la caché (%s)", tipo, trabajo.id)
+            return trabajo
+
+        self._guardar_estado(trabajo)
+        pool.submit(self._ejecutar, trabajo, tenant, parametros)
+
+        logger.info("📥 Reporte %s encolado (%s)", tipo, trabajo.id)
+        return trabajo
+
+    def obtener(self, trabajo_id):
+        """TrabajoReporte por id (de memoria o de su archivo de estado), o None"""
+        if not _ID_VALIDO.match(trabajo_id or ''):
+            return None
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is not None:
+            return trabajo
+        try:
+            with open(self._ruta_estado(trabajo_id), encoding='utf-8') as archivo:
+                return TrabajoReporte(**json.load(archivo))
+        except (OSError, ValueError):
+            return None
+
+    def limpiar_vencidos(self, forzar=False):
+        """Borrar PDF y estados con más de retencion_horas (como mucho una vez por minuto)"""
+        ahora = time.time()
+        if not forzar and ahora - self._ultima_limpieza < 60:
+            return 0
+        self._ultima_limpieza = ahora
+
+        limite = ahora - self.retencion_horas * 3600
+        borrados = 0
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return 0
+
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            if not os.path.isfile(ruta):
+                continue  # cache/ tiene su propia retención (cache_reportes)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+                    borrados += 1
+            except OSError:
+                continue
+
+        # Los trabajos terminados cuyo estado ya se borró salen también de memoria
+        with self._lock:
+            for trabajo_id, trabajo in list(self._trabajos.items()):
+                if trabajo.estado in (LISTO, ERROR) and not os.path.exists(self._ruta_estado(trabajo_id)):
+                    del self._trabajos[trabajo_id]
+
+        if borrados:
+            logger.info("🧹 Reportes vencidos eliminados: %s archivos", borrados)
+        return borrados
+
+    # ---------------------------------------------
+    # Hilos del pool
+    # ---------------------------------------------
+
+    def _ejecutar(self, trabajo, tenant, parametros):
+        with self.app.app_context():
+            g.tenant = tenant
+            trabajo.estado = PROCESANDO
+            self._guardar_estado(trabajo)
+            inicio = time.perf_counter()
+            try:
+                datos = generar_pdf(trabajo.tipo, trabajo.panaderia_id, **parametros)
+                self._escribir_pdf(trabajo, datos)
+                logger.info("✅ Reporte %s generado en %.1fs (%s bytes)",
+                            trabajo.tipo, time.perf_counter() - inicio, len(datos))
+            except Exception as e:
+                trabajo.estado = ERROR
+                trabajo.error = str(e)
+                logger.exception("❌ Error generando reporte %s (%s)", trabajo.tipo, trabajo.id)
+            finally:
+                trabajo.terminado = datetime.utcnow().isoformat()
+                self._guardar_estado(trabajo)
+
+
+# Instancia global
+cola_reportes = ColaReportes()
+
+
+def init_cola_reportes(app):
+    cola_reportes.init_app(app)
+    return cola_reportes
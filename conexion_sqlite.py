@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+CONEXIONES SQLITE - Fábrica única de conexiones con perfil de PRAGMAs de rendimiento
+
+Todas las conexiones a las BD de tenants y a tenant_master.db (engines de SQLAlchemy
+y conexiones sqlite3 directas) reciben el mismo perfil al abrirse:
+
+    journal_mode = WAL      lectores y escritor no se bloquean entre sí
+    synchronous  = NORMAL   seguro con WAL; fsync sólo en checkpoints
+    mmap_size               lecturas con memoria mapeada
+    cache_size              caché de páginas por conexión (negativo = KiB)
+    busy_timeout            espera en lugar de fallar con "database is locked"
+    temp_store   = MEMORY   tablas temporales y ordenamientos en memoria
+
+El perfil se ajusta con app.config['SQLITE_PRAGMAS'].
+
+Con WAL una BD son tres archivos (.db, -wal, -shm) y los últimos commits pueden estar
+solo en el -wal: para copiar una BD usar copiar_bd y para borrarla eliminar_bd, nunca
+shutil.copy2 / os.remove sobre el .db solo.
+"""
+
+import logging
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('conexion_sqlite')
+
+PERFIL_PRAGMAS_POR_DEFECTO = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+# Orden de aplicación: busy_timeout primero para que el cambio a WAL espere si hay bloqueo
+_ORDEN_PRAGMAS = ('busy_timeout', 'journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store')
+
+perfil_pragmas = dict(PERFIL_PRAGMAS_POR_DEFECTO)
+
+
+def aplicar_pragmas(conexion):
+    """Aplicar el perfil a una conexión sqlite3 recién abierta"""
+    cursor = conexion.cursor()
+    try:
+        claves = [c for c in _ORDEN_PRAGMAS if c in perfil_pragmas]
+        claves += [c for c in perfil_pragmas if c not in _ORDEN_PRAGMAS]
+        for pragma in claves:
+            valor = perfil_pragmas[pragma]
+            if valor is None:
+                continue
+            cursor.execute(f"PRAGMA {pragma} = {valor}")
+    except sqlite3.DatabaseError as e:
+        # Una BD de solo lectura o bloqueada no debe impedir abrir la conexión
+        logger.warning("⚠️ No se pudo aplicar el perfil de PRAGMAs: %s", e)
+    finally:
+        cursor.close()
+
+
+def conectar_sqlite(ruta, **kwargs):
+    """sqlite3.connect con el perfil de PRAGMAs aplicado (reemplaza sqlite3.connect directo)"""
+    kwargs.setdefault('timeout', perfil_pragmas.get('busy_timeout', 5000) / 1000)
+    conexion = sqlite3.connect(ruta, **kwargs)
+    aplicar_pragmas(conexion)
+    return conexion
+
+
+def copiar_bd(origen, destino):
+    """Copia consistente de una BD (incluye lo que aún está en su -wal) con la API de backup"""
+    conexion_origen = conectar_sqlite(origen)
+    try:
+        conexion_destino = conectar_sqlite(destino)
+        try:
+            conexion_origen.backup(conexion_destino)
+        finally:
+            conexion_destino.close()
+    finally:
+        conexion_origen.close()
+
+
+def eliminar_bd(ruta):
+    """Borrar la BD junto con sus archivos -wal, -shm y -journal; retorna si existía"""
+    existia = os.path.exists(ruta)
+    for archivo in (ruta, f'{ruta}-wal', f'{ruta}-shm', f'{ruta}-journal'):
+        if os.path.exists(archivo):
+            os.remove(archivo)
+    return existia
+
+
+@event.listens_for(Engine, 'connect')
+def _al_conectar_engine(conexion_dbapi, registro_conexion):
+    """Cualquier engine de SQLAlchemy sobre SQLite (por defecto y por tenant) usa el perfil"""
+    if isinstance(conexion_dbapi, sqlite3.Connection):
+        aplicar_pragmas(conexion_dbapi)
+
+
+def init_conexiones_sqlite(app):
+    """Leer el perfil de PRAGMAs desde la configuración de la app"""
+    perfil_pragmas.clear()
+    perfil_pragmas.update(PERFIL_PRAGMAS_POR_DEFECTO)
+    perfil_pragmas.update(app.config.get('SQLITE_PRAGMAS', {}))
+    app.extensions['conexion_sqlite'] = perfil_pragmas
+    return perfil_pragmas
@@ -1,8 +1,9 @@
 # crear_plantilla_tenant.py
 import sqlite3
-import shutil
 from pathlib import Path
 
+from conexion_sqlite import copiar_bd
+
 def crear_plantilla_tenant():
     """Crea una plantilla de base de datos tenant limpia"""
     print("🔄 CREANDO PLANTILLA DE TENANT PROFESIONAL")
@@ -16,8 +17,8 @@ def crear_plantilla_tenant():
         print(f"❌ No existe: {origen}")
         return False
     
-    # 2. Crear copia
-    shutil.copy2(origen, plantilla)
+    # 2. Crear copia (con lo que aún esté en el -wal del origen)
+    copiar_bd(origen, plantilla)
     print(f"✅ Plantilla creada: {plantilla}")
     
     # 3. Conectar y limpiar datos de tenant (pero mantener estructura)
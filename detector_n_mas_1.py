@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+DETECTOR N+1 - Avisa cuando una petición dispara cargas perezosas repetidas
+
+Cada acceso a una relación no cargada (detalle.producto, venta.detalles, ...) que va
+a la BD pasa por el evento do_orm_execute de la sesión con lazy_loaded_from. El
+detector las cuenta por relación durante la petición y, al terminar, registra un
+WARNING por cada relación que superó el umbral: es la señal de que la página debería
+usar los helpers con selectinload/joinedload de utilidades.consultas_filtradas.
+
+Las cargas en bloque (selectinload, subqueryload) no cuentan: no traen
+lazy_loaded_from. Los many-to-one resueltos desde el identity map tampoco, porque
+no llegan a ejecutar SQL.
+
+Configuración (app.config):
+    DETECTAR_N_MAS_1  True/False; None (por defecto) = activo solo con app.debug
+    N_MAS_1_UMBRAL    cargas perezosas de una misma relación que disparan el aviso (10)
+"""
+
+import logging
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger('detector_n_mas_1')
+
+
+class DetectorNMas1:
+
+    def __init__(self, app=None):
+        self.activo = None
+        self.umbral = 10
+        self._eventos_registrados = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.activo = app.config.get('DETECTAR_N_MAS_1', self.activo)
+        self.umbral = app.config.get('N_MAS_1_UMBRAL', self.umbral)
+        app.extensions['detector_n_mas_1'] = self
+
+        if not self._eventos_registrados:
+            # Session (la clase base) cubre SesionTenant y cualquier otra sesión
+            event.listen(Session, 'do_orm_execute', self._registrar_carga)
+            self._eventos_registrados = True
+
+        @app.before_request
+        def _iniciar_conteo():
+            activo = app.debug if self.activo is None else self.activo
+            if activo:
+                g._cargas_perezosas = Counter()
+
+        @app.after_request
+        def _reportar(response):
+            self.reportar()
+            return response
+
+    def _registrar_carga(self, orm_execute_state):
+        # Primero lo barato: fuera de una petición con el detector activo no se mira nada
+        if not has_request_context():
+            return
+        conteo = g.get('_cargas_perezosas')
+        if conteo is None:
+            return
+        # lazy_loaded_from solo existe en SELECT (en INSERT/UPDATE lanza InvalidRequestError)
+        if not orm_execute_state.is_select or orm_execute_state.lazy_loaded_from is None:
+            return
+        ruta = orm_execute_state.loader_strategy_path
+        relacion = str(ruta[-1]) if ruta else 'desconocida'
+        conteo[relacion] += 1
+
+    def cargas_perezosas(self):
+        """Counter {relación: cargas perezosas} de la petición en curso (vacío si inactivo)"""
+        if not has_request_context():
+            return Counter()
+        return g.get('_cargas_perezosas') or Counter()
+
+    def reportar(self):
+        """Registrar las relaciones que superaron el umbral en la petición en curso"""
+        for relacion, cargas in self.cargas_perezosas().most_common():
+            if cargas < self.umbral:
+                break
+            logger.warning(
+                "🐢 Posible N+1 en %s: %s se cargó perezosamente %s veces",
+                request.endpoint, relacion, cargas,
+                extra={'relacion': relacion, 'cargas_perezosas': cargas}
+            )
+
+
+# Instancia global
+detector_n_mas_1 = DetectorNMas1()
+
+
+def init_detector_n_mas_1(app):
+    detector_n_mas_1.init_app(app)
+    return detector_n_mas_1
@@ -5,10 +5,108 @@ MIDDLEWARE SAAS - Detección de Tenant y Conexión Dinámica
 
 import sqlite3
 import os
-import shutil
+import threading
 from pathlib import Path
 from flask import request, g, current_app
 import re
+import logging
+
+from conexion_sqlite import conectar_sqlite, copiar_bd, eliminar_bd
+
+logger = logging.getLogger('middleware_saas')
+
+class DirectorioTenants:
+    """
+    Caché en memoria de la tabla tenants de tenant_master.db.
+
+    Carga la tabla una sola vez por proceso y resuelve búsquedas por subdominio o ID
+    en O(1). Se recarga cuando cambia el archivo (mtime/tamaño) o cuando se llama a
+    invalidar() después de escribir en la BD maestra.
+    """
+
+    def __init__(self, tenant_master_db='tenant_master.db'):
+        self.tenant_master_db = tenant_master_db
+        self._por_id = {}
+        self._por_subdominio = {}
+        self._firma = None
+        self._lock = threading.Lock()
+
+    def _firma_archivo(self):
+        """Firma del archivo maestro (incluye el -wal si existe)"""
+        firma = []
+        for ruta in (self.tenant_master_db, f"{self.tenant_master_db}-wal"):
+            try:
+                estado = os.stat(ruta)
+                firma.append((estado.st_mtime_ns, estado.st_size))
+            except OSError:
+                firma.append(None)
+        return tuple(firma)
+
+    def _asegurar_cargado(self):
+        firma = self._firma_archivo()
+        if firma == self._firma:
+            return
+
+        with self._lock:
+            if firma == self._firma:
+                return
+
+            conn = conectar_sqlite(self.tenant_master_db)
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id, nombre, subdominio, base_datos, activo, plan FROM tenants')
+                filas = cursor.fetchall()
+            finally:
+                conn.close()
+
+            por_id = {}
+            por_subdominio = {}
+            for fila in filas:
+                tenant = {
+                    'id': fila[0],
+                    'nombre': fila[1],
+                    'subdominio': fila[2],
+                    'base_datos': fila[3],
+                    'activo': bool(fila[4]),
+                    'plan': fila[5]
+                }
+                por_id[tenant['id']] = tenant
+                if tenant['subdominio']:
+                    por_subdominio[tenant['subdominio']] = tenant
+
+            self._por_id = por_id
+            self._por_subdominio = por_subdominio
+            self._firma = firma
+
+    def invalidar(self):
+        """Forzar recarga en la próxima búsqueda (llamar tras escribir en tenants)"""
+        with self._lock:
+            self._firma = None
+
+    def buscar(self, identificador, solo_activos=True):
+        """Buscar un tenant por subdominio o por ID. Retorna una copia del dict o None"""
+        self._asegurar_cargado()
+
+        tenant = self._por_subdominio.get(identificador)
+        if tenant is None and str(identificador).isdigit():
+            tenant = self._por_id.get(int(identificador))
+
+        if tenant is None or (solo_activos and not tenant['activo']):
+            return None
+        return dict(tenant)
+
+    def buscar_por_id(self, tenant_id, solo_activos=False):
+        """Buscar un tenant por ID. Retorna una copia del dict o None"""
+        self._asegurar_cargado()
+
+        tenant = self._por_id.get(tenant_id)
+        if tenant is None or (solo_activos and not tenant['activo']):
+            return None
+        return dict(tenant)
+
+
+# Instancia global del directorio de tenants
+directorio_tenants = DirectorioTenants()
 
 class GestorTenants:
     def __init__(self, app=None):
@@ -25,15 +123,12 @@ class GestorTenants:
         
     def detectar_y_configurar_tenant(self):
         """Detectar el tenant y configurar la conexión a BD"""
-        print(f"\n🔍 MIDDLEWARE DEBUG - INICIANDO DETECCIÓN:")
-        print(f"   Request URL: {request.url if request else 'No request'}")
-        print(f"   Request Host: {request.host if request else 'No request'}")
-        print(f"   Request Args: {dict(request.args) if request else 'No request'}")
+        logger.debug("🔍 Detección de tenant - URL: %s, Host: %s", request.url, request.host)
         
         # Obtener información del tenant desde el subdominio o parámetros
         tenant_info = self.obtener_tenant_desde_request()
         
-        print(f"🔍 MIDDLEWARE DEBUG - Tenant info: {tenant_info}")
+        logger.debug("🔍 MIDDLEWARE DEBUG - Tenant info: %s", tenant_info)
         
         if not tenant_info:
             # Si no se detecta tenant, usar el principal por defecto
@@ -43,16 +138,13 @@ class GestorTenants:
                 'subdominio': 'principal',
                 'base_datos': 'panaderia_principal.db'
             }
-            print(f"🔍 MIDDLEWARE DEBUG - Usando tenant por defecto: {tenant_info}")
+            logger.debug("🔍 MIDDLEWARE DEBUG - Usando tenant por defecto: %s", tenant_info)
         
         # Configurar la conexión a la BD del tenant en el contexto global
         g.tenant = tenant_info
         g.db_path = os.path.join(self.databases_dir, tenant_info['base_datos'])
         
-        print(f"🔍 MIDDLEWARE DEBUG - Configurado:")
-        print(f"   Tenant: {tenant_info['nombre']}")
-        print(f"   BD Path: {g.db_path}")
-        print(f"   Tenant ID: {tenant_info['id']}")
+        logger.debug("🔍 Tenant configurado: %s (ID %s) - BD: %s", tenant_info['nombre'], tenant_info['id'], g.db_path)
     
     def obtener_tenant_desde_request(self):
         """Obtener información del tenant basado en la request"""
@@ -60,7 +152,7 @@ class GestorTenants:
         from flask import session
         if session.get('tenant_subdominio'):
             tenant_subdominio = session['tenant_subdominio']
-            print(f"🔍 MIDDLEWARE: Usando tenant de sesión: {tenant_subdominio}")
+            logger.debug("🔍 MIDDLEWARE: Usando tenant de sesión: %s", tenant_subdominio)
             return self.obtener_tenant_desde_bd(tenant_subdominio)
         
         # Estrategia 2: Por subdominio (para producción)
@@ -95,34 +187,17 @@ class GestorTenants:
     def obtener_tenant_desde_bd(self, identificador):
         """Obtener información del tenant desde la BD maestra"""
         try:
-            conn = sqlite3.connect(self.tenant_master_db)
-            cursor = conn.cursor()
-            
-            # Buscar por subdominio o ID
-            cursor.execute('''
-                SELECT id, nombre, subdominio, base_datos, activo, plan
-                FROM tenants 
-                WHERE (subdominio = ? OR id = ?) AND activo = 1
-            ''', (identificador, identificador))
-            
-            tenant_data = cursor.fetchone()
-            conn.close()
+            # Buscar por subdominio o ID (desde el directorio en memoria)
+            tenant_data = directorio_tenants.buscar(identificador)
             
             if tenant_data:
-                return {
-                    'id': tenant_data[0],
-                    'nombre': tenant_data[1],
-                    'subdominio': tenant_data[2],
-                    'base_datos': tenant_data[3],
-                    'activo': bool(tenant_data[4]),
-                    'plan': tenant_data[5]
-                }
+                return tenant_data
             
         except Exception as e:
-            print(f"❌ Error obteniendo tenant desde BD: {e}")
+            logger.error("❌ Error obteniendo tenant desde BD: %s", e)
         
         # ⬇⬇⬇ NUEVO: SI NO EXISTE, CREAR AUTOMÁTICAMENTE ⬇⬇⬇
-        print(f"⚠️  Tenant no encontrado: {identificador}. Creando automáticamente...")
+        logger.warning("⚠️  Tenant no encontrado: %s. Creando automáticamente...", identificador)
         return self.crear_tenant_automatico(identificador)
     
     def obtener_conexion_tenant(self):
@@ -131,11 +206,11 @@ class GestorTenants:
             self.detectar_y_configurar_tenant()
         
         try:
-            conn = sqlite3.connect(g.db_path)
+            conn = conectar_sqlite(g.db_path)
             conn.row_factory = sqlite3.Row  # Para acceso por nombre de columna
             return conn
         except Exception as e:
-            print(f"❌ Error conectando a BD tenant: {e}")
+            logger.error("❌ Error conectando a BD tenant: %s", e)
             return None
 
     def obtener_uri_bd_tenant(self):
@@ -153,7 +228,7 @@ class GestorTenants:
     def obtener_siguiente_panaderia_id(self):
         """Obtiene el siguiente ID disponible para nueva panadería"""
         try:
-            conn = sqlite3.connect(self.tenant_master_db)
+            conn = conectar_sqlite(self.tenant_master_db)
             cursor = conn.cursor()
             
             cursor.execute("SELECT MAX(id) FROM tenants")
@@ -165,13 +240,13 @@ class GestorTenants:
             return siguiente_id
             
         except Exception as e:
-            print(f"⚠️  Error obteniendo siguiente ID: {e}")
+            logger.warning("⚠️  Error obteniendo siguiente ID: %s", e)
             return 1000  # ID alto para evitar conflictos
     
     def crear_tenant_automatico(self, identificador):
         """Crear un nuevo tenant automáticamente"""
         try:
-            print(f"🆕 Creando tenant automáticamente: {identificador}")
+            logger.info("🆕 Creando tenant automáticamente: %s", identificador)
             
             # 1. Obtener siguiente ID disponible
             siguiente_id = self.obtener_siguiente_panaderia_id()
@@ -181,14 +256,14 @@ class GestorTenants:
             plantilla = os.path.join(self.databases_dir, "tenant_plantilla.db")
             
             if not Path(plantilla).exists():
-                print(f"❌ Plantilla no encontrada: {plantilla}")
+                logger.error("❌ Plantilla no encontrada: %s", plantilla)
                 return None
             
             # Copiar plantilla
-            shutil.copy2(plantilla, destino)
+            copiar_bd(plantilla, destino)
             
             # Configurar tenant
-            conn = sqlite3.connect(destino)
+            conn = conectar_sqlite(destino)
             cursor = conn.cursor()
             
             # Configurar panadería según columnas reales
@@ -216,12 +291,12 @@ class GestorTenants:
                     sql = f"INSERT INTO configuracion_panaderia ({columnas_sql}) VALUES (?, ?)"
                 
                 cursor.execute(sql, (siguiente_id, f"Panadería {identificador}"))
-                print(f"   ✅ configuracion_panaderia: ID {siguiente_id}")
+                logger.info("✅ configuracion_panaderia: ID %s", siguiente_id)
             
             # Configurar consecutivo POS
             cursor.execute("DELETE FROM consecutivos_pos")
             cursor.execute("INSERT INTO consecutivos_pos (panaderia_id, numero_actual) VALUES (?, 0)", (siguiente_id,))
-            print(f"   ✅ consecutivos_pos: ID {siguiente_id}")
+            logger.info("✅ consecutivos_pos: ID %s", siguiente_id)
             
             # Configurar tabla panaderias si existe (opcional)
             try:
@@ -229,15 +304,15 @@ class GestorTenants:
                 if cursor.fetchone():
                     cursor.execute("DELETE FROM panaderias")
                     cursor.execute("INSERT INTO panaderias (id, nombre) VALUES (?, ?)", (siguiente_id, f"Panadería {identificador}"))
-                    print(f"   ✅ panaderias: ID {siguiente_id}")
+                    logger.info("✅ panaderias: ID %s", siguiente_id)
             except Exception as e:
-                print(f"   ⚠️  panaderias: {e}")
+                logger.warning("⚠️  panaderias: %s", e)
             
             conn.commit()
             conn.close()
             
             # 3. Registrar en tenant_master.db
-            conn_master = sqlite3.connect(self.tenant_master_db)
+            conn_master = conectar_sqlite(self.tenant_master_db)
             cursor_master = conn_master.cursor()
             
             cursor_master.execute('''
@@ -247,8 +322,9 @@ class GestorTenants:
             
             conn_master.commit()
             conn_master.close()
+            directorio_tenants.invalidar()
             
-            print(f"✅ Tenant creado automáticamente: {identificador} (ID: {siguiente_id})")
+            logger.info("✅ Tenant creado automáticamente: %s (ID: %s)", identificador, siguiente_id)
             
             return {
                 'id': siguiente_id,
@@ -260,12 +336,11 @@ class GestorTenants:
             }
             
         except Exception as e:
-            print(f"❌ Error creando tenant automático: {e}")
+            logger.error("❌ Error creando tenant automático: %s", e)
             # Intentar limpiar archivo corrupto
             try:
-                if os.path.exists(destino):
-                    os.remove(destino)
-                    print(f"🗑️  Limpiado archivo corrupto: {destino}")
+                if eliminar_bd(destino):
+                    logger.info("🗑️  Limpiado archivo corrupto: %s", destino)
             except:
                 pass
             return None
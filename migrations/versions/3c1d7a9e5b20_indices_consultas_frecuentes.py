@@ -0,0 +1,44 @@
+"""Índices compuestos para las consultas frecuentes (tenant + fecha y joins de detalle_venta)
+
+Revision ID: 3c1d7a9e5b20
+Revises:
+Create Date: 2026-10-17 21:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1d7a9e5b20'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (nombre, tabla, columnas) - los mismos declarados en __table_args__ de models.py
+INDICES = [
+    ('ix_ventas_panaderia_fecha', 'ventas', ['panaderia_id', 'fecha_hora']),
+    ('ix_detalle_venta_venta', 'detalle_venta', ['venta_id']),
+    ('ix_detalle_venta_producto', 'detalle_venta', ['producto_id']),
+    ('ix_detalle_venta_producto_externo', 'detalle_venta', ['producto_externo_id']),
+    ('ix_pagos_individuales_panaderia_fecha', 'pagos_individuales', ['panaderia_id', 'fecha_pago']),
+    ('ix_registros_diarios_panaderia_fecha', 'registros_diarios', ['panaderia_id', 'fecha']),
+    ('ix_depositos_bancarios_panaderia_fecha', 'depositos_bancarios', ['panaderia_id', 'fecha_deposito']),
+    ('ix_ordenes_produccion_panaderia_fecha', 'ordenes_produccion', ['panaderia_id', 'fecha_produccion']),
+]
+
+
+def upgrade():
+    # Las BD de tenants se crearon desde plantillas distintas: se omiten las tablas que no existan
+    tablas = set(sa.inspect(op.get_bind()).get_table_names())
+    for nombre, tabla, columnas in INDICES:
+        if tabla in tablas:
+            op.create_index(nombre, tabla, columnas, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    tablas = set(sa.inspect(op.get_bind()).get_table_names())
+    for nombre, tabla, columnas in reversed(INDICES):
+        if tabla in tablas:
+            op.drop_index(nombre, table_name=tabla, if_exists=True)
@@ -0,0 +1,59 @@
+"""Resumen de ventas diarias (ventas_diarias) por panadería, fecha de negocio y método de pago
+
+Revision ID: 5a7c2e9d4b61
+Revises: 8e4b2f6a1c93
+Create Date: 2026-10-17 23:00:00.000000
+
+registrar_venta la mantiene dentro de la transacción de cada venta; aquí se crea y se
+llena con el histórico de ventas. Las ventas sin método de pago (columna nullable) se
+resumen como 'transferencia', el default de Venta.metodo_pago.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7c2e9d4b61'
+down_revision = '8e4b2f6a1c93'
+branch_labels = None
+depends_on = None
+
+
+RELLENO = """
+INSERT INTO ventas_diarias (panaderia_id, fecha, metodo_pago, cantidad_ventas, total_ventas,
+                            cantidad_donaciones, fecha_actualizacion)
+SELECT panaderia_id, fecha_negocio, COALESCE(metodo_pago, 'transferencia'),
+       SUM(CASE WHEN es_donacion THEN 0 ELSE 1 END),
+       SUM(CASE WHEN es_donacion THEN 0 ELSE total END),
+       SUM(CASE WHEN es_donacion THEN 1 ELSE 0 END),
+       CURRENT_TIMESTAMP
+FROM ventas
+WHERE fecha_negocio IS NOT NULL
+GROUP BY panaderia_id, fecha_negocio, COALESCE(metodo_pago, 'transferencia')
+"""
+
+
+def upgrade():
+    tablas = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'ventas_diarias' in tablas:
+        return
+
+    op.create_table(
+        'ventas_diarias',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('panaderia_id', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.Date(), nullable=False),
+        sa.Column('metodo_pago', sa.String(50), nullable=False),
+        sa.Column('cantidad_ventas', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_ventas', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('cantidad_donaciones', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('fecha_actualizacion', sa.DateTime()),
+        sa.UniqueConstraint('panaderia_id', 'fecha', 'metodo_pago', name='uq_ventas_diarias_dia_metodo'),
+    )
+
+    if 'ventas' in tablas:
+        op.execute(RELLENO)
+
+
+def downgrade():
+    op.drop_table('ventas_diarias', if_exists=True)
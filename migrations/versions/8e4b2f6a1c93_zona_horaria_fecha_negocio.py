@@ -0,0 +1,120 @@
+"""Zona horaria por panadería, hora UTC y fecha de negocio en ventas, órdenes de producción y pagos
+
+Revision ID: 8e4b2f6a1c93
+Revises: 3c1d7a9e5b20
+Create Date: 2026-10-17 22:10:00.000000
+
+Los registros existentes guardan la hora local sin zona (registrar_venta usaba la hora
+de Colombia, el resto datetime.now()); el relleno la interpreta en la zona de cada
+panadería para calcular la hora UTC y la fecha de negocio.
+"""
+from alembic import op
+import pytz
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b2f6a1c93'
+down_revision = '3c1d7a9e5b20'
+branch_labels = None
+depends_on = None
+
+
+ZONA_HORARIA_POR_DEFECTO = 'America/Bogota'
+TAMANO_LOTE = 5000
+
+COLUMNAS = [
+    ('configuracion_panaderia', 'zona_horaria', sa.String(50)),
+    ('ventas', 'fecha_hora_utc', sa.DateTime()),
+    ('ventas', 'fecha_negocio', sa.Date()),
+    ('ordenes_produccion', 'fecha_fin_utc', sa.DateTime()),
+    ('ordenes_produccion', 'fecha_negocio', sa.Date()),
+    ('pagos_individuales', 'fecha_registro_utc', sa.DateTime()),
+]
+
+INDICES = [
+    ('ix_ventas_panaderia_fecha_negocio', 'ventas', ['panaderia_id', 'fecha_negocio']),
+    ('ix_ordenes_produccion_panaderia_fecha_negocio', 'ordenes_produccion', ['panaderia_id', 'fecha_negocio']),
+]
+
+# (tabla, hora local, hora UTC, fecha de negocio o None)
+RELLENOS = [
+    ('ventas', 'fecha_hora', 'fecha_hora_utc', 'fecha_negocio'),
+    ('ordenes_produccion', 'fecha_fin', 'fecha_fin_utc', 'fecha_negocio'),
+    ('pagos_individuales', 'fecha_registro', 'fecha_registro_utc', None),
+]
+
+
+def _zonas_por_panaderia(conexion):
+    """{panaderia_id: zona pytz} de configuracion_panaderia (las vacías usan la zona por defecto)"""
+    config = sa.table('configuracion_panaderia', sa.column('panaderia_id'), sa.column('zona_horaria'))
+    zonas = {}
+    for panaderia_id, nombre in conexion.execute(sa.select(config.c.panaderia_id, config.c.zona_horaria)):
+        if nombre and nombre in pytz.all_timezones_set:
+            zonas[panaderia_id] = pytz.timezone(nombre)
+    return zonas
+
+
+def _rellenar(conexion, tabla, col_local, col_utc, col_fecha, zonas):
+    columnas = [sa.column('id', sa.Integer), sa.column('panaderia_id', sa.Integer),
+                sa.column(col_local, sa.DateTime), sa.column(col_utc, sa.DateTime)]
+    if col_fecha:
+        columnas.append(sa.column(col_fecha, sa.Date))
+    t = sa.table(tabla, *columnas)
+
+    valores = {col_utc: sa.bindparam('_utc')}
+    if col_fecha:
+        valores[col_fecha] = sa.bindparam('_fecha')
+    actualizar = sa.update(t).where(t.c.id == sa.bindparam('_id')).values(valores)
+
+    zona_defecto = pytz.timezone(ZONA_HORARIA_POR_DEFECTO)
+    ultimo_id = 0
+    while True:
+        filas = conexion.execute(
+            sa.select(t.c.id, t.c.panaderia_id, t.c[col_local])
+            .where(t.c.id > ultimo_id, t.c[col_utc].is_(None), t.c[col_local].isnot(None))
+            .order_by(t.c.id)
+            .limit(TAMANO_LOTE)
+        ).fetchall()
+        if not filas:
+            break
+
+        lote = []
+        for id_, panaderia_id, local in filas:
+            zona = zonas.get(panaderia_id, zona_defecto)
+            utc = zona.localize(local).astimezone(pytz.utc).replace(tzinfo=None)
+            lote.append({'_id': id_, '_utc': utc, '_fecha': local.date()})
+        conexion.execute(actualizar, lote)
+        ultimo_id = filas[-1][0]
+
+
+def upgrade():
+    conexion = op.get_bind()
+    inspector = sa.inspect(conexion)
+    tablas = set(inspector.get_table_names())
+
+    for tabla, columna, tipo in COLUMNAS:
+        if tabla in tablas and columna not in {c['name'] for c in inspector.get_columns(tabla)}:
+            op.add_column(tabla, sa.Column(columna, tipo, nullable=True))
+
+    for nombre, tabla, columnas in INDICES:
+        if tabla in tablas:
+            op.create_index(nombre, tabla, columnas, unique=False, if_not_exists=True)
+
+    zonas = _zonas_por_panaderia(conexion) if 'configuracion_panaderia' in tablas else {}
+    for tabla, col_local, col_utc, col_fecha in RELLENOS:
+        if tabla in tablas:
+            _rellenar(conexion, tabla, col_local, col_utc, col_fecha, zonas)
+
+
+def downgrade():
+    tablas = set(sa.inspect(op.get_bind()).get_table_names())
+
+    for nombre, tabla, columnas in reversed(INDICES):
+        if tabla in tablas:
+            op.drop_index(nombre, table_name=tabla, if_exists=True)
+
+    for tabla, columna, tipo in reversed(COLUMNAS):
+        if tabla in tablas:
+            with op.batch_alter_table(tabla) as batch_op:
+                batch_op.drop_column(columna)
@@ -0,0 +1,45 @@
+"""Auditoría de los bloques de consecutivos POS (lotes_consecutivos_pos)
+
+Revision ID: a63d9b2e5f17
+Revises: f2a8c6d1b374
+Create Date: 2026-10-18 10:30:00.000000
+
+secuencia_pos registra aquí cada bloque de consecutivos que arrienda un proceso. Las BD
+donde la tabla ya existe (la creaba secuencia_pos en el primer arrendamiento) pierden
+la columna terminal, que nunca se llegó a escribir.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a63d9b2e5f17'
+down_revision = 'f2a8c6d1b374'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if 'lotes_consecutivos_pos' not in inspector.get_table_names():
+        op.create_table(
+            'lotes_consecutivos_pos',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('panaderia_id', sa.Integer(), nullable=False, server_default='1'),
+            sa.Column('numero_inicio', sa.Integer(), nullable=False),
+            sa.Column('numero_fin', sa.Integer(), nullable=False),
+            sa.Column('proceso', sa.String(100)),
+            sa.Column('fecha_asignacion', sa.DateTime()),
+        )
+    elif 'terminal' in {c['name'] for c in inspector.get_columns('lotes_consecutivos_pos')}:
+        with op.batch_alter_table('lotes_consecutivos_pos') as batch_op:
+            batch_op.drop_column('terminal')
+
+    op.create_index('ix_lotes_consecutivos_pos_panaderia_inicio', 'lotes_consecutivos_pos',
+                    ['panaderia_id', 'numero_inicio'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_lotes_consecutivos_pos_panaderia_inicio', table_name='lotes_consecutivos_pos', if_exists=True)
+    op.drop_table('lotes_consecutivos_pos', if_exists=True)
@@ -0,0 +1,72 @@
+"""Resumen de ventas por producto y fecha de negocio (ventas_producto_diarias)
+
+Revision ID: b91e4c3f7a28
+Revises: 5a7c2e9d4b61
+Create Date: 2026-10-17 23:40:00.000000
+
+registrar_venta la mantiene dentro de la transacción de cada venta; aquí se crea y se
+llena con el histórico de detalle_venta. El costo histórico usa el costo actual de cada
+producto (precio_compra de externos, costo_compra de productos).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b91e4c3f7a28'
+down_revision = '5a7c2e9d4b61'
+branch_labels = None
+depends_on = None
+
+
+RELLENO = """
+INSERT INTO ventas_producto_diarias (panaderia_id, fecha, clave_producto, producto_id, producto_externo_id,
+                                     cantidad, cantidad_donada, ingresos, costo, fecha_actualizacion)
+SELECT v.panaderia_id, v.fecha_negocio,
+       CASE WHEN d.producto_externo_id IS NOT NULL THEN 'E:' || d.producto_externo_id
+            ELSE 'P:' || d.producto_id END AS clave,
+       MAX(d.producto_id), MAX(d.producto_externo_id),
+       SUM(d.cantidad),
+       SUM(CASE WHEN v.es_donacion THEN d.cantidad ELSE 0 END),
+       SUM(CASE WHEN v.es_donacion THEN 0 ELSE d.cantidad * d.precio_unitario END),
+       SUM(d.cantidad * COALESCE(pe.precio_compra, p.costo_compra, 0)),
+       CURRENT_TIMESTAMP
+FROM detalle_venta d
+JOIN ventas v ON v.id = d.venta_id
+LEFT JOIN productos p ON p.id = d.producto_id
+LEFT JOIN productos_externos pe ON pe.id = d.producto_externo_id
+WHERE v.fecha_negocio IS NOT NULL
+GROUP BY v.panaderia_id, v.fecha_negocio, clave
+"""
+
+
+def upgrade():
+    tablas = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'ventas_producto_diarias' in tablas:
+        return
+
+    op.create_table(
+        'ventas_producto_diarias',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('panaderia_id', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.Date(), nullable=False),
+        sa.Column('clave_producto', sa.String(20), nullable=False),
+        sa.Column('producto_id', sa.Integer(), sa.ForeignKey('productos.id'), nullable=True),
+        sa.Column('producto_externo_id', sa.Integer(), sa.ForeignKey('productos_externos.id'), nullable=True),
+        sa.Column('cantidad', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cantidad_donada', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('ingresos', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('costo', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('fecha_actualizacion', sa.DateTime()),
+        sa.UniqueConstraint('panaderia_id', 'fecha', 'clave_producto', name='uq_ventas_producto_diarias_dia_producto'),
+    )
+    op.create_index('ix_ventas_producto_diarias_producto_fecha', 'ventas_producto_diarias',
+                    ['panaderia_id', 'clave_producto', 'fecha'], unique=False)
+
+    if {'ventas', 'detalle_venta', 'productos', 'productos_externos'} <= tablas:
+        op.execute(RELLENO)
+
+
+def downgrade():
+    op.drop_index('ix_ventas_producto_diarias_producto_fecha', table_name='ventas_producto_diarias', if_exists=True)
+    op.drop_table('ventas_producto_diarias', if_exists=True)
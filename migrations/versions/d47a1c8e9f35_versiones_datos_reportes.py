@@ -0,0 +1,63 @@
+"""Versiones de datos por tabla, panadería y fecha (versiones_datos) con sus triggers
+
+Revision ID: d47a1c8e9f35
+Revises: b91e4c3f7a28
+Create Date: 2026-10-18 00:20:00.000000
+
+Los triggers incrementan la versión del día de la fila en cada escritura de ventas,
+registros_diarios y pagos_individuales; la caché de reportes PDF (cache_reportes.py)
+arma su clave con ellas. Sin relleno: la caché empieza vacía.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd47a1c8e9f35'
+down_revision = 'b91e4c3f7a28'
+branch_labels = None
+depends_on = None
+
+
+# Las mismas de models.TABLAS_VERSIONADAS
+TABLAS_VERSIONADAS = [
+    ('ventas', 'fecha_negocio'),
+    ('registros_diarios', 'fecha'),
+    ('pagos_individuales', 'fecha_pago'),
+]
+
+OPERACIONES = [('insert', 'INSERT', ['NEW']), ('update', 'UPDATE', ['OLD', 'NEW']), ('delete', 'DELETE', ['OLD'])]
+
+
+def _incrementar(tabla, columna, fila):
+    return (f"INSERT INTO versiones_datos (tabla, panaderia_id, fecha, version) "
+            f"VALUES ('{tabla}', {fila}.panaderia_id, IFNULL({fila}.{columna}, ''), 1) "
+            f"ON CONFLICT (tabla, panaderia_id, fecha) DO UPDATE SET version = version + 1;")
+
+
+def upgrade():
+    tablas = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'versiones_datos' not in tablas:
+        op.create_table(
+            'versiones_datos',
+            sa.Column('tabla', sa.String(50), primary_key=True),
+            sa.Column('panaderia_id', sa.Integer(), primary_key=True),
+            sa.Column('fecha', sa.String(10), primary_key=True),
+            sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        )
+
+    for tabla, columna in TABLAS_VERSIONADAS:
+        if tabla not in tablas:
+            continue
+        for sufijo, operacion, filas in OPERACIONES:
+            cuerpo = ' '.join(_incrementar(tabla, columna, fila) for fila in filas)
+            op.execute(f"CREATE TRIGGER IF NOT EXISTS trg_versiones_{tabla}_{sufijo} "
+                       f"AFTER {operacion} ON {tabla} BEGIN {cuerpo} END")
+
+
+def downgrade():
+    for tabla, _ in reversed(TABLAS_VERSIONADAS):
+        for sufijo, _, _ in OPERACIONES:
+            op.execute(f"DROP TRIGGER IF EXISTS trg_versiones_{tabla}_{sufijo}")
+    op.drop_table('versiones_datos', if_exists=True)
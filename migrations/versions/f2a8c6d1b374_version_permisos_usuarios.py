@@ -0,0 +1,32 @@
+"""Versión de los permisos de cada usuario (usuarios.permisos_version)
+
+Revision ID: f2a8c6d1b374
+Revises: d47a1c8e9f35
+Create Date: 2026-10-18 09:40:00.000000
+
+guardar_permisos y editar_usuario la incrementan; cache_permisos la compara con la de
+sus permisos compilados, así un cambio invalida la caché en todos los procesos.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8c6d1b374'
+down_revision = 'd47a1c8e9f35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'usuarios' not in inspector.get_table_names():
+        return
+    if 'permisos_version' not in {c['name'] for c in inspector.get_columns('usuarios')}:
+        op.add_column('usuarios', sa.Column('permisos_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    if 'usuarios' in sa.inspect(op.get_bind()).get_table_names():
+        with op.batch_alter_table('usuarios') as batch_op:
+            batch_op.drop_column('permisos_version')
@@ -3,12 +3,16 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, timedelta
 import math
-from sqlalchemy import func, extract
+from sqlalchemy import func, extract, event, inspect as sa_inspect, text
 from werkzeug.security import generate_password_hash, check_password_hash 
 from sqlalchemy.orm import backref
+from tenant_engines import SesionTenant
+from utilidades.rangos_fechas import filtro_fechas, marcas_tiempo, hoy_tenant
+from cache_permisos import cache_permisos
 
 # SOLO esta línea - elimina cualquier otra db
-db = SQLAlchemy()
+# La sesión elige el engine del tenant de la petición (ver tenant_engines.py)
+db = SQLAlchemy(session_options={'class_': SesionTenant})
 
 
 # 🆕 SISTEMA DE ROLES Y PERMISOS - VERSIÓN CORREGIDA
@@ -29,6 +33,7 @@ class Usuario(UserMixin, db.Model):
     fecha_ultimo_acceso = db.Column(db.DateTime)
     sucursal_id = db.Column(db.Integer, db.ForeignKey('sucursales.id'), nullable=True)  # Para multi-sucursal futuro
     panaderia_id = db.Column(db.Integer, db.ForeignKey('configuracion_panaderia.id'), nullable=False, default=1)
+    permisos_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Ver cache_permisos
     
     # 🆕 RELACIÓN CON PERMISOS PERSONALIZADOS
     permisos_personalizados = db.relationship('PermisoUsuario', backref='usuario', lazy=True, cascade='all, delete-orphan')
@@ -43,46 +48,30 @@ class Usuario(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
     
    # 🆕 MÉTODOS ACTUALIZADOS PARA GESTIÓN DE PERMISOS
+    def permisos_compilados(self):
+        """Permisos efectivos (rol + personalizados) compilados y en caché"""
+        return cache_permisos.obtener(
+            self,
+            lambda: db.session.query(
+                PermisoUsuario.modulo, PermisoUsuario.accion, PermisoUsuario.permitido
+            ).filter(PermisoUsuario.usuario_id == self.id).all(),
+            ROLES_PERMISOS.get(self.rol, {})
+        )
+    
+    def incrementar_version_permisos(self):
+        """Invalidar los permisos compilados en todos los procesos (se aplica con el commit)"""
+        # Incremento en SQL: dos ediciones simultáneas no pierden ninguna de las dos
+        self.permisos_version = Usuario.permisos_version + 1
+    
     def tiene_permiso(self, modulo, accion):
         """Verificar si usuario tiene permiso para acción en módulo"""
-        # 1. Administrador tiene acceso completo
-        if self.rol == 'admin_cliente':
-            return True
-            
-        # 2. Verificar permisos personalizados primero
-        permiso_personalizado = PermisoUsuario.query.filter_by(
-            usuario_id=self.id, 
-            modulo=modulo, 
-            accion=accion
-        ).first()
-        
-        if permiso_personalizado:
-            return permiso_personalizado.permitido
-        
-        # 3. Fallback a permisos del rol
-        permisos_rol = ROLES_PERMISOS.get(self.rol, {})
-        acciones_permitidas = permisos_rol.get(modulo, [])
-        
-        return accion in acciones_permitidas
+        # Administrador: acceso completo. Resto: permiso personalizado primero,
+        # luego el del rol (ver cache_permisos.compilar_permisos)
+        return self.permisos_compilados().permite(modulo, accion)
     
     def puede_acceder_modulo(self, modulo):
         """Verificar si usuario puede acceder a un módulo completo"""
-        if self.rol == 'admin_cliente':
-            return True
-            
-        # Verificar permisos personalizados
-        tiene_permiso_personal = PermisoUsuario.query.filter_by(
-            usuario_id=self.id, 
-            modulo=modulo, 
-            permitido=True
-        ).first()
-        
-        if tiene_permiso_personal:
-            return True
-            
-        # Verificar permisos del rol
-        permisos_rol = ROLES_PERMISOS.get(self.rol, {})
-        return modulo in permisos_rol
+        return self.permisos_compilados().accede(modulo)
     
     def obtener_modulos_permitidos(self):
         """Obtener lista de módulos a los que tiene acceso"""
@@ -277,6 +266,9 @@ class ConfiguracionPanaderia(db.Model):
     fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     ultimo_cierre = db.Column(db.Date)
+    
+    # 🕒 ZONA HORARIA DE LA PANADERÍA (nombre IANA; vacío = ZONA_HORARIA_POR_DEFECTO)
+    zona_horaria = db.Column(db.String(50))
     sistema_activo = db.Column(db.Boolean, default=True)
     
     def __repr__(self):
@@ -934,8 +926,14 @@ class Cliente(db.Model):
 
 class Venta(db.Model):
     __tablename__ = 'ventas'
+    __table_args__ = (
+        db.Index('ix_ventas_panaderia_fecha', 'panaderia_id', 'fecha_hora'),
+        db.Index('ix_ventas_panaderia_fecha_negocio', 'panaderia_id', 'fecha_negocio'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    fecha_hora = db.Column(db.DateTime, default=datetime.now) 
+    fecha_hora = db.Column(db.DateTime, default=datetime.now)  # Hora local de la panadería
+    fecha_hora_utc = db.Column(db.DateTime)                    # 🕒 Mismo instante en UTC
+    fecha_negocio = db.Column(db.Date)                         # 🕒 Día local de la venta (reportes diarios)
     total = db.Column(db.Float, nullable=False)
     metodo_pago = db.Column(db.String(20), nullable=False)  # 'efectivo', 'transferencia'
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
@@ -965,6 +963,11 @@ class Venta(db.Model):
     
 class DetalleVenta(db.Model):
     __tablename__ = 'detalle_venta'
+    __table_args__ = (
+        db.Index('ix_detalle_venta_venta', 'venta_id'),
+        db.Index('ix_detalle_venta_producto', 'producto_id'),
+        db.Index('ix_detalle_venta_producto_externo', 'producto_externo_id'),
+    )
     panaderia_id = db.Column(db.Integer, nullable=False, default=1)
     id = db.Column(db.Integer, primary_key=True)
     venta_id = db.Column(db.Integer, db.ForeignKey('ventas.id'), nullable=False)
@@ -982,6 +985,13 @@ class DetalleVenta(db.Model):
     producto = db.relationship('Producto', backref='detalles_venta')
     producto_externo = db.relationship('ProductoExterno', backref='detalles_venta_externa')
     
+    @property
+    def clave_producto(self):
+        """Clave tipada del producto vendido ('P:123' / 'E:45'), la misma del carrito POS"""
+        if self.producto_externo_id:
+            return f"E:{self.producto_externo_id}"
+        return f"P:{self.producto_id}"
+    
 class Compra(db.Model):
     __tablename__ = 'compras'
     panaderia_id = db.Column(db.Integer, nullable=False, default=1)
@@ -1024,6 +1034,10 @@ class RecetaIngrediente(db.Model):
 
 class OrdenProduccion(db.Model):
     __tablename__ = 'ordenes_produccion'
+    __table_args__ = (
+        db.Index('ix_ordenes_produccion_panaderia_fecha', 'panaderia_id', 'fecha_produccion'),
+        db.Index('ix_ordenes_produccion_panaderia_fecha_negocio', 'panaderia_id', 'fecha_negocio'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     receta_id = db.Column(db.Integer, db.ForeignKey('recetas.id'), nullable=False)
@@ -1035,6 +1049,8 @@ class OrdenProduccion(db.Model):
     
     fecha_inicio = db.Column(db.DateTime)
     fecha_fin = db.Column(db.DateTime)
+    fecha_fin_utc = db.Column(db.DateTime)   # 🕒 Fin de la producción en UTC
+    fecha_negocio = db.Column(db.Date)       # 🕒 Día local en que se completó
     observaciones = db.Column(db.Text)
     costo_real = db.Column(db.Float, default=0)
     stock_generado = db.Column(db.Boolean, default=False)
@@ -1104,7 +1120,7 @@ class OrdenProduccion(db.Model):
         """Marca la orden como completada, actualiza stock y descuenta ingredientes"""
         if self.estado == 'EN_PRODUCCION':
             self.estado = 'COMPLETADA'
-            self.fecha_fin = datetime.now()
+            self.fecha_fin, self.fecha_fin_utc, self.fecha_negocio = marcas_tiempo(self.panaderia_id)
             
             print(f"🔍 DEBUG: Completando producción - Receta: {self.receta.nombre if self.receta else 'N/A'}")
             print(f"🔍 DEBUG: Cantidad a producir: {self.cantidad_producir}")
@@ -1343,6 +1359,104 @@ class JornadaVentas(db.Model):
     def __repr__(self):
         return f'<Jornada {self.fecha} - {self.estado}>'
 
+class VentaDiaria(db.Model):
+    """Resumen de ventas por panadería, fecha de negocio y método de pago (ver resumen_ventas.py)"""
+    __tablename__ = 'ventas_diarias'
+    __table_args__ = (
+        db.UniqueConstraint('panaderia_id', 'fecha', 'metodo_pago', name='uq_ventas_diarias_dia_metodo'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    panaderia_id = db.Column(db.Integer, nullable=False, default=1)
+    fecha = db.Column(db.Date, nullable=False)             # Venta.fecha_negocio
+    metodo_pago = db.Column(db.String(50), nullable=False)
+    
+    cantidad_ventas = db.Column(db.Integer, nullable=False, default=0)     # Sin donaciones
+    total_ventas = db.Column(db.Float, nullable=False, default=0)
+    cantidad_donaciones = db.Column(db.Integer, nullable=False, default=0)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def ticket_promedio(self):
+        return self.total_ventas / self.cantidad_ventas if self.cantidad_ventas else 0
+    
+    def __repr__(self):
+        return f'<VentaDiaria {self.fecha} {self.metodo_pago}: {self.cantidad_ventas} - ${self.total_ventas}>'
+
+class VentaProductoDiaria(db.Model):
+    """Unidades, ingresos y costo vendidos por producto y fecha de negocio (ver resumen_ventas.py)"""
+    __tablename__ = 'ventas_producto_diarias'
+    __table_args__ = (
+        db.UniqueConstraint('panaderia_id', 'fecha', 'clave_producto', name='uq_ventas_producto_diarias_dia_producto'),
+        db.Index('ix_ventas_producto_diarias_producto_fecha', 'panaderia_id', 'clave_producto', 'fecha'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    panaderia_id = db.Column(db.Integer, nullable=False, default=1)
+    fecha = db.Column(db.Date, nullable=False)                       # Venta.fecha_negocio
+    clave_producto = db.Column(db.String(20), nullable=False)        # 'P:123' / 'E:45' (DetalleVenta.clave_producto)
+    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id'), nullable=True)
+    producto_externo_id = db.Column(db.Integer, db.ForeignKey('productos_externos.id'), nullable=True)
+    
+    cantidad = db.Column(db.Integer, nullable=False, default=0)      # Incluye donaciones (salidas de vitrina)
+    cantidad_donada = db.Column(db.Integer, nullable=False, default=0)
+    ingresos = db.Column(db.Float, nullable=False, default=0)        # Sin donaciones
+    costo = db.Column(db.Float, nullable=False, default=0)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<VentaProductoDiaria {self.fecha} {self.clave_producto}: {self.cantidad}>'
+
+class VersionDatos(db.Model):
+    """
+    Versión de los datos de una tabla por panadería y fecha. La incrementan triggers de
+    SQLite en cada INSERT/UPDATE/DELETE de TABLAS_VERSIONADAS (también los hechos con
+    sqlite3 directo) y las reconstrucciones de los resúmenes de resumen_ventas;
+    cache_reportes.py la usa para saber si un período cambió.
+    """
+    __tablename__ = 'versiones_datos'
+    
+    tabla = db.Column(db.String(50), primary_key=True)
+    panaderia_id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.String(10), primary_key=True)     # 'YYYY-MM-DD' de la fila ('' si no tiene)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<VersionDatos {self.tabla} {self.fecha}: {self.version}>'
+
+# (tabla, columna de fecha) cuyas escrituras versionan los triggers de versiones_datos
+TABLAS_VERSIONADAS = (
+    ('ventas', 'fecha_negocio'),
+    ('registros_diarios', 'fecha'),
+    ('pagos_individuales', 'fecha_pago'),
+)
+
+def sentencias_triggers_versiones(tabla, columna):
+    """CREATE TRIGGER de INSERT, UPDATE y DELETE que incrementan versiones_datos"""
+    def incrementar(fila):
+        return (f"INSERT INTO versiones_datos (tabla, panaderia_id, fecha, version) "
+                f"VALUES ('{tabla}', {fila}.panaderia_id, IFNULL({fila}.{columna}, ''), 1) "
+                f"ON CONFLICT (tabla, panaderia_id, fecha) DO UPDATE SET version = version + 1;")
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_versiones_{tabla}_insert AFTER INSERT ON {tabla} "
+        f"BEGIN {incrementar('NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_versiones_{tabla}_update AFTER UPDATE ON {tabla} "
+        f"BEGIN {incrementar('OLD')} {incrementar('NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_versiones_{tabla}_delete AFTER DELETE ON {tabla} "
+        f"BEGIN {incrementar('OLD')} END",
+    ]
+
+@event.listens_for(db.metadata, 'after_create')
+def _crear_triggers_versiones(target, connection, **kw):
+    # db.create_all no crea triggers: BD nuevas sin migraciones también quedan versionadas
+    tablas = set(sa_inspect(connection).get_table_names())
+    if 'versiones_datos' not in tablas:
+        return
+    for tabla, columna in TABLAS_VERSIONADAS:
+        if tabla in tablas:
+            for sentencia in sentencias_triggers_versiones(tabla, columna):
+                connection.execute(text(sentencia))
+
 class CierreDiario(db.Model):
     """Registro de cierres diarios"""
     __tablename__ = 'cierres_diarios'
@@ -1393,27 +1507,18 @@ class PermisoUsuario(db.Model):
 # FUNCIONES DE APOYO PARA ANÁLISIS ML (agregar al final de models.py)
 # =============================================
 
-def calcular_tendencia_ventas(fecha_inicio, fecha_fin):
-    """Calcula tendencia de ventas usando datos históricos"""
+def calcular_tendencia_ventas(fecha_inicio, fecha_fin, panaderia_id=None):
+    """Calcula tendencia de ventas usando datos históricos (resumen ventas_diarias)"""
+    from resumen_ventas import totales_periodo
     try:
         # Período anterior para comparación (misma duración)
         dias_periodo = (fecha_fin - fecha_inicio).days + 1
         fecha_inicio_anterior = fecha_inicio - timedelta(days=dias_periodo)
         fecha_fin_anterior = fecha_inicio - timedelta(days=1)
         
-        # Ventas período actual
-        ventas_actual = Venta.query.filter(
-            db.func.date(Venta.fecha_hora) >= fecha_inicio,
-            db.func.date(Venta.fecha_hora) <= fecha_fin
-        ).all()
-        total_actual = sum(venta.total for venta in ventas_actual)
-        
-        # Ventas período anterior
-        ventas_anterior = Venta.query.filter(
-            db.func.date(Venta.fecha_hora) >= fecha_inicio_anterior,
-            db.func.date(Venta.fecha_hora) <= fecha_fin_anterior
-        ).all()
-        total_anterior = sum(venta.total for venta in ventas_anterior)
+        # Ventas período actual y anterior
+        total_actual = totales_periodo(panaderia_id, fecha_inicio, fecha_fin).total_ventas
+        total_anterior = totales_periodo(panaderia_id, fecha_inicio_anterior, fecha_fin_anterior).total_ventas
         
         if total_anterior > 0:
             return ((total_actual - total_anterior) / total_anterior) * 100
@@ -1423,55 +1528,17 @@ def calcular_tendencia_ventas(fecha_inicio, fecha_fin):
         print(f"Error calculando tendencia: {e}")
         return 0
 
-def analizar_productos_periodo(detalles):
-    """Análisis básico de productos en un período (sin categorías)"""
-    productos = {}
-    
-    for detalle in detalles:
-        try:
-            if detalle.producto:
-                key = f"P{detalle.producto.id}"
-                nombre = detalle.producto.nombre
-                categoria = "Producción"
-            elif detalle.producto_externo:
-                key = f"E{detalle.producto_externo.id}"
-                nombre = detalle.producto_externo.nombre
-                categoria = "Externo"
-            else:
-                continue
-            
-            if key not in productos:
-                productos[key] = {
-                    'nombre': nombre,
-                    'categoria': categoria,
-                    'cantidad': 0,
-                    'ingresos': 0,
-                    'frecuencia': 0
-                }
-            
-            productos[key]['cantidad'] += detalle.cantidad
-            productos[key]['ingresos'] += detalle.cantidad * detalle.precio_unitario
-            productos[key]['frecuencia'] += 1
-                
-        except Exception as e:
-            print(f"Error procesando detalle: {e}")
-            continue
-    
-    return productos
-
 def calcular_rotacion_automatica(producto_id):
     """Calcula la rotación automática de un producto basado en ventas históricas"""
+    from resumen_ventas import clave_producto, resumen_productos
     try:
-        # Obtener ventas de los últimos 30 días
-        fecha_inicio = datetime.now() - timedelta(days=30)
-        
-        ventas = DetalleVenta.query.join(Venta).filter(
-            DetalleVenta.producto_id == producto_id,
-            Venta.fecha_hora >= fecha_inicio
-        ).all()
+        # Ventas de los últimos 30 días (resumen ventas_producto_diarias)
+        hoy = hoy_tenant()
+        clave = clave_producto(producto_id)
+        resumen = resumen_productos(None, hoy - timedelta(days=30), hoy, claves=[clave]).get(clave)
         
         # Calcular total vendido en el período
-        total_vendido = sum(detalle.cantidad for detalle in ventas)
+        total_vendido = resumen.cantidad if resumen else 0
         
         # Calcular rotación diaria promedio
         rotacion_diaria = total_vendido / 30.0  # Promedio de 30 días
@@ -1482,91 +1549,21 @@ def calcular_rotacion_automatica(producto_id):
         print(f"Error calculando rotación automática para producto {producto_id}: {e}")
         return 0
     
-def actualizar_rotaciones_automaticas():
-    """Actualiza las rotaciones automáticas para todos los productos activos"""
-    try:
-        productos_activos = Producto.query.filter_by(activo=True).all()
-        actualizaciones = 0
-        
-        for producto in productos_activos:
-            rotacion = calcular_rotacion_automatica(producto.id)
-            
-            # Buscar o crear registro en HistorialRotacionProducto
-            historial = HistorialRotacionProducto.query.filter_by(
-                producto_id=producto.id,
-                fecha=datetime.now().date()
-            ).first()
-            
-            if not historial:
-                historial = HistorialRotacionProducto(
-                    producto_id=producto.id,
-                    fecha=datetime.now().date(),
-                    rotacion_calculada=rotacion,
-                    tipo_calculo='automático'
-                )
-                db.session.add(historial)
-            else:
-                historial.rotacion_calculada = rotacion
-            
-            actualizaciones += 1
-        
-        db.session.commit()
-        return actualizaciones
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error actualizando rotaciones automáticas: {e}")
-        return 0
-
-def calcular_rotacion_automatica_por_nombre(nombre_producto):
-    """Calcula rotación automática por nombre de producto"""
-    try:
-        from app import db
-        # Buscar producto por nombre
-        producto = Producto.query.filter_by(nombre=nombre_producto).first()
-        if producto:
-            return calcular_rotacion_automatica(producto.id)
-        
-        producto_externo = ProductoExterno.query.filter_by(nombre=nombre_producto).first()
-        if producto_externo:
-            # Para productos externos, cálculo simplificado
-            return producto_externo.total_ventas / 30 if producto_externo.total_ventas else 0
-            
-        return 0
-    except Exception as e:
-        print(f"Error calculando rotación para {nombre_producto}: {e}")
-        return 0
-
 def calcular_proyeccion_ventas(producto_id, dias_proyeccion=7):
     """Calcula proyección de ventas usando datos históricos y ML"""
     try:
-        from datetime import datetime, timedelta
-        from sqlalchemy import func
-        from app import db
+        from resumen_ventas import clave_producto, resumen_productos
         
-        # Obtener ventas históricas (últimos 60 días)
-        fecha_inicio = datetime.now().date() - timedelta(days=60)
+        # Ventas históricas (últimos 60 días), ya agrupadas por día en ventas_producto_diarias
+        hoy = hoy_tenant()
+        clave = clave_producto(producto_id)
+        resumen = resumen_productos(None, hoy - timedelta(days=60), hoy, claves=[clave]).get(clave)
         
-        ventas = DetalleVenta.query.join(Venta).filter(
-            DetalleVenta.producto_id == producto_id,
-            Venta.fecha_hora >= fecha_inicio
-        ).all()
-        
-        if not ventas:
+        if not resumen or not resumen.cantidad:
             return {'proyeccion': 0, 'rotacion_actual': 0, 'dias_stock': 999, 'nivel_riesgo': 'BAJO'}
         
-        # Agrupar ventas por día
-        ventas_por_dia = {}
-        for venta in ventas:
-            if venta.venta and venta.venta.fecha_hora:
-                fecha = venta.venta.fecha_hora.date()
-                if fecha not in ventas_por_dia:
-                    ventas_por_dia[fecha] = 0
-                ventas_por_dia[fecha] += venta.cantidad
-        
-        # Calcular promedio y tendencia
-        ventas_diarias = list(ventas_por_dia.values())
-        promedio_ventas = sum(ventas_diarias) / len(ventas_diarias) if ventas_diarias else 0
+        # Promedio por día con ventas
+        promedio_ventas = resumen.promedio_dia_con_ventas
         
         # Proyección simple
         proyeccion = promedio_ventas * dias_proyeccion
@@ -1751,7 +1748,7 @@ def obtener_productos_sin_ventas_recientes(panaderia_id=None, dias=7):
 
 def obtener_jornada_activa():
     """Obtiene o crea la jornada activa del día actual"""
-    hoy = datetime.now().date()
+    hoy = hoy_tenant()
     jornada = JornadaVentas.query.filter_by(fecha=hoy).first()
     
     if not jornada:
@@ -1763,55 +1760,30 @@ def obtener_jornada_activa():
 
 def cerrar_jornada_actual():
     """Cierra la jornada actual y crea registro de cierre"""
-    hoy = datetime.now().date()
+    hoy = hoy_tenant()
     jornada = JornadaVentas.query.filter_by(fecha=hoy, estado='ACTIVA').first()
     
     if not jornada:
         return None, "No hay jornada activa para cerrar"
     
     try:
-        # Obtener ventas del día
-        inicio_dia = datetime.combine(hoy, datetime.min.time())
-        fin_dia = datetime.combine(hoy, datetime.max.time())
-        
-        ventas_dia = Venta.query.filter(
-            Venta.fecha_hora >= inicio_dia,
-            Venta.fecha_hora <= fin_dia
-        ).all()
+        from resumen_ventas import productos_mas_vendidos, totales_periodo
         
-        # Calcular totales
-        total_ventas = sum(venta.total for venta in ventas_dia)
-        total_efectivo = sum(v.total for v in ventas_dia if v.metodo_pago == 'efectivo')
-        total_transferencia = sum(v.total for v in ventas_dia if v.metodo_pago == 'transferencia')
+        # Totales del día desde el resumen diario
+        totales = totales_periodo(None, hoy)
+        total_ventas = totales.total_ventas
+        total_efectivo = totales.total_metodo('efectivo')
+        total_transferencia = totales.total_metodo('transferencia')
         
-        
-        # Obtener productos más vendidos
-        detalles_dia = DetalleVenta.query.join(Venta).filter(
-            Venta.fecha_hora >= inicio_dia,
-            Venta.fecha_hora <= fin_dia
-        ).all()
-        
-        productos_vendidos = {}
-        for detalle in detalles_dia:
-            if detalle.producto:
-                nombre = detalle.producto.nombre
-            elif detalle.producto_externo:
-                nombre = detalle.producto_externo.nombre
-            else:
-                continue
-                
-            if nombre not in productos_vendidos:
-                productos_vendidos[nombre] = 0
-            productos_vendidos[nombre] += detalle.cantidad
-        
-        productos_top = sorted(productos_vendidos.items(), key=lambda x: x[1], reverse=True)[:5]
+        # Productos más vendidos (resumen por producto)
+        productos_top = [
+            (producto['nombre'], producto['cantidad_vendida'])
+            for producto in productos_mas_vendidos(None, hoy, hoy, limite=5)
+        ]
         
         # Calcular comparativa con día anterior
         dia_anterior = hoy - timedelta(days=1)
-        ventas_anterior = Venta.query.filter(
-            db.func.date(Venta.fecha_hora) == dia_anterior
-        ).all()
-        total_anterior = sum(v.total for v in ventas_anterior)
+        total_anterior = totales_periodo(None, dia_anterior).total_ventas
         
         tendencia = 0
         if total_anterior > 0:
@@ -1824,7 +1796,7 @@ def cerrar_jornada_actual():
             total_ventas=total_ventas,
             total_efectivo=total_efectivo,
             
-            total_transacciones=len(ventas_dia),
+            total_transacciones=totales.cantidad_transacciones,
             productos_top=json.dumps(productos_top),
             ventas_dia_anterior=total_anterior,
             tendencia=tendencia
@@ -1850,15 +1822,9 @@ def cerrar_jornada_actual():
 def obtener_ventas_dia(fecha=None):
     """Obtiene ventas de un día específico (hoy por defecto)"""
     if not fecha:
-        fecha = datetime.now().date()
+        fecha = hoy_tenant()
     
-    inicio_dia = datetime.combine(fecha, datetime.min.time())
-    fin_dia = datetime.combine(fecha, datetime.max.time())
-    
-    return Venta.query.filter(
-        Venta.fecha_hora >= inicio_dia,
-        Venta.fecha_hora <= fin_dia
-    ).all()
+    return Venta.query.filter(filtro_fechas(Venta.fecha_negocio, fecha)).all()
 
 def obtener_historial_cierres(limite=30):
     """Obtiene historial de cierres recientes"""
@@ -1871,6 +1837,9 @@ def obtener_historial_cierres(limite=30):
 class RegistroDiario(db.Model):
     """Registro diario simplificado para el usuario"""
     __tablename__ = 'registros_diarios'
+    __table_args__ = (
+        db.Index('ix_registros_diarios_panaderia_fecha', 'panaderia_id', 'fecha'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     panaderia_id = db.Column(db.Integer, nullable=False, default=1)
     fecha = db.Column(db.Date, nullable=False, default=datetime.now().date)
@@ -1954,6 +1923,9 @@ class SaldoBanco(db.Model):
 class DepositoBancario(db.Model):
     """Modelo para registrar depósitos bancarios - 100% MULTI-TENANT"""
     __tablename__ = 'depositos_bancarios'
+    __table_args__ = (
+        db.Index('ix_depositos_bancarios_panaderia_fecha', 'panaderia_id', 'fecha_deposito'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -2004,10 +1976,14 @@ class DepositoBancario(db.Model):
 class PagoIndividual(db.Model): 
     """Registro individual de cada pago"""
     __tablename__ = 'pagos_individuales'
+    __table_args__ = (
+        db.Index('ix_pagos_individuales_panaderia_fecha', 'panaderia_id', 'fecha_pago'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     panaderia_id = db.Column(db.Integer, nullable=False, default=1)
     fecha_registro = db.Column(db.DateTime, default=datetime.now)
-    fecha_pago = db.Column(db.Date, nullable=False)
+    fecha_registro_utc = db.Column(db.DateTime)  # 🕒 Registro en UTC
+    fecha_pago = db.Column(db.Date, nullable=False)  # Fecha de negocio del pago
     
     # Información del pago
     categoria = db.Column(db.String(50), nullable=False)
@@ -2116,6 +2092,23 @@ class ConsecutivoPOS(db.Model):
     def __repr__(self):
         return f'<ConsecutivoPOS: {self.numero_actual}>'
 
+class LoteConsecutivoPOS(db.Model):
+    """Auditoría de los bloques de consecutivos POS asignados a cada proceso"""
+    __tablename__ = 'lotes_consecutivos_pos'
+    __table_args__ = (
+        db.Index('ix_lotes_consecutivos_pos_panaderia_inicio', 'panaderia_id', 'numero_inicio'),
+    )
+    
+    panaderia_id = db.Column(db.Integer, nullable=False, default=1)
+    id = db.Column(db.Integer, primary_key=True)
+    numero_inicio = db.Column(db.Integer, nullable=False)
+    numero_fin = db.Column(db.Integer, nullable=False)
+    proceso = db.Column(db.String(100))   # host-pid del worker que tomó el bloque
+    fecha_asignacion = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LoteConsecutivoPOS {self.numero_inicio}-{self.numero_fin} ({self.proceso})>'
+
 class ConfiguracionSistema(db.Model):
     """Configuración global del sistema"""
     __tablename__ = 'configuracion_sistema'
@@ -2271,22 +2264,12 @@ def analizar_tendencias_ventas(panaderia_id, dias_historial=30):
     from datetime import datetime, timedelta
     from sqlalchemy import func, extract
     import statistics
+    from resumen_ventas import totales_por_dia
     
     try:
-        # 1. Obtener ventas diarias del período
-        fecha_inicio = datetime.now() - timedelta(days=dias_historial)
-        
-        ventas_diarias = db.session.query(
-            func.date(Venta.fecha_hora).label('fecha'),
-            func.sum(Venta.total).label('total')
-        ).filter(
-            Venta.panaderia_id == panaderia_id,
-            Venta.fecha_hora >= fecha_inicio
-        ).group_by(
-            func.date(Venta.fecha_hora)
-        ).order_by(
-            func.date(Venta.fecha_hora)
-        ).all()
+        # 1. Obtener ventas diarias del período (resumen ventas_diarias)
+        hoy = hoy_tenant(panaderia_id)
+        ventas_diarias = totales_por_dia(panaderia_id, hoy - timedelta(days=dias_historial), hoy)
         
         # 2. Si no hay suficientes datos
         if len(ventas_diarias) < 7:
@@ -2381,7 +2364,7 @@ def analizar_tendencias_ventas(panaderia_id, dias_historial=30):
             'dias_pico': len(dias_con_mayor_venta),
             'dias_bajos': len(dias_con_menor_venta),
             'recomendaciones': recomendaciones,
-            'ventas_diarias': [{'fecha': v.fecha, 'total': v.total} for v in ventas_diarias],
+            'ventas_diarias': [{'fecha': str(v.fecha), 'total': v.total} for v in ventas_diarias],
             'mensaje': f"📊 Análisis de {len(ventas_diarias)} días de actividad."
         }
         
@@ -2411,22 +2394,12 @@ def predecir_ventas_futuras(panaderia_id, dias_a_predecir=7, dias_historial=30):
     from sqlalchemy import func
     import statistics
     import math
+    from resumen_ventas import totales_por_dia
     
     try:
-        # 1. Obtener ventas diarias del historial
-        fecha_inicio = datetime.now() - timedelta(days=dias_historial)
-        
-        ventas_historial = db.session.query(
-            func.date(Venta.fecha_hora).label('fecha'),
-            func.sum(Venta.total).label('total')
-        ).filter(
-            Venta.panaderia_id == panaderia_id,
-            Venta.fecha_hora >= fecha_inicio
-        ).group_by(
-            func.date(Venta.fecha_hora)
-        ).order_by(
-            func.date(Venta.fecha_hora)
-        ).all()
+        # 1. Obtener ventas diarias del historial (resumen ventas_diarias)
+        hoy = hoy_tenant(panaderia_id)
+        ventas_historial = totales_por_dia(panaderia_id, hoy - timedelta(days=dias_historial), hoy)
         
         # 2. Verificar suficiencia de datos
         if len(ventas_historial) < 7:
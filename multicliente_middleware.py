@@ -3,6 +3,8 @@ from flask import g, session
 from functools import wraps
 import sqlite3
 
+from conexion_sqlite import conectar_sqlite
+
 def obtener_info_usuario():
     """
     Obtiene información completa del usuario y panadería actual.
@@ -52,7 +54,7 @@ def get_db_connection():
         return g.db
     
     db_path = 'panaderia.db'
-    conn = sqlite3.connect(db_path)
+    conn = conectar_sqlite(db_path)
     conn.row_factory = sqlite3.Row
     g.db = conn
     return conn
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+PERFIL DEL TENANT - Caché de datos legales y de marca para recibos, facturas y reportes,
+acceso a la configuración del tenant por petición y estado de suscripción en caché
+"""
+
+import threading
+import time
+
+from flask import g, has_app_context, has_request_context
+from flask_login import current_user
+from sqlalchemy import case, or_
+
+from models import ConfiguracionPanaderia, ConfiguracionSistema, obtener_configuracion_panaderia
+
+
+def buscar_configuracion_panaderia(panaderia_id):
+    """
+    ConfiguracionPanaderia de la panadería: la fila con tenant_id y, si no hay,
+    la fila con panaderia_id. Una sola consulta.
+    """
+    return ConfiguracionPanaderia.query.filter(
+        or_(ConfiguracionPanaderia.tenant_id == panaderia_id,
+            ConfiguracionPanaderia.panaderia_id == panaderia_id)
+    ).order_by(
+        case((ConfiguracionPanaderia.tenant_id == panaderia_id, 0), else_=1),
+        ConfiguracionPanaderia.id
+    ).first()
+
+
+def configuracion_tenant(panaderia_id=None):
+    """
+    ConfiguracionPanaderia de la panadería indicada (por defecto la del usuario actual),
+    memorizada en g: una petición nunca consulta la configuración más de una vez.
+    """
+    if panaderia_id is None:
+        if not current_user or not current_user.is_authenticated:
+            return None
+        panaderia_id = current_user.panaderia_id
+
+    if not has_request_context():
+        return buscar_configuracion_panaderia(panaderia_id)
+
+    memo = g.setdefault('_configuraciones_tenant', {})
+    if panaderia_id not in memo:
+        memo[panaderia_id] = buscar_configuracion_panaderia(panaderia_id)
+    return memo[panaderia_id]
+
+
+class PerfilTenant:
+    """
+    Datos de ConfiguracionPanaderia + ConfiguracionSistema combinados en un objeto plano.
+    Expone los mismos nombres que usan las plantillas (config.nombre_empresa, ...).
+    """
+
+    def __init__(self, **datos):
+        for clave, valor in datos.items():
+            setattr(self, clave, valor)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return f'<PerfilTenant {self.panaderia_id} - {self.nombre_empresa}>'
+
+
+class CachePerfilTenant:
+    """
+    Caché por proceso del perfil de cada panadería.
+
+    Se invalida explícitamente al editar la configuración (configuracion_facturacion,
+    rutas de super admin) y, como respaldo para despliegues con varios procesos,
+    cada entrada caduca a los PERFIL_TENANT_TTL segundos.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self._perfiles = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PERFIL_TENANT_TTL', self.ttl)
+        app.extensions['cache_perfil_tenant'] = self
+
+    @staticmethod
+    def _base_datos_actual():
+        if has_app_context():
+            tenant = getattr(g, 'tenant', None)
+            if tenant:
+                return tenant.get('base_datos')
+        return None
+
+    def obtener(self, panaderia_id):
+        """Perfil de la panadería indicada (lo carga desde la BD si no está en caché)"""
+        clave = (self._base_datos_actual(), panaderia_id)
+        ahora = time.monotonic()
+
+        entrada = self._perfiles.get(clave)
+        if entrada and entrada[0] > ahora:
+            return entrada[1]
+
+        perfil = self._cargar(panaderia_id)
+        with self._lock:
+            self._perfiles[clave] = (ahora + self.ttl, perfil)
+        return perfil
+
+    def invalidar(self, *panaderia_ids):
+        """Descartar el perfil de las panaderías indicadas (todas si no se indica ninguna)"""
+        with self._lock:
+            if not panaderia_ids:
+                self._perfiles.clear()
+                return
+            ids = set(panaderia_ids)
+            for clave in [c for c in self._perfiles if c[1] in ids]:
+                del self._perfiles[clave]
+
+    def _cargar(self, panaderia_id):
+        config_panaderia = configuracion_tenant(panaderia_id)
+
+        config_sistema = ConfiguracionSistema.query.filter_by(panaderia_id=panaderia_id).first()
+
+        nombre_panaderia = config_panaderia.nombre_panaderia if config_panaderia else None
+
+        datos = {
+            'panaderia_id': panaderia_id,
+
+            # Datos de la panadería (ConfiguracionPanaderia)
+            'nombre_panaderia': nombre_panaderia,
+            'nit': config_panaderia.nit if config_panaderia else None,
+            'direccion': config_panaderia.direccion if config_panaderia else None,
+            'telefono_contacto': config_panaderia.telefono_contacto if config_panaderia else None,
+            'razon_social': config_panaderia.razon_social if config_panaderia else None,
+            'zona_horaria': config_panaderia.zona_horaria if config_panaderia else None,
+
+            # Datos de facturación (ConfiguracionSistema) - mismos valores por defecto
+            # que obtener_configuracion_sistema() cuando aún no existe el registro
+            'tipo_facturacion': config_sistema.tipo_facturacion if config_sistema else 'POS',
+            'nombre_empresa': config_sistema.nombre_empresa if config_sistema else f'Panadería {panaderia_id}',
+            'nit_empresa': config_sistema.nit_empresa if config_sistema else '9000000001',
+            'direccion_empresa': config_sistema.direccion_empresa if config_sistema else '',
+            'telefono_empresa': config_sistema.telefono_empresa if config_sistema else '',
+            'ciudad_empresa': config_sistema.ciudad_empresa if config_sistema else '',
+            'regimen_empresa': config_sistema.regimen_empresa if config_sistema else 'Simplificado',
+        }
+
+        # Valores impresos en las facturas POS (con los textos de respaldo de siempre)
+        datos['nombre_factura'] = nombre_panaderia or f"Panadería {panaderia_id}"
+        datos['nit_factura'] = datos['nit'] or "NIT_NO_REGISTRADO"
+        datos['direccion_factura'] = datos['direccion'] or "Dirección no registrada"
+        datos['telefono_factura'] = datos['telefono_contacto'] or "Teléfono no registrado"
+
+        return PerfilTenant(**datos)
+
+
+class EstadoSuscripcion:
+    """Lo que antes_de_cada_peticion necesita saber de la suscripción"""
+
+    __slots__ = ('tipo_licencia', 'activa', 'estado')
+
+    def __init__(self, tipo_licencia, activa, estado):
+        self.tipo_licencia = tipo_licencia
+        self.activa = activa
+        self.estado = estado
+
+    @property
+    def bloquea_acceso(self):
+        return self.tipo_licencia != 'local' and not self.activa
+
+
+class CacheSuscripciones:
+    """
+    Estado de suscripción por (BD del tenant, panadería) con un TTL corto
+    (SUSCRIPCION_TTL). Evita consultar y recalcular la suscripción en cada petición;
+    el estado sólo cambia por fechas o desde el panel de super admin, que lo invalida.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self._estados = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('SUSCRIPCION_TTL', self.ttl)
+        app.extensions['cache_suscripciones'] = self
+
+    def obtener(self, panaderia_id):
+        clave = (CachePerfilTenant._base_datos_actual(), panaderia_id)
+        ahora = time.monotonic()
+
+        entrada = self._estados.get(clave)
+        if entrada and entrada[0] > ahora:
+            return entrada[1]
+
+        config = configuracion_tenant(panaderia_id)
+        if config is None:
+            # Sin fila para el tenant: la crea obtener_configuracion_panaderia (comportamiento de siempre)
+            config = obtener_configuracion_panaderia(panaderia_id)
+        config.actualizar_estado_suscripcion()
+
+        estado = EstadoSuscripcion(config.tipo_licencia, config.suscripcion_activa, config.estado_suscripcion)
+        with self._lock:
+            self._estados[clave] = (ahora + self.ttl, estado)
+        return estado
+
+    def invalidar(self, *panaderia_ids):
+        """Descartar el estado de las panaderías indicadas (todas si no se indica ninguna)"""
+        with self._lock:
+            if not panaderia_ids:
+                self._estados.clear()
+                return
+            ids = set(panaderia_ids)
+            for clave in [c for c in self._estados if c[1] in ids]:
+                del self._estados[clave]
+
+
+# Instancias globales de las cachés
+cache_perfiles = CachePerfilTenant()
+cache_suscripciones = CacheSuscripciones()
+
+def init_cache_perfiles(app):
+    """Inicializar la aplicación con las cachés de perfil y suscripción del tenant"""
+    cache_perfiles.init_app(app)
+    cache_suscripciones.init_app(app)
+    return cache_perfiles
+
+def invalidar_configuracion_tenant(*panaderia_ids):
+    """Tras editar ConfiguracionPanaderia: descartar perfil y estado de suscripción"""
+    cache_perfiles.invalidar(*panaderia_ids)
+    cache_suscripciones.invalidar(*panaderia_ids)
+
+def obtener_perfil_tenant(panaderia_id):
+    """Atajo: perfil de la panadería desde la caché"""
+    return cache_perfiles.obtener(panaderia_id)
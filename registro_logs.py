@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+REGISTRO DE LOGS - Logging estructurado por niveles para toda la aplicación
+
+Los módulos usan logging.getLogger('<nombre>') con formato perezoso
+(logger.debug("Venta %s", venta_id)) en lugar de print(). Todos los registros pasan
+por una cola (QueueHandler) y un hilo aparte (QueueListener) los escribe en consola
+y, opcionalmente, en un archivo JSON, así la petición nunca espera por la E/S.
+
+Configuración (app.config):
+    LOG_NIVEL           nivel por defecto ('INFO')
+    LOG_NIVELES_MODULOS {'middleware_saas': 'WARNING', 'pos': 'DEBUG', ...}
+    LOG_FORMATO         'texto' o 'json' para la consola
+    LOG_ARCHIVO_JSON    ruta del archivo de logs en formato JSON (opcional)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+
+class FiltroContexto(logging.Filter):
+    """Agrega tenant y ruta de la petición a cada registro (si hay petición en curso)"""
+
+    def filter(self, record):
+        record.tenant = None
+        record.ruta = None
+        if has_request_context():
+            tenant = getattr(g, 'tenant', None)
+            record.tenant = tenant.get('subdominio') if tenant else None
+            record.ruta = request.path
+        return True
+
+
+class FormateadorJSON(logging.Formatter):
+    """Un objeto JSON por línea, listo para cualquier recolector de logs"""
+
+    CAMPOS_ESTANDAR = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        datos = {
+            'fecha': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        # Campos pasados con extra={...}, tenant y ruta incluidos
+        for clave, valor in vars(record).items():
+            if clave not in self.CAMPOS_ESTANDAR and valor is not None:
+                datos[clave] = valor
+        if record.exc_info:
+            datos['excepcion'] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    QueueHandler que conserva exc_info para que el hilo escritor pueda formatearlo.
+    El mensaje se resuelve aquí (el registro sólo llega si el nivel está habilitado).
+    """
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+
+_listener = None
+
+def init_logging(app):
+    """Configurar el logging de la aplicación (una sola vez por proceso)"""
+    global _listener
+
+    nivel = app.config.get('LOG_NIVEL', 'INFO')
+    niveles_modulos = app.config.get('LOG_NIVELES_MODULOS', {})
+    formato = app.config.get('LOG_FORMATO', 'texto')
+    archivo_json = app.config.get('LOG_ARCHIVO_JSON')
+
+    raiz = logging.getLogger()
+    raiz.setLevel(nivel)
+    for nombre, nivel_modulo in niveles_modulos.items():
+        logging.getLogger(nombre).setLevel(nivel_modulo)
+
+    if _listener is not None:
+        return _listener
+
+    # Sinks reales (se ejecutan en el hilo del QueueListener)
+    consola = logging.StreamHandler()
+    if formato == 'json':
+        consola.setFormatter(FormateadorJSON())
+    else:
+        consola.setFormatter(logging.Formatter('%(asctime)s %(levelname)-7s [%(name)s] %(message)s'))
+    sinks = [consola]
+
+    if archivo_json:
+        archivo = logging.handlers.RotatingFileHandler(
+            archivo_json, maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8'
+        )
+        archivo.setFormatter(FormateadorJSON())
+        sinks.append(archivo)
+
+    cola = queue.SimpleQueue()
+    manejador = ManejadorCola(cola)
+    manejador.addFilter(FiltroContexto())
+
+    # Reemplazar los handlers directos a consola por la cola
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(manejador)
+
+    _listener = logging.handlers.QueueListener(cola, *sinks, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    app.extensions['registro_logs'] = _listener
+    return _listener
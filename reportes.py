@@ -1,4 +1,5 @@
 # reportes.py - VERSIÓN 100% MULTI-TENANT
+import logging
 import os
 from datetime import datetime, timedelta
 from io import BytesIO
@@ -11,6 +12,8 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
 from models import db, RegistroDiario, PagoIndividual, SaldoBanco, Venta, Producto, Proveedor, DepositoBancario, ConfiguracionPanaderia
 from sqlalchemy import func, extract
+from utilidades.rangos_fechas import filtro_fechas, hoy_tenant
+from resumen_ventas import clave_producto, resumen_productos
 
 # Importación para multi-tenant
 from flask_login import current_user
@@ -22,6 +25,8 @@ except ImportError:
     # Para compatibilidad si no está disponible
     db = None
 
+logger = logging.getLogger('reportes')
+
 
 class GeneradorReportes:
     def __init__(self, panaderia_id=None):
@@ -48,26 +53,25 @@ class GeneradorReportes:
     def _obtener_nombre_empresa(self):
         """Obtiene el nombre de la empresa desde la configuración del tenant"""
         try:
-            from models import ConfiguracionPanaderia
-            from flask_login import current_user
+            from perfil_tenant import obtener_perfil_tenant
             
-            panaderia_id = self.panaderia_id or (current_user.panaderia_id if current_user.is_authenticated else None)
+            panaderia_id = self._panaderia_actual()
             
             if panaderia_id:
-                config = ConfiguracionPanaderia.query.filter_by(
-                    tenant_id=panaderia_id
-                ).first()
-                if not config:
-                    config = ConfiguracionPanaderia.query.filter_by(
-                        panaderia_id=panaderia_id
-                    ).first()
-                if config and config.nombre_panaderia:
-                    return config.nombre_panaderia.upper()
+                perfil = obtener_perfil_tenant(panaderia_id)
+                if perfil.nombre_panaderia:
+                    return perfil.nombre_panaderia.upper()
         except Exception as e:
             print(f"⚠️ Error obteniendo nombre de empresa: {e}")
         
         return "PANADERIA - POS"  # Fallback
     
+    def _panaderia_actual(self):
+        """La panadería del generador; sin ella, la del usuario de la petición (la cola de reportes no tiene usuario)"""
+        if self.panaderia_id:
+            return self.panaderia_id
+        return current_user.panaderia_id if current_user and current_user.is_authenticated else None
+    
     def generar_reporte_estado_resultados(self, panaderia_id, fecha_inicio, fecha_fin):
         """Genera reporte de Estado de Resultados (Pérdidas y Ganancias) - CON FILTRO MULTI-TENANT"""
         buffer = BytesIO()
@@ -95,11 +99,7 @@ class GeneradorReportes:
             elements.append(Paragraph("• Verifique que las fechas sean correctas", self.styles['Normal']))
             elements.append(Paragraph("• Confirme que existan ventas registradas en el período", self.styles['Normal']))
             elements.append(Paragraph("• Verifique los cierres de caja del período", self.styles['Normal']))
-            
-            elements.append(Spacer(1, 30))
-            elements.append(Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 
-                                    ParagraphStyle('Footer', parent=self.styles['Normal'], fontSize=8, textColor=colors.gray)))
-            
+
             doc.build(elements)
             buffer.seek(0)
             return buffer
@@ -223,12 +223,7 @@ class GeneradorReportes:
         
         for recomendacion in recomendaciones:
             elements.append(Paragraph(recomendacion, self.styles['Normal']))
-        
-        # Pie de página
-        elements.append(Spacer(1, 30))
-        elements.append(Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 
-                                ParagraphStyle('Footer', parent=self.styles['Normal'], fontSize=8, textColor=colors.gray)))
-        
+
         doc.build(elements)
         buffer.seek(0)
         return buffer
@@ -308,11 +303,6 @@ class GeneradorReportes:
             """
             elements.append(Paragraph(analisis_texto, self.styles['Normal']))
 
-        # Pie de página
-        elements.append(Spacer(1, 30))
-        elements.append(Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 
-                                ParagraphStyle('Footer', parent=self.styles['Normal'], fontSize=8, textColor=colors.gray)))
-
         doc.build(elements)
         buffer.seek(0)
         return buffer
@@ -327,8 +317,7 @@ class GeneradorReportes:
             if isinstance(fecha_fin, str):
                 fecha_fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
             
-            print(f"🔍 BUSCANDO INGRESOS ENTRE: {fecha_inicio} Y {fecha_fin}")
-            print(f"🔍 PANADERÍA ID: {panaderia_id}")
+            logger.debug("🔍 Buscando ingresos entre %s y %s (panadería %s)", fecha_inicio, fecha_fin, panaderia_id)
             
             # ✅ FILTRAR POR TENANT
             registros_cierre = RegistroDiario.query.filter(
@@ -336,7 +325,7 @@ class GeneradorReportes:
                 RegistroDiario.panaderia_id == panaderia_id
             ).all()
             
-            print(f"📊 REGISTROS DE CIERRE ENCONTRADOS: {len(registros_cierre)}")
+            logger.debug("📊 Registros de cierre encontrados: %s", len(registros_cierre))
             
             total_efectivo_cierre = 0
             total_transferencias_cierre = 0
@@ -352,7 +341,7 @@ class GeneradorReportes:
             
             # ✅ FILTRAR VENTAS POR TENANT
             ventas_normales = Venta.query.filter(
-                Venta.fecha_hora.between(fecha_inicio, fecha_fin),
+                filtro_fechas(Venta.fecha_negocio, fecha_inicio, fecha_fin),
                 Venta.es_donacion == False,
                 Venta.panaderia_id == panaderia_id
             ).all()
@@ -382,7 +371,7 @@ class GeneradorReportes:
             
             # ✅ FILTRAR DONACIONES POR TENANT
             ventas_donaciones = Venta.query.filter(
-                Venta.fecha_hora.between(fecha_inicio, fecha_fin),
+                filtro_fechas(Venta.fecha_negocio, fecha_inicio, fecha_fin),
                 Venta.es_donacion == True,
                 Venta.panaderia_id == panaderia_id
             ).all()
@@ -397,16 +386,12 @@ class GeneradorReportes:
             if total_donaciones > 0:
                 ingresos['Donaciones'] = total_donaciones
             
-            print(f"✅ INGRESOS CALCULADOS EXITOSAMENTE:")
-            for concepto, monto in ingresos.items():
-                print(f"   📈 {concepto}: ${monto:,}")
+            logger.debug("✅ Ingresos calculados (%s): %s", fuente_datos, ingresos)
             
             return ingresos
             
-        except Exception as e:
-            print(f"⚠️ Error al obtener ingresos: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("⚠️ Error al obtener ingresos")
             
             return {
                 'Ventas Normales': 0,
@@ -539,10 +524,6 @@ class GeneradorReportes:
             """
             elements.append(Paragraph(resumen_texto, self.styles['Normal']))
 
-        elements.append(Spacer(1, 30))
-        elements.append(Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 
-                                ParagraphStyle('Footer', parent=self.styles['Normal'], fontSize=8, textColor=colors.gray)))
-
         doc.build(elements)
         buffer.seek(0)
         return buffer
@@ -652,7 +633,7 @@ class GeneradorReportes:
             # Obtener saldo del sistema - ✅ CORREGIDO: Añadido filtro panaderia_id
             saldo_sistema_obj = SaldoBanco.query.filter(
                 SaldoBanco.fecha_actualizacion <= fecha_corte,
-                SaldoBanco.panaderia_id == current_user.panaderia_id  # ✅ NUEVO FILTRO MULTI-TENANT
+                SaldoBanco.panaderia_id == self._panaderia_actual()  # ✅ NUEVO FILTRO MULTI-TENANT
             ).order_by(SaldoBanco.fecha_actualizacion.desc()).first()
             
             saldo_sistema = saldo_sistema_obj.saldo_actual if saldo_sistema_obj else 0
@@ -822,7 +803,7 @@ class GeneradorReportes:
             depositos = DepositoBancario.query.filter(
                 DepositoBancario.fecha_deposito <= fecha_corte,
                 DepositoBancario.estado == 'REGISTRADO',
-                DepositoBancario.panaderia_id == current_user.panaderia_id
+                DepositoBancario.panaderia_id == self._panaderia_actual()
             ).order_by(DepositoBancario.fecha_deposito).all()
             
             depositos_lista = []
@@ -871,7 +852,7 @@ class GeneradorReportes:
             # Verificar si ya existe un depósito para esta fecha
             deposito_existente = DepositoBancario.query.filter(
                 DepositoBancario.fecha_deposito == fecha,
-                DepositoBancario.panaderia_id == current_user.panaderia_id,
+                DepositoBancario.panaderia_id == self._panaderia_actual(),
                 DepositoBancario.metodo_deposito == 'efectivo'
             ).first()
             
@@ -885,7 +866,7 @@ class GeneradorReportes:
             
             # Crear nuevo depósito
             nuevo_deposito = DepositoBancario(
-                panaderia_id=current_user.panaderia_id,
+                panaderia_id=self._panaderia_actual(),
                 fecha_deposito=fecha,
                 monto=monto_efectivo,
                 descripcion=descripcion or f"Depósito automático de cierre {fecha}",
@@ -911,7 +892,7 @@ class GeneradorReportes:
         try:
             depositos = DepositoBancario.query.filter(
                 DepositoBancario.fecha_deposito.between(fecha_inicio, fecha_fin),
-                DepositoBancario.panaderia_id == current_user.panaderia_id
+                DepositoBancario.panaderia_id == self._panaderia_actual()
             ).order_by(DepositoBancario.fecha_deposito.desc()).all()
             
             return depositos
@@ -925,7 +906,7 @@ class GeneradorReportes:
         try:
             deposito = DepositoBancario.query.filter(
                 DepositoBancario.id == deposito_id,
-                DepositoBancario.panaderia_id == current_user.panaderia_id
+                DepositoBancario.panaderia_id == self._panaderia_actual()
             ).first()
             
             if not deposito:
@@ -1116,10 +1097,6 @@ class GeneradorReportes:
             for recomendacion in recomendaciones:
                 elements.append(Paragraph(f"• {recomendacion}", self.styles['Normal']))
 
-            elements.append(Spacer(1, 30))
-            elements.append(Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 
-                                    ParagraphStyle('Footer', parent=self.styles['Normal'], fontSize=8, textColor=rl_colors.gray)))
-
             doc.build(elements)
             buffer.seek(0)
             print(f"✅ Análisis de gastos con gráficos generado exitosamente. Tamaño: {buffer.getbuffer().nbytes} bytes")
@@ -1362,11 +1339,6 @@ class GeneradorReportes:
             for proyeccion in proyecciones:
                 elements.append(Paragraph(f"• {proyeccion}", estilo_compacto))
 
-            elements.append(Spacer(1, 15))
-            from reportlab.lib import colors as rl_colors
-            elements.append(Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 
-                                    ParagraphStyle('Footer', parent=self.styles['Normal'], fontSize=7, textColor=rl_colors.gray)))
-
             doc.build(elements)
             buffer.seek(0)
             print(f"✅ Reporte de tendencia OPTIMIZADO generado. Tamaño: {buffer.getbuffer().nbytes} bytes")
@@ -1389,33 +1361,13 @@ class GeneradorReportes:
     def _obtener_datos_tendencia_ventas(self, panaderia_id, fecha_inicio, fecha_fin):
         """Obtiene datos de tendencia de ventas - CON FILTRO MULTI-TENANT"""
         try:
-            from models import Venta, RegistroDiario
-            
-            # ✅ FILTRAR POR TENANT
-            ventas = Venta.query.filter(
-                Venta.fecha_hora >= fecha_inicio,
-                Venta.fecha_hora <= fecha_fin,
-                Venta.panaderia_id == panaderia_id
-            ).all()
+            from resumen_ventas import totales_por_dia
             
-            # Agrupar por fecha
-            datos_por_fecha = {}
-            
-            for venta in ventas:
-                fecha = venta.fecha_hora.date()
-                if fecha not in datos_por_fecha:
-                    datos_por_fecha[fecha] = 0
-                datos_por_fecha[fecha] += venta.total
-            
-            # Ordenar por fecha
-            datos_ordenados = []
-            for fecha, total in sorted(datos_por_fecha.items()):
-                datos_ordenados.append({
-                    'fecha': fecha,
-                    'venta_total': total
-                })
-            
-            return datos_ordenados
+            # ✅ FILTRAR POR TENANT - ya agrupado por fecha en ventas_diarias
+            return [
+                {'fecha': fila.fecha, 'venta_total': fila.total}
+                for fila in totales_por_dia(panaderia_id, fecha_inicio, fecha_fin)
+            ]
             
         except Exception as e:
             print(f"Error al obtener datos de tendencia de ventas: {e}")
@@ -1794,8 +1746,7 @@ class GeneradorReportes:
                 # Calcular ventas del período
                 ventas = DetalleVenta.query.join(Venta).filter(
                     DetalleVenta.producto_id == producto.id,
-                    Venta.fecha_hora >= fecha_inicio,
-                    Venta.fecha_hora <= fecha_fin,
+                    filtro_fechas(Venta.fecha_negocio, fecha_inicio, fecha_fin),
                     Venta.panaderia_id == panaderia_id
                 ).with_entities(func.sum(DetalleVenta.cantidad)).scalar() or 0
                 
@@ -2257,6 +2208,10 @@ class GeneradorReportes:
                     'tipo': 'materia_prima'
                 })
             
+            # Ventas de los últimos 30 días de todos los productos en una sola lectura
+            hoy = hoy_tenant(panaderia_id)
+            ventas_30_dias = resumen_productos(panaderia_id, hoy - timedelta(days=30), hoy)
+            
             # ✅ 2. PRODUCTOS DE PRODUCCIÓN (panadería)
             productos_produccion = Producto.query.filter_by(
                 activo=True, 
@@ -2271,7 +2226,7 @@ class GeneradorReportes:
                     costo_unitario = producto.precio_venta * 0.3
                 
                 valor_inventario = producto.stock_actual * costo_unitario
-                demanda_promedio = self._calcular_demanda_producto(producto.id)
+                demanda_promedio = self._calcular_demanda_producto(producto.id, ventas_30_dias)
                 
                 datos_inventarios.append({
                     'id': producto.id,
@@ -2293,7 +2248,7 @@ class GeneradorReportes:
             
             for producto in productos_externos:
                 valor_inventario = producto.stock_actual * producto.precio_compra
-                demanda_promedio = self._calcular_demanda_producto_externo(producto.id)
+                demanda_promedio = self._calcular_demanda_producto_externo(producto.id, ventas_30_dias)
                 
                 datos_inventarios.append({
                     'id': producto.id,
@@ -2335,7 +2290,7 @@ class GeneradorReportes:
                     OrdenProduccion.receta_id == ingrediente.receta_id,
                     OrdenProduccion.fecha_produccion >= fecha_inicio,
                     OrdenProduccion.estado == 'COMPLETADA',
-                    OrdenProduccion.panaderia_id == current_user.panaderia_id  # ✅ NUEVO FILTRO MULTI-TENANT
+                    OrdenProduccion.panaderia_id == self._panaderia_actual()  # ✅ NUEVO FILTRO MULTI-TENANT
                 ).all()
                 
                 for orden in ordenes:
@@ -2352,44 +2307,30 @@ class GeneradorReportes:
             print(f"Error calculando demanda materia prima {materia_prima_id}: {e}")
             return 1.0  # Valor por defecto
 
-    def _calcular_demanda_producto(self, producto_id):
+    def _demanda_desde_resumen(self, clave, ventas_30_dias=None):
+        """Unidades diarias promedio de los últimos 30 días (ventas_producto_diarias)"""
+        if ventas_30_dias is None:
+            hoy = hoy_tenant(self._panaderia_actual())
+            ventas_30_dias = resumen_productos(  # ✅ FILTRO MULTI-TENANT
+                self._panaderia_actual(), hoy - timedelta(days=30), hoy, claves=[clave]
+            )
+        resumen = ventas_30_dias.get(clave)
+        return (resumen.cantidad if resumen else 0) / 30.0
+
+    def _calcular_demanda_producto(self, producto_id, ventas_30_dias=None):
         """Calcula la demanda promedio de un producto basada en ventas históricas - CORREGIDO MULTI-TENANT"""
         try:
-            from models import DetalleVenta, Venta
-            from datetime import datetime, timedelta
-            
-            fecha_inicio = datetime.now() - timedelta(days=30)
-            
-            # ✅ CORREGIDO: Añadido filtro panaderia_id
-            ventas_totales = DetalleVenta.query.join(Venta).filter(
-                DetalleVenta.producto_id == producto_id,
-                Venta.fecha_hora >= fecha_inicio,
-                Venta.panaderia_id == current_user.panaderia_id  # ✅ NUEVO FILTRO MULTI-TENANT
-            ).with_entities(db.func.sum(DetalleVenta.cantidad)).scalar() or 0
-            
-            demanda_promedio = ventas_totales / 30.0
+            demanda_promedio = self._demanda_desde_resumen(clave_producto(producto_id), ventas_30_dias)
             return max(demanda_promedio, 0.1)
             
         except Exception as e:
             print(f"Error calculando demanda producto {producto_id}: {e}")
             return 1.0
 
-    def _calcular_demanda_producto_externo(self, producto_externo_id):
+    def _calcular_demanda_producto_externo(self, producto_externo_id, ventas_30_dias=None):
         """Calcula la demanda promedio de un producto externo - CORREGIDO MULTI-TENANT"""
         try:
-            from models import DetalleVenta, Venta
-            from datetime import datetime, timedelta
-            
-            fecha_inicio = datetime.now() - timedelta(days=30)
-            
-            # ✅ CORREGIDO: Añadido filtro panaderia_id
-            ventas_totales = DetalleVenta.query.join(Venta).filter(
-                DetalleVenta.producto_externo_id == producto_externo_id,
-                Venta.fecha_hora >= fecha_inicio,
-                Venta.panaderia_id == current_user.panaderia_id  # ✅ NUEVO FILTRO MULTI-TENANT
-            ).with_entities(db.func.sum(DetalleVenta.cantidad)).scalar() or 0
-            
-            demanda_promedio = ventas_totales / 30.0
+            demanda_promedio = self._demanda_desde_resumen(clave_producto(None, producto_externo_id), ventas_30_dias)
             return max(demanda_promedio, 0.1)
             
         except Exception as e:
@@ -2414,8 +2355,7 @@ class GeneradorReportes:
                 # ✅ Calcular ventas del período
                 ventas_periodo = DetalleVenta.query.join(Venta).filter(
                     DetalleVenta.producto_id == producto.id,
-                    Venta.fecha_hora >= fecha_inicio,
-                    Venta.fecha_hora <= fecha_fin,
+                    filtro_fechas(Venta.fecha_negocio, fecha_inicio, fecha_fin),
                     Venta.panaderia_id == panaderia_id  # ✅ FILTRO MULTI-TENANT
                 ).with_entities(func.sum(DetalleVenta.cantidad)).scalar() or 0
                 
@@ -2444,8 +2384,7 @@ class GeneradorReportes:
                 # ✅ Calcular ventas del período
                 ventas_periodo = DetalleVenta.query.join(Venta).filter(
                     DetalleVenta.producto_externo_id == producto.id,
-                    Venta.fecha_hora >= fecha_inicio,
-                    Venta.fecha_hora <= fecha_fin,
+                    filtro_fechas(Venta.fecha_negocio, fecha_inicio, fecha_fin),
                     Venta.panaderia_id == panaderia_id  # ✅ FILTRO MULTI-TENANT
                 ).with_entities(func.sum(DetalleVenta.cantidad)).scalar() or 0
                 
@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+"""
+RESUMEN DE VENTAS DIARIAS - Tablas ventas_diarias y ventas_producto_diarias mantenidas
+dentro de la transacción de cada venta
+
+- ventas_diarias: una fila por (panadería, fecha de negocio, método de pago) con el
+  número de ventas, el total y las donaciones.
+- ventas_producto_diarias: una fila por (panadería, fecha de negocio, producto 'P:123' /
+  'E:45') con unidades, ingresos y costo.
+
+registrar_venta suma la venta con UPSERTs antes del commit, así los resúmenes nunca
+quedan desfasados. Los reportes, la rotación y las proyecciones leen estas filas (unas
+pocas por día) en lugar de cargar y sumar ventas y detalles en Python.
+
+reconstruir_ventas_diarias() / reconstruir_ventas_producto_diarias() recalculan los
+resúmenes desde ventas y detalle_venta (histórico o correcciones) e incrementan en
+versiones_datos la versión de los días reescritos; ver scripts/reconstruir_resumenes_ventas.py.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, String, and_, case, cast, delete, extract, func, insert, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import (db, Categoria, DetalleVenta, Producto, ProductoExterno, Receta, Venta, VentaDiaria,
+                    VentaProductoDiaria, VersionDatos)
+from utilidades.rangos_fechas import filtro_fechas
+
+# ventas.metodo_pago admite NULL y ventas_diarias.metodo_pago no: las ventas sin método
+# se resumen con el default de Venta.metodo_pago
+METODO_PAGO_POR_DEFECTO = 'transferencia'
+
+
+class TotalesVentas:
+    """Totales de un día o período leídos de ventas_diarias"""
+
+    __slots__ = ('cantidad_ventas', 'total_ventas', 'cantidad_donaciones', 'por_metodo')
+
+    def __init__(self):
+        self.cantidad_ventas = 0
+        self.total_ventas = 0.0
+        self.cantidad_donaciones = 0
+        self.por_metodo = {}
+
+    @property
+    def cantidad_transacciones(self):
+        """Ventas + donaciones (como contaban los reportes con len(ventas))"""
+        return self.cantidad_ventas + self.cantidad_donaciones
+
+    @property
+    def ticket_promedio(self):
+        return self.total_ventas / self.cantidad_ventas if self.cantidad_ventas else 0
+
+    def total_metodo(self, metodo_pago):
+        return self.por_metodo.get(metodo_pago, 0.0)
+
+
+def acumular_venta(venta):
+    """
+    Sumar la venta al resumen de su día. Llamar después del flush de la venta y antes
+    del commit: el UPSERT va en la misma transacción.
+    """
+    tabla = VentaDiaria.__table__
+    es_donacion = bool(venta.es_donacion)
+
+    sentencia = sqlite_insert(tabla).values(
+        panaderia_id=venta.panaderia_id,
+        fecha=venta.fecha_negocio,
+        metodo_pago=venta.metodo_pago or METODO_PAGO_POR_DEFECTO,
+        cantidad_ventas=0 if es_donacion else 1,
+        total_ventas=0 if es_donacion else (venta.total or 0),
+        cantidad_donaciones=1 if es_donacion else 0,
+        fecha_actualizacion=datetime.utcnow()
+    )
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=['panaderia_id', 'fecha', 'metodo_pago'],
+        set_={
+            'cantidad_ventas': tabla.c.cantidad_ventas + sentencia.excluded.cantidad_ventas,
+            'total_ventas': tabla.c.total_ventas + sentencia.excluded.total_ventas,
+            'cantidad_donaciones': tabla.c.cantidad_donaciones + sentencia.excluded.cantidad_donaciones,
+            'fecha_actualizacion': sentencia.excluded.fecha_actualizacion,
+        }
+    )
+    db.session.execute(sentencia)
+
+
+def clave_producto(producto_id=None, producto_externo_id=None):
+    """'P:123' / 'E:45', igual que DetalleVenta.clave_producto"""
+    if producto_externo_id:
+        return f"E:{producto_externo_id}"
+    return f"P:{producto_id}"
+
+
+def acumular_productos_venta(venta, lineas):
+    """
+    Sumar las líneas de la venta al resumen por producto de su día, en un solo
+    executemany. lineas: [(es_externo, producto, cantidad)] como en registrar_venta.
+    """
+    es_donacion = bool(venta.es_donacion)
+    ahora = datetime.utcnow()
+
+    filas = {}
+    for es_externo, producto, cantidad in lineas:
+        clave = clave_producto(None, producto.id) if es_externo else clave_producto(producto.id)
+        costo_unitario = (producto.precio_compra if es_externo else producto.costo_compra) or 0
+        fila = filas.get(clave)
+        if fila is None:
+            fila = filas[clave] = {
+                'panaderia_id': venta.panaderia_id,
+                'fecha': venta.fecha_negocio,
+                'clave_producto': clave,
+                'producto_id': None if es_externo else producto.id,
+                'producto_externo_id': producto.id if es_externo else None,
+                'cantidad': 0,
+                'cantidad_donada': 0,
+                'ingresos': 0.0,
+                'costo': 0.0,
+                'fecha_actualizacion': ahora
+            }
+        fila['cantidad'] += cantidad
+        fila['costo'] += cantidad * costo_unitario
+        if es_donacion:
+            fila['cantidad_donada'] += cantidad
+        else:
+            fila['ingresos'] += cantidad * (producto.precio_venta or 0)
+
+    if not filas:
+        return
+
+    tabla = VentaProductoDiaria.__table__
+    sentencia = sqlite_insert(tabla)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=['panaderia_id', 'fecha', 'clave_producto'],
+        set_={
+            'cantidad': tabla.c.cantidad + sentencia.excluded.cantidad,
+            'cantidad_donada': tabla.c.cantidad_donada + sentencia.excluded.cantidad_donada,
+            'ingresos': tabla.c.ingresos + sentencia.excluded.ingresos,
+            'costo': tabla.c.costo + sentencia.excluded.costo,
+            'fecha_actualizacion': sentencia.excluded.fecha_actualizacion,
+        }
+    )
+    db.session.execute(sentencia, list(filas.values()))
+
+
+def _filtrar(consulta, panaderia_id, fecha_inicio, fecha_fin):
+    consulta = consulta.filter(filtro_fechas(VentaDiaria.fecha, fecha_inicio, fecha_fin))
+    if panaderia_id is not None:
+        consulta = consulta.filter(VentaDiaria.panaderia_id == panaderia_id)
+    return consulta
+
+
+def totales_periodo(panaderia_id, fecha_inicio, fecha_fin=None):
+    """
+    TotalesVentas de un día (sin fecha_fin) o de un período inclusive.
+    panaderia_id=None suma todas las panaderías de la BD.
+    """
+    filas = _filtrar(
+        db.session.query(
+            VentaDiaria.metodo_pago,
+            func.sum(VentaDiaria.cantidad_ventas),
+            func.sum(VentaDiaria.total_ventas),
+            func.sum(VentaDiaria.cantidad_donaciones)
+        ),
+        panaderia_id, fecha_inicio, fecha_fin
+    ).group_by(VentaDiaria.metodo_pago).all()
+
+    totales = TotalesVentas()
+    for metodo_pago, cantidad, total, donaciones in filas:
+        totales.cantidad_ventas += cantidad or 0
+        totales.total_ventas += total or 0
+        totales.cantidad_donaciones += donaciones or 0
+        totales.por_metodo[metodo_pago] = total or 0
+    return totales
+
+
+def totales_por_dia(panaderia_id, fecha_inicio, fecha_fin):
+    """
+    Filas (fecha, total, cantidad_ventas, cantidad_donaciones) por día con movimiento,
+    ordenadas por fecha. Los días sin ventas no aparecen.
+    """
+    return _filtrar(
+        db.session.query(
+            VentaDiaria.fecha.label('fecha'),
+            func.sum(VentaDiaria.total_ventas).label('total'),
+            func.sum(VentaDiaria.cantidad_ventas).label('cantidad_ventas'),
+            func.sum(VentaDiaria.cantidad_donaciones).label('cantidad_donaciones')
+        ),
+        panaderia_id, fecha_inicio, fecha_fin
+    ).group_by(VentaDiaria.fecha).order_by(VentaDiaria.fecha).all()
+
+
+class ResumenProducto:
+    """Totales de un producto en un período leídos de ventas_producto_diarias"""
+
+    __slots__ = ('clave_producto', 'producto_id', 'producto_externo_id',
+                 'cantidad', 'cantidad_donada', 'ingresos', 'costo', 'dias_con_ventas')
+
+    def __init__(self, fila):
+        (self.clave_producto, self.producto_id, self.producto_externo_id, self.cantidad,
+         self.cantidad_donada, self.ingresos, self.costo, self.dias_con_ventas) = fila
+
+    @property
+    def es_externo(self):
+        return self.producto_externo_id is not None
+
+    @property
+    def promedio_dia_con_ventas(self):
+        return self.cantidad / self.dias_con_ventas if self.dias_con_ventas else 0
+
+
+def resumen_productos(panaderia_id, fecha_inicio, fecha_fin=None, claves=None):
+    """
+    {clave_producto: ResumenProducto} del período, en una consulta agrupada.
+    claves limita la lectura a esos productos (usa el índice por producto y fecha).
+    panaderia_id=None lee todas las panaderías de la BD.
+    """
+    tabla = VentaProductoDiaria
+    consulta = db.session.query(
+        tabla.clave_producto,
+        func.max(tabla.producto_id),
+        func.max(tabla.producto_externo_id),
+        func.sum(tabla.cantidad),
+        func.sum(tabla.cantidad_donada),
+        func.sum(tabla.ingresos),
+        func.sum(tabla.costo),
+        func.count(tabla.fecha)
+    ).filter(filtro_fechas(tabla.fecha, fecha_inicio, fecha_fin))
+    if panaderia_id is not None:
+        consulta = consulta.filter(tabla.panaderia_id == panaderia_id)
+    if claves is not None:
+        consulta = consulta.filter(tabla.clave_producto.in_(list(claves)))
+
+    return {fila[0]: ResumenProducto(fila) for fila in consulta.group_by(tabla.clave_producto)}
+
+
+def unidades_por_nombre(panaderia_id, fecha_inicio, fecha_fin=None, nombres=None):
+    """
+    {nombre de Producto: unidades vendidas} del período (productos de producción, que
+    las recetas buscan por nombre).
+    """
+    tabla = VentaProductoDiaria
+    consulta = db.session.query(
+        Producto.nombre, func.sum(tabla.cantidad)
+    ).join(Producto, Producto.id == tabla.producto_id).filter(
+        filtro_fechas(tabla.fecha, fecha_inicio, fecha_fin)
+    )
+    if panaderia_id is not None:
+        consulta = consulta.filter(tabla.panaderia_id == panaderia_id)
+    if nombres is not None:
+        consulta = consulta.filter(Producto.nombre.in_(list(nombres)))
+
+    return {nombre: cantidad or 0 for nombre, cantidad in consulta.group_by(Producto.nombre)}
+
+
+def productos_mas_vendidos(panaderia_id, fecha_inicio, fecha_fin, limite=None):
+    """
+    [{clave, nombre, tipo, cantidad_vendida, ingresos_totales}] del período ordenado por
+    unidades vendidas (con donaciones), con el nombre de Producto o ProductoExterno.
+    panaderia_id=None lee todas las panaderías de la BD.
+    """
+    tabla = VentaProductoDiaria
+    cantidad = func.sum(tabla.cantidad)
+    consulta = db.session.query(
+        tabla.clave_producto,
+        func.max(Producto.nombre),
+        func.max(ProductoExterno.nombre),
+        cantidad,
+        func.sum(tabla.ingresos)
+    ).outerjoin(Producto, Producto.id == tabla.producto_id).outerjoin(
+        ProductoExterno, ProductoExterno.id == tabla.producto_externo_id
+    ).filter(
+        filtro_fechas(tabla.fecha, fecha_inicio, fecha_fin)
+    ).group_by(tabla.clave_producto).order_by(cantidad.desc())
+    if panaderia_id is not None:
+        consulta = consulta.filter(tabla.panaderia_id == panaderia_id)
+    if limite:
+        consulta = consulta.limit(limite)
+
+    productos = []
+    for clave, nombre_interno, nombre_externo, vendida, ingresos in consulta:
+        if not (nombre_interno or nombre_externo):
+            continue
+        productos.append({
+            'clave': clave,
+            'nombre': nombre_interno or nombre_externo,
+            'tipo': 'Externo' if clave.startswith('E:') else 'Producción',
+            'cantidad_vendida': vendida or 0,
+            'ingresos_totales': ingresos or 0
+        })
+    return productos
+
+
+def top_productos(panaderia_id, fecha_inicio, fecha_fin, limite=5):
+    """[(nombre, unidades vendidas sin donaciones)] de los productos más vendidos del período"""
+    tabla = VentaProductoDiaria
+    unidades = func.sum(tabla.cantidad - tabla.cantidad_donada)
+    return [tuple(fila) for fila in db.session.query(
+        func.coalesce(Producto.nombre, ProductoExterno.nombre), unidades
+    ).select_from(tabla).outerjoin(Producto, Producto.id == tabla.producto_id).outerjoin(
+        ProductoExterno, ProductoExterno.id == tabla.producto_externo_id
+    ).filter(
+        tabla.panaderia_id == panaderia_id,
+        filtro_fechas(tabla.fecha, fecha_inicio, fecha_fin),
+        func.coalesce(Producto.nombre, ProductoExterno.nombre).isnot(None)
+    ).group_by(tabla.clave_producto).having(unidades > 0).order_by(unidades.desc()).limit(limite)]
+
+
+def unidades_por_categoria(panaderia_id, fecha_inicio, fecha_fin):
+    """
+    [(categoría, unidades vendidas sin donaciones)] del período: Categoria de los
+    productos de producción y ProductoExterno.categoria de los externos.
+    """
+    tabla = VentaProductoDiaria
+    unidades = func.sum(tabla.cantidad - tabla.cantidad_donada)
+    periodo = and_(tabla.panaderia_id == panaderia_id, filtro_fechas(tabla.fecha, fecha_inicio, fecha_fin))
+
+    internos = db.session.query(
+        func.coalesce(Categoria.nombre, 'Sin Categoría'), unidades
+    ).select_from(tabla).join(Producto, Producto.id == tabla.producto_id).outerjoin(
+        Categoria, Categoria.id == Producto.categoria_id
+    ).filter(periodo).group_by(Categoria.nombre)
+
+    externos = db.session.query(
+        func.coalesce(ProductoExterno.categoria, 'Sin Categoría'), unidades
+    ).select_from(tabla).join(ProductoExterno, ProductoExterno.id == tabla.producto_externo_id).filter(
+        periodo
+    ).group_by(ProductoExterno.categoria)
+
+    categorias = {}
+    for categoria, cantidad in list(internos) + list(externos):
+        if cantidad:
+            categorias[categoria] = categorias.get(categoria, 0) + cantidad
+    return sorted(categorias.items(), key=lambda item: item[1], reverse=True)
+
+
+def ventas_por_hora(panaderia_id, fecha_inicio, fecha_fin):
+    """[(hora local 0-23, número de ventas, total)] de las ventas (sin donaciones) del período"""
+    hora = extract('hour', Venta.fecha_hora)
+    return [tuple(fila) for fila in db.session.query(
+        hora, func.count(Venta.id), func.sum(Venta.total)
+    ).filter(
+        Venta.panaderia_id == panaderia_id,
+        filtro_fechas(Venta.fecha_negocio, fecha_inicio, fecha_fin),
+        Venta.es_donacion == False
+    ).group_by(hora).order_by(hora)]
+
+
+def analisis_productos(panaderia_id, fecha_inicio, fecha_fin):
+    """
+    {'P1' / 'E1': {nombre, categoria, cantidad, ingresos, frecuencia}} del período en una
+    consulta agrupada sobre detalle_venta.
+    """
+    consulta = db.session.query(
+        DetalleVenta.producto_id,
+        DetalleVenta.producto_externo_id,
+        func.max(Producto.nombre),
+        func.max(ProductoExterno.nombre),
+        func.sum(DetalleVenta.cantidad),
+        func.sum(DetalleVenta.cantidad * DetalleVenta.precio_unitario),
+        func.count(DetalleVenta.id)
+    ).join(Venta, Venta.id == DetalleVenta.venta_id).outerjoin(
+        Producto, Producto.id == DetalleVenta.producto_id
+    ).outerjoin(
+        ProductoExterno, ProductoExterno.id == DetalleVenta.producto_externo_id
+    ).filter(
+        Venta.panaderia_id == panaderia_id,
+        filtro_fechas(Venta.fecha_negocio, fecha_inicio, fecha_fin)
+    ).group_by(DetalleVenta.producto_id, DetalleVenta.producto_externo_id).order_by(
+        func.sum(DetalleVenta.cantidad).desc()
+    )
+
+    productos = {}
+    for producto_id, externo_id, nombre, nombre_externo, cantidad, ingresos, frecuencia in consulta:
+        if nombre:
+            clave, categoria = f"P{producto_id}", "Producción"
+        elif nombre_externo:
+            clave, categoria, nombre = f"E{externo_id}", "Externo", nombre_externo
+        else:
+            continue
+        productos[clave] = {
+            'nombre': nombre,
+            'categoria': categoria,
+            'cantidad': cantidad or 0,
+            'ingresos': ingresos or 0,
+            'frecuencia': frecuencia
+        }
+    return productos
+
+
+def cierre_por_producto(panaderia_id, fecha):
+    """
+    [(nombre, es_donacion, unidades, ingresos, costo)] del día, en un GROUP BY sobre
+    detalle_venta. Costo unitario: el de la receta si existe, si no costo_compra del
+    producto, si no el 40% del precio; precio_compra para productos externos.
+    """
+    costo_receta = case((Receta.unidades_obtenidas > 0, Receta.costo_total / Receta.unidades_obtenidas), else_=0)
+    costo_unitario = case(
+        (DetalleVenta.producto_id.is_(None), func.coalesce(ProductoExterno.precio_compra, 0)),
+        (func.coalesce(costo_receta, 0) > 0, costo_receta),
+        (func.coalesce(Producto.costo_compra, 0) > 0, Producto.costo_compra),
+        else_=DetalleVenta.precio_unitario * 0.4
+    )
+    nombre = func.coalesce(Producto.nombre, ProductoExterno.nombre)
+
+    return [tuple(fila) for fila in db.session.query(
+        nombre,
+        Venta.es_donacion,
+        func.sum(DetalleVenta.cantidad),
+        func.sum(DetalleVenta.cantidad * DetalleVenta.precio_unitario),
+        func.sum(DetalleVenta.cantidad * costo_unitario)
+    ).join(Venta, Venta.id == DetalleVenta.venta_id).outerjoin(
+        Producto, Producto.id == DetalleVenta.producto_id
+    ).outerjoin(
+        Receta, Receta.id == Producto.receta_id
+    ).outerjoin(
+        ProductoExterno, ProductoExterno.id == DetalleVenta.producto_externo_id
+    ).filter(
+        Venta.panaderia_id == panaderia_id,
+        filtro_fechas(Venta.fecha_negocio, fecha),
+        nombre.isnot(None)
+    ).group_by(nombre, Venta.es_donacion).order_by(func.sum(DetalleVenta.cantidad).desc())]
+
+
+def ventas_con_unidades(panaderia_id, fecha):
+    """[(id, fecha_hora, metodo_pago, total, es_donacion, unidades)] de las ventas del día"""
+    return [tuple(fila) for fila in db.session.query(
+        Venta.id,
+        Venta.fecha_hora,
+        Venta.metodo_pago,
+        Venta.total,
+        Venta.es_donacion,
+        func.coalesce(func.sum(DetalleVenta.cantidad), 0)
+    ).outerjoin(DetalleVenta, DetalleVenta.venta_id == Venta.id).filter(
+        Venta.panaderia_id == panaderia_id,
+        filtro_fechas(Venta.fecha_negocio, fecha)
+    ).group_by(Venta.id).order_by(Venta.id)]
+
+
+def contar_productos_donados(panaderia_id, fecha_inicio, fecha_fin=None):
+    """Líneas de detalle de las donaciones del período (un COUNT en la BD)"""
+    return db.session.query(func.count(DetalleVenta.id)).join(Venta).filter(
+        Venta.panaderia_id == panaderia_id,
+        Venta.es_donacion == True,
+        filtro_fechas(Venta.fecha_negocio, fecha_inicio, fecha_fin)
+    ).scalar() or 0
+
+
+def _dias_del_resumen(tabla, condiciones):
+    """{(panaderia_id, 'YYYY-MM-DD')} con filas en la tabla de resumen"""
+    filas = db.session.execute(select(tabla.c.panaderia_id, tabla.c.fecha).where(*condiciones).distinct())
+    return {(panaderia_id, fecha.isoformat()) for panaderia_id, fecha in filas}
+
+
+def _versionar_dias(nombre_tabla, dias):
+    """
+    Incrementar versiones_datos de los días reescritos por una reconstrucción. Los
+    resúmenes no tienen triggers (cada venta ya versiona 'ventas'): sin esto la caché
+    de reportes seguiría sirviendo los PDF hechos con el resumen anterior.
+    """
+    if not dias:
+        return
+    tabla = VersionDatos.__table__
+    sentencia = sqlite_insert(tabla)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=['tabla', 'panaderia_id', 'fecha'],
+        set_={'version': tabla.c.version + 1}
+    )
+    db.session.execute(sentencia, [
+        {'tabla': nombre_tabla, 'panaderia_id': panaderia_id, 'fecha': fecha, 'version': 1}
+        for panaderia_id, fecha in sorted(dias)
+    ])
+
+
+def reconstruir_ventas_diarias(panaderia_id=None, desde=None, hasta=None):
+    """
+    Recalcular ventas_diarias desde ventas (todo el histórico o el rango de fechas de
+    negocio indicado). No hace commit. Retorna el número de filas del resumen escritas.
+    """
+    tabla = VentaDiaria.__table__
+    es_donacion = Venta.es_donacion == True
+    metodo_pago = func.coalesce(Venta.metodo_pago, METODO_PAGO_POR_DEFECTO)
+
+    origen = select(
+        Venta.panaderia_id,
+        Venta.fecha_negocio,
+        metodo_pago,
+        func.sum(case((es_donacion, 0), else_=1)),
+        func.sum(case((es_donacion, 0), else_=Venta.total)),
+        func.sum(case((es_donacion, 1), else_=0)),
+        literal(datetime.utcnow(), DateTime)
+    ).where(Venta.fecha_negocio.isnot(None))
+
+    condiciones = []
+    if panaderia_id is not None:
+        condiciones.append(tabla.c.panaderia_id == panaderia_id)
+        origen = origen.where(Venta.panaderia_id == panaderia_id)
+    if desde is not None:
+        condiciones.append(tabla.c.fecha >= desde)
+        origen = origen.where(Venta.fecha_negocio >= desde)
+    if hasta is not None:
+        condiciones.append(tabla.c.fecha <= hasta)
+        origen = origen.where(Venta.fecha_negocio <= hasta)
+
+    origen = origen.group_by(Venta.panaderia_id, Venta.fecha_negocio, metodo_pago)
+
+    dias = _dias_del_resumen(tabla, condiciones)
+    db.session.execute(delete(tabla).where(*condiciones))
+    resultado = db.session.execute(insert(tabla).from_select(
+        ['panaderia_id', 'fecha', 'metodo_pago', 'cantidad_ventas', 'total_ventas',
+         'cantidad_donaciones', 'fecha_actualizacion'],
+        origen
+    ))
+    _versionar_dias(tabla.name, dias | _dias_del_resumen(tabla, condiciones))
+    return resultado.rowcount
+
+
+def reconstruir_ventas_producto_diarias(panaderia_id=None, desde=None, hasta=None):
+    """
+    Recalcular ventas_producto_diarias desde detalle_venta. El costo usa el costo
+    actual de cada producto (el histórico no guarda el costo de cada venta). No hace
+    commit. Retorna el número de filas del resumen escritas.
+    """
+    tabla = VentaProductoDiaria.__table__
+    es_donacion = Venta.es_donacion == True
+    clave = case(
+        (DetalleVenta.producto_externo_id.isnot(None), literal('E:') + cast(DetalleVenta.producto_externo_id, String)),
+        else_=literal('P:') + cast(DetalleVenta.producto_id, String)
+    )
+    costo_unitario = func.coalesce(ProductoExterno.precio_compra, Producto.costo_compra, 0)
+
+    origen = select(
+        Venta.panaderia_id,
+        Venta.fecha_negocio,
+        clave,
+        func.max(DetalleVenta.producto_id),
+        func.max(DetalleVenta.producto_externo_id),
+        func.sum(DetalleVenta.cantidad),
+        func.sum(case((es_donacion, DetalleVenta.cantidad), else_=0)),
+        func.sum(case((es_donacion, 0), else_=DetalleVenta.cantidad * DetalleVenta.precio_unitario)),
+        func.sum(DetalleVenta.cantidad * costo_unitario),
+        literal(datetime.utcnow(), DateTime)
+    ).select_from(DetalleVenta).join(Venta, Venta.id == DetalleVenta.venta_id).outerjoin(
+        Producto, Producto.id == DetalleVenta.producto_id
+    ).outerjoin(
+        ProductoExterno, ProductoExterno.id == DetalleVenta.producto_externo_id
+    ).where(Venta.fecha_negocio.isnot(None))
+
+    condiciones = []
+    if panaderia_id is not None:
+        condiciones.append(tabla.c.panaderia_id == panaderia_id)
+        origen = origen.where(Venta.panaderia_id == panaderia_id)
+    if desde is not None:
+        condiciones.append(tabla.c.fecha >= desde)
+        origen = origen.where(Venta.fecha_negocio >= desde)
+    if hasta is not None:
+        condiciones.append(tabla.c.fecha <= hasta)
+        origen = origen.where(Venta.fecha_negocio <= hasta)
+
+    origen = origen.group_by(Venta.panaderia_id, Venta.fecha_negocio, clave)
+
+    dias = _dias_del_resumen(tabla, condiciones)
+    db.session.execute(delete(tabla).where(*condiciones))
+    resultado = db.session.execute(insert(tabla).from_select(
+        ['panaderia_id', 'fecha', 'clave_producto', 'producto_id', 'producto_externo_id',
+         'cantidad', 'cantidad_donada', 'ingresos', 'costo', 'fecha_actualizacion'],
+        origen
+    ))
+    _versionar_dias(tabla.name, dias | _dias_del_resumen(tabla, condiciones))
+    return resultado.rowcount
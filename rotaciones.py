@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+ROTACIONES AUTOMÁTICAS - Recalcula ConfiguracionProduccion.rotacion_diaria_esperada
+
+Para todos los productos con receta de una BD de tenant a la vez: una lectura agrupada
+de ventas_producto_diarias, el cálculo vectorizado con pandas y la escritura en bloque
+de ConfiguracionProduccion (UPDATE por id) y HistorialRotacionProducto (UPSERT por
+producto y fecha).
+
+Corre fuera de las peticiones, como tarea programada: scripts/recalcular_rotaciones.py.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, ConfiguracionProduccion, HistorialRotacionProducto, Producto
+from resumen_ventas import resumen_productos
+from utilidades.rangos_fechas import hoy_tenant
+
+logger = logging.getLogger('rotaciones')
+
+ROTACION_POR_DEFECTO = 10.0
+UMBRAL_CAMBIO = 0.1  # Solo se actualiza si la rotación cambia más de un 10%
+
+
+def _productos_con_configuracion(panaderia_id):
+    """DataFrame producto_id, panaderia_id, configuracion_id, rotacion_actual (una consulta)"""
+    consulta = db.session.query(
+        Producto.id,
+        Producto.panaderia_id,
+        ConfiguracionProduccion.id,
+        ConfiguracionProduccion.rotacion_diaria_esperada
+    ).join(ConfiguracionProduccion, and_(
+        ConfiguracionProduccion.receta_id == Producto.receta_id,
+        ConfiguracionProduccion.panaderia_id == Producto.panaderia_id
+    )).filter(Producto.activo == True)
+    if panaderia_id is not None:
+        consulta = consulta.filter(Producto.panaderia_id == panaderia_id)
+
+    productos = pd.DataFrame(
+        consulta.order_by(ConfiguracionProduccion.id).all(),
+        columns=['producto_id', 'panaderia_id', 'configuracion_id', 'rotacion_actual']
+    )
+    # Una configuración por producto (la primera, como hacía .first())
+    return productos.drop_duplicates('producto_id')
+
+
+def _ventas_por_producto(resumen):
+    """DataFrame producto_id + columnas de ResumenProducto (solo productos de producción)"""
+    return pd.DataFrame(
+        [(r.producto_id, r.cantidad, r.dias_con_ventas) for r in resumen.values() if r.producto_id],
+        columns=['producto_id', 'cantidad', 'dias_con_ventas']
+    )
+
+
+def actualizar_rotaciones_automaticas(panaderia_id=None, dias_historial=30):
+    """
+    Recalcular la rotación diaria (unidades por día con ventas en los últimos
+    dias_historial días) de los productos con receta y configuración de producción.
+    panaderia_id=None procesa todas las panaderías de la BD. Hace commit y retorna
+    el número de configuraciones actualizadas.
+    """
+    try:
+        productos = _productos_con_configuracion(panaderia_id)
+        if productos.empty:
+            return 0
+
+        hoy = hoy_tenant(panaderia_id)
+        historial = _ventas_por_producto(resumen_productos(panaderia_id, hoy - timedelta(days=dias_historial), hoy))
+        ventas_hoy = _ventas_por_producto(resumen_productos(panaderia_id, hoy))[['producto_id', 'cantidad']]
+
+        df = productos.merge(historial, on='producto_id', how='left')
+        df = df.merge(ventas_hoy.rename(columns={'cantidad': 'ventas_dia'}), on='producto_id', how='left')
+        df[['cantidad', 'dias_con_ventas', 'ventas_dia']] = df[['cantidad', 'dias_con_ventas', 'ventas_dia']].fillna(0)
+
+        dias = df['dias_con_ventas'].to_numpy(dtype=float)
+        df['rotacion_nueva'] = np.round(
+            np.divide(df['cantidad'].to_numpy(dtype=float), dias, out=np.zeros_like(dias), where=dias > 0), 2
+        )
+        actual = df['rotacion_actual'].fillna(ROTACION_POR_DEFECTO)
+        cambios = df[(actual - df['rotacion_nueva']).abs() > actual * UMBRAL_CAMBIO]
+        if cambios.empty:
+            return 0
+
+        ahora = datetime.now()
+        db.session.execute(update(ConfiguracionProduccion), [
+            {'id': int(fila.configuracion_id), 'rotacion_diaria_esperada': float(fila.rotacion_nueva),
+             'fecha_actualizacion': ahora}
+            for fila in cambios.itertuples()
+        ])
+
+        tabla = HistorialRotacionProducto.__table__
+        sentencia = sqlite_insert(tabla)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=['producto_id', 'fecha'],
+            set_={
+                'rotacion_real': sentencia.excluded.rotacion_real,
+                'ventas_dia': sentencia.excluded.ventas_dia,
+            }
+        )
+        db.session.execute(sentencia, [
+            {'panaderia_id': int(fila.panaderia_id), 'producto_id': int(fila.producto_id), 'fecha': hoy,
+             'ventas_dia': int(fila.ventas_dia), 'rotacion_real': float(fila.rotacion_nueva),
+             'tendencia_semanal': 1.0}
+            for fila in cambios.itertuples()
+        ])
+
+        db.session.commit()
+        logger.info("✅ Rotaciones automáticas actualizadas: %s productos", len(cambios))
+        return len(cambios)
+
+    except Exception:
+        db.session.rollback()
+        logger.exception("❌ Error actualizando rotaciones automáticas")
+        return 0
+
+
+def rotaciones_actualizadas_hoy(panaderia_id):
+    """Productos cuya rotación recalculó hoy la tarea programada"""
+    return HistorialRotacionProducto.query.filter_by(
+        panaderia_id=panaderia_id,
+        fecha=hoy_tenant(panaderia_id)
+    ).count()
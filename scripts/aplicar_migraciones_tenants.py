@@ -0,0 +1,92 @@
+# scripts/aplicar_migraciones_tenants.py
+"""
+Aplica las migraciones de migrations/ (índices, columnas nuevas y sus rellenos) a
+todas las BD de tenants registradas en tenant_master.db y a la plantilla de nuevos
+tenants. Es idempotente: cada BD guarda su revisión en alembic_version.
+
+Ejecutar en cada despliegue antes de arrancar la aplicación con el código nuevo.
+
+Uso (desde la raíz del proyecto):
+    python scripts/aplicar_migraciones_tenants.py
+    python scripts/aplicar_migraciones_tenants.py --tenant principal
+"""
+import argparse
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RAIZ)
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine
+
+from app import app
+from conexion_sqlite import conectar_sqlite
+
+PLANTILLA = 'tenant_plantilla.db'
+
+
+def listar_bases_datos(subdominio=None):
+    """[(etiqueta, base_datos)] de tenant_master.db, más la plantilla"""
+    conn = conectar_sqlite('tenant_master.db')
+    try:
+        filas = conn.execute('SELECT subdominio, base_datos FROM tenants ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+    bases = [(s, bd) for s, bd in filas if subdominio is None or s == subdominio]
+    if subdominio is None:
+        bases.append(('plantilla', PLANTILLA))
+    return bases
+
+
+def migrar_bd(config, ruta):
+    """Llevar una BD a la última revisión; retorna (revisión anterior, revisión nueva)"""
+    engine = create_engine(f"sqlite:///{os.path.abspath(ruta)}")
+    try:
+        with engine.begin() as conexion:
+            anterior = MigrationContext.configure(conexion).get_current_revision()
+            config.attributes['connection'] = conexion
+            command.upgrade(config, 'head')
+            # Estadísticas para que el planificador de SQLite elija los índices nuevos
+            conexion.exec_driver_sql('PRAGMA analysis_limit = 1000')
+            conexion.exec_driver_sql('ANALYZE')
+            nueva = MigrationContext.configure(conexion).get_current_revision()
+        return anterior, nueva
+    finally:
+        config.attributes.pop('connection', None)
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenant', help='subdominio de un solo tenant')
+    args = parser.parse_args()
+
+    config = Config()
+    config.set_main_option('script_location', os.path.join(RAIZ, 'migrations'))
+    databases_dir = app.config.get('TENANT_DATABASES_DIR', 'databases_tenants')
+
+    errores = 0
+    with app.app_context():
+        for etiqueta, base_datos in listar_bases_datos(args.tenant):
+            ruta = os.path.join(databases_dir, base_datos)
+            if not os.path.exists(ruta):
+                print(f"⚠️ {etiqueta}: no existe {ruta}")
+                continue
+            try:
+                anterior, nueva = migrar_bd(config, ruta)
+                estado = 'al día' if anterior == nueva else f"{anterior or 'sin versión'} → {nueva}"
+                print(f"✅ {etiqueta} ({base_datos}): {estado}")
+            except Exception as e:
+                errores += 1
+                print(f"❌ {etiqueta} ({base_datos}): {e}")
+
+    print(f"📊 Terminado con {errores} error(es)")
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
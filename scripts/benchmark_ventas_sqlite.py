@@ -0,0 +1,143 @@
+# scripts/benchmark_ventas_sqlite.py
+"""
+Benchmark de rendimiento de ventas con y sin el perfil de PRAGMAs (conexion_sqlite.py).
+
+Reproduce la escritura de registrar_venta (venta + detalles + stock + factura en una
+transacción) sobre una BD temporal, primero con los PRAGMAs por defecto de SQLite y
+luego con el perfil de la aplicación. Mide ventas/segundo con una caja y con varias
+cajas concurrentes mientras otra conexión lee reportes.
+
+Uso:
+    python scripts/benchmark_ventas_sqlite.py [--ventas 2000] [--cajas 4]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conexion_sqlite import conectar_sqlite
+
+ESQUEMA = """
+CREATE TABLE productos (id INTEGER PRIMARY KEY, nombre TEXT, precio_venta REAL, stock_actual INTEGER, panaderia_id INTEGER);
+CREATE TABLE ventas (id INTEGER PRIMARY KEY, fecha_hora TEXT, total REAL, metodo_pago TEXT,
+                     consecutivo_pos INTEGER, panaderia_id INTEGER);
+CREATE TABLE detalle_venta (id INTEGER PRIMARY KEY, venta_id INTEGER, producto_id INTEGER,
+                            cantidad INTEGER, precio_unitario REAL, panaderia_id INTEGER);
+CREATE TABLE facturas (id INTEGER PRIMARY KEY, venta_id INTEGER, numero_factura TEXT, total REAL, panaderia_id INTEGER);
+CREATE INDEX ix_ventas_fecha ON ventas (panaderia_id, fecha_hora);
+"""
+
+NUM_PRODUCTOS = 200
+
+
+def crear_bd(ruta):
+    conn = sqlite3.connect(ruta)
+    conn.executescript(ESQUEMA)
+    conn.executemany(
+        "INSERT INTO productos VALUES (?, ?, ?, ?, 1)",
+        [(i, f"Producto {i}", 1000 + i, 10 ** 9) for i in range(1, NUM_PRODUCTOS + 1)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def registrar_venta(conn, consecutivo):
+    """Misma forma de escritura que /registrar_venta: una transacción por venta"""
+    lineas = [(random.randint(1, NUM_PRODUCTOS), random.randint(1, 3)) for _ in range(random.randint(1, 5))]
+    total = sum(c * 1000 for _, c in lineas)
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO ventas (fecha_hora, total, metodo_pago, consecutivo_pos, panaderia_id) VALUES (?, ?, 'efectivo', ?, 1)",
+            (datetime.now().isoformat(), total, consecutivo)
+        )
+        venta_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO detalle_venta (venta_id, producto_id, cantidad, precio_unitario, panaderia_id) VALUES (?, ?, ?, 1000, 1)",
+            [(venta_id, p, c) for p, c in lineas]
+        )
+        conn.executemany(
+            "UPDATE productos SET stock_actual = stock_actual - ? WHERE id = ?",
+            [(c, p) for p, c in lineas]
+        )
+        conn.execute(
+            "INSERT INTO facturas (venta_id, numero_factura, total, panaderia_id) VALUES (?, ?, ?, 1)",
+            (venta_id, f"POS-1-{consecutivo:06d}", total)
+        )
+
+
+def caja(conectar, ruta, ventas, inicio, errores):
+    conn = conectar(ruta)
+    for i in range(ventas):
+        try:
+            registrar_venta(conn, inicio + i)
+        except sqlite3.OperationalError:
+            errores.append(1)
+    conn.close()
+
+
+def lector(conectar, ruta, detener):
+    """Simula un reporte consultando mientras las cajas venden"""
+    conn = conectar(ruta)
+    while not detener.is_set():
+        try:
+            conn.execute("SELECT COUNT(*), SUM(total) FROM ventas WHERE panaderia_id = 1").fetchone()
+        except sqlite3.OperationalError:
+            pass
+    conn.close()
+
+
+def medir(nombre, conectar, ventas, cajas):
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'benchmark.db')
+        crear_bd(ruta)
+
+        # Una caja
+        inicio = time.perf_counter()
+        caja(conectar, ruta, ventas, 1, [])
+        una_caja = ventas / (time.perf_counter() - inicio)
+
+        # Varias cajas + un lector
+        errores = []
+        detener = threading.Event()
+        hilo_lector = threading.Thread(target=lector, args=(conectar, ruta, detener))
+        hilos = [
+            threading.Thread(target=caja, args=(conectar, ruta, ventas // cajas, ventas * (n + 1), errores))
+            for n in range(cajas)
+        ]
+        hilo_lector.start()
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        varias_cajas = (ventas // cajas * cajas) / (time.perf_counter() - inicio)
+        detener.set()
+        hilo_lector.join()
+
+    print(f"{nombre:<22} {una_caja:>10.0f} ventas/s {varias_cajas:>12.0f} ventas/s {len(errores):>8}")
+    return una_caja, varias_cajas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ventas', type=int, default=2000)
+    parser.add_argument('--cajas', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"📊 {args.ventas} ventas - 1 caja / {args.cajas} cajas concurrentes + 1 lector")
+    print(f"{'Perfil':<22} {'1 caja':>19} {f'{args.cajas} cajas':>21} {'bloqueos':>8}")
+    antes = medir('PRAGMAs por defecto', lambda ruta: sqlite3.connect(ruta, check_same_thread=False), args.ventas, args.cajas)
+    despues = medir('Perfil de la app', lambda ruta: conectar_sqlite(ruta, check_same_thread=False), args.ventas, args.cajas)
+
+    print(f"🚀 Mejora: x{despues[0] / antes[0]:.1f} con 1 caja, x{despues[1] / antes[1]:.1f} con {args.cajas} cajas")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# scripts/recalcular_rotaciones.py
+"""
+Tarea programada: recalcula la rotación diaria esperada (ConfiguracionProduccion) de
+los productos con receta de todas las BD de tenants, a partir del resumen
+ventas_producto_diarias. Reemplaza el recálculo que hacía el reporte de productos
+populares en cada visita.
+
+Programar una vez al día, después del cierre (cron):
+    30 23 * * * cd /ruta/bakery-erp && python scripts/recalcular_rotaciones.py
+
+Uso (desde la raíz del proyecto):
+    python scripts/recalcular_rotaciones.py
+    python scripts/recalcular_rotaciones.py --tenant principal --dias 60
+"""
+import argparse
+import logging
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RAIZ)
+
+from flask import g
+
+from app import app
+from conexion_sqlite import conectar_sqlite
+from rotaciones import actualizar_rotaciones_automaticas
+
+# La app configura el registro (registro_logs) al importarse: la salida y los errores
+# de la tarea llegan a la consola y al archivo JSON como los de las peticiones
+logger = logging.getLogger('rotaciones')
+
+
+def listar_tenants(subdominio=None):
+    """[(subdominio, base_datos)] de los tenants activos en tenant_master.db"""
+    conn = conectar_sqlite('tenant_master.db')
+    try:
+        filas = conn.execute('SELECT subdominio, base_datos FROM tenants WHERE activo = 1 ORDER BY id').fetchall()
+    finally:
+        conn.close()
+    return [(s, bd) for s, bd in filas if subdominio is None or s == subdominio]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenant', help='subdominio de un solo tenant')
+    parser.add_argument('--dias', type=int, default=30, help='días de historial (por defecto 30)')
+    args = parser.parse_args()
+
+    databases_dir = app.config.get('TENANT_DATABASES_DIR', 'databases_tenants')
+
+    for subdominio, base_datos in listar_tenants(args.tenant):
+        if not os.path.exists(os.path.join(databases_dir, base_datos)):
+            logger.warning("⚠️ %s: no existe %s", subdominio, base_datos)
+            continue
+
+        with app.app_context():
+            g.tenant = {'subdominio': subdominio, 'base_datos': base_datos}
+            actualizaciones = actualizar_rotaciones_automaticas(dias_historial=args.dias)
+            logger.info("📊 %s (%s): %s rotaciones actualizadas", subdominio, base_datos, actualizaciones)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# scripts/reconstruir_resumenes_ventas.py
+"""
+Recalcula las tablas ventas_diarias (resumen por día y método de pago) y
+ventas_producto_diarias (resumen por día y producto) desde ventas y detalle_venta en
+todas las BD de tenants. registrar_venta las mantiene al día; este script es para
+correcciones manuales de ventas o para verificar los resúmenes.
+
+Uso (desde la raíz del proyecto):
+    python scripts/reconstruir_resumenes_ventas.py
+    python scripts/reconstruir_resumenes_ventas.py --tenant principal --desde 2026-01-01
+"""
+import argparse
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RAIZ)
+
+from flask import g
+
+from app import app
+from conexion_sqlite import conectar_sqlite
+from models import db
+from resumen_ventas import reconstruir_ventas_diarias, reconstruir_ventas_producto_diarias
+from utilidades.rangos_fechas import a_fecha
+
+
+def listar_tenants(subdominio=None):
+    """[(subdominio, base_datos)] de tenant_master.db"""
+    conn = conectar_sqlite('tenant_master.db')
+    try:
+        filas = conn.execute('SELECT subdominio, base_datos FROM tenants ORDER BY id').fetchall()
+    finally:
+        conn.close()
+    return [(s, bd) for s, bd in filas if subdominio is None or s == subdominio]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenant', help='subdominio de un solo tenant')
+    parser.add_argument('--desde', type=a_fecha, help='primera fecha de negocio (YYYY-MM-DD)')
+    parser.add_argument('--hasta', type=a_fecha, help='última fecha de negocio (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    databases_dir = app.config.get('TENANT_DATABASES_DIR', 'databases_tenants')
+
+    errores = 0
+    for subdominio, base_datos in listar_tenants(args.tenant):
+        if not os.path.exists(os.path.join(databases_dir, base_datos)):
+            print(f"⚠️ {subdominio}: no existe {base_datos}")
+            continue
+
+        with app.app_context():
+            g.tenant = {'subdominio': subdominio, 'base_datos': base_datos}
+            try:
+                filas = reconstruir_ventas_diarias(desde=args.desde, hasta=args.hasta)
+                filas_productos = reconstruir_ventas_producto_diarias(desde=args.desde, hasta=args.hasta)
+                db.session.commit()
+                print(f"✅ {subdominio} ({base_datos}): {filas} días/métodos, {filas_productos} días/productos")
+            except Exception as e:
+                db.session.rollback()
+                errores += 1
+                print(f"❌ {subdominio} ({base_datos}): {e}")
+
+    print(f"📊 Terminado con {errores} error(es)")
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
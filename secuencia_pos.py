@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+SECUENCIA POS - Asignación de consecutivos por bloques (arrendamiento de rangos)
+"""
+
+import heapq
+import logging
+import os
+import socket
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+
+from models import db, ConsecutivoPOS, LoteConsecutivoPOS, Venta
+
+logger = logging.getLogger('secuencia_pos')
+
+# Bloques anteriores de cada clave que aún aceptan devoluciones (ventas lentas que
+# fallan después de que otro hilo pasó al bloque siguiente)
+BLOQUES_ANTERIORES = 8
+
+class ServicioSecuenciaPOS:
+    """
+    Entrega consecutivos POS desde memoria tomando bloques de la tabla consecutivos_pos.
+
+    Cada proceso arrienda un bloque de N números por BD y panadería en una transacción
+    corta (un solo UPDATE sobre la fila caliente cada N ventas) y registra el rango en
+    lotes_consecutivos_pos para que los huecos sean trazables en auditorías DIAN.
+    Con tamano_lote = 1 el número se reserva dentro de la transacción de la venta,
+    sin huecos posibles.
+
+    El arrendamiento (que puede esperar busy_timeout en SQLite) corre fuera del lock
+    global, con un lock por clave: solo esperan las ventas de esa misma panadería.
+
+    Un número devuelto (venta fallida) se reutiliza en la siguiente venta si pertenece
+    al bloque actual o a uno de los BLOQUES_ANTERIORES del proceso; si no, se registra
+    como hueco en el log para poder explicarlo en la auditoría.
+    """
+
+    def __init__(self, app=None):
+        self.tamano_lote = 10
+        self._lotes = {}
+        self._locks_arriendo = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Leer el tamaño de bloque desde la configuración de la app"""
+        self.tamano_lote = int(app.config.get('POS_TAMANO_LOTE_CONSECUTIVOS', self.tamano_lote))
+        app.extensions['secuencia_pos'] = self
+
+    @staticmethod
+    def _proceso():
+        return f"{socket.gethostname()}-{os.getpid()}"
+
+    @staticmethod
+    def _clave(engine, panaderia_id):
+        # El pid forma parte de la clave: tras un fork los hijos no reutilizan bloques del padre
+        return (str(engine.url), panaderia_id, os.getpid())
+
+    def _tomar_del_lote(self, clave):
+        """Siguiente número del bloque en memoria, o None si no hay bloque o se agotó (con self._lock)"""
+        lote = self._lotes.get(clave)
+        if lote is None:
+            return None
+        if lote['devueltos']:
+            return heapq.heappop(lote['devueltos'])
+        if lote['siguiente'] > lote['fin']:
+            return None
+        numero = lote['siguiente']
+        lote['siguiente'] += 1
+        return numero
+
+    def siguiente_numero(self, panaderia_id):
+        """Obtener el siguiente consecutivo POS para la panadería indicada"""
+        if self.tamano_lote <= 1:
+            return self._incrementar_en_transaccion(panaderia_id)
+
+        engine = db.session.get_bind()
+        clave = self._clave(engine, panaderia_id)
+
+        with self._lock:
+            numero = self._tomar_del_lote(clave)
+            if numero is not None:
+                return numero
+            lock_arriendo = self._locks_arriendo.setdefault(clave, threading.Lock())
+
+        with lock_arriendo:
+            # Otro hilo pudo arrendar el bloque mientras esperábamos
+            with self._lock:
+                numero = self._tomar_del_lote(clave)
+                if numero is not None:
+                    return numero
+
+            lote = self._arrendar_bloque(engine, panaderia_id)
+
+            with self._lock:
+                anterior = self._lotes.get(clave)
+                if anterior:
+                    # Números devueltos al bloque agotado mientras se arrendaba el nuevo
+                    for devuelto in anterior['devueltos']:
+                        heapq.heappush(lote['devueltos'], devuelto)
+                    lote['anteriores'].extend(anterior['anteriores'])
+                    lote['anteriores'].append((anterior['inicio'], anterior['fin']))
+                self._lotes[clave] = lote
+                return self._tomar_del_lote(clave)
+
+    def devolver(self, panaderia_id, numero):
+        """Devolver un número de una venta fallida para que lo use la siguiente venta"""
+        if self.tamano_lote <= 1 or numero is None:
+            return  # En modo transaccional el rollback ya lo devolvió
+
+        engine = db.session.get_bind()
+        clave = self._clave(engine, panaderia_id)
+
+        with self._lock:
+            lote = self._lotes.get(clave)
+            if lote and self._es_del_proceso(lote, numero):
+                if numero not in lote['devueltos']:
+                    heapq.heappush(lote['devueltos'], numero)
+                return
+
+        logger.warning("⚠️ [CONSECUTIVO] Número %s de la panadería %s devuelto fuera de los bloques "
+                       "de %s: queda como hueco", numero, panaderia_id, self._proceso())
+
+    @staticmethod
+    def _es_del_proceso(lote, numero):
+        """Si el número ya salió del bloque actual o de uno de sus bloques anteriores"""
+        if lote['inicio'] <= numero < lote['siguiente']:
+            return True
+        return any(inicio <= numero <= fin for inicio, fin in lote['anteriores'])
+
+    def _incrementar_en_transaccion(self, panaderia_id):
+        """Reserva el número en la transacción de la venta (sin commit)"""
+        # El UPDATE toma el bloqueo de escritura de SQLite, así que la lectura
+        # posterior ve nuestro propio incremento aunque haya otras cajas vendiendo
+        actualizados = db.session.execute(
+            update(ConsecutivoPOS)
+            .where(ConsecutivoPOS.panaderia_id == panaderia_id)
+            .values(numero_actual=ConsecutivoPOS.numero_actual + 1, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        if not actualizados:
+            # Primera venta de la panadería: crear el registro del consecutivo
+            db.session.add(ConsecutivoPOS(panaderia_id=panaderia_id, numero_actual=1))
+            db.session.flush()
+            return 1
+
+        return db.session.execute(
+            select(ConsecutivoPOS.numero_actual)
+            .where(ConsecutivoPOS.panaderia_id == panaderia_id)
+        ).scalar()
+
+    def _arrendar_bloque(self, engine, panaderia_id):
+        """Tomar un bloque nuevo en su propia transacción y registrarlo en la auditoría"""
+        tabla_consecutivos = ConsecutivoPOS.__table__
+        tabla_lotes = LoteConsecutivoPOS.__table__
+        tamano = self.tamano_lote
+
+        with engine.begin() as conn:
+            actualizados = conn.execute(
+                update(tabla_consecutivos)
+                .where(tabla_consecutivos.c.panaderia_id == panaderia_id)
+                .values(
+                    numero_actual=tabla_consecutivos.c.numero_actual + tamano,
+                    updated_at=datetime.utcnow()
+                )
+            ).rowcount
+
+            if not actualizados:
+                conn.execute(insert(tabla_consecutivos).values(
+                    panaderia_id=panaderia_id,
+                    numero_actual=tamano,
+                    updated_at=datetime.utcnow()
+                ))
+                numero_fin = tamano
+            else:
+                numero_fin = conn.execute(
+                    select(tabla_consecutivos.c.numero_actual)
+                    .where(tabla_consecutivos.c.panaderia_id == panaderia_id)
+                ).scalar()
+
+            numero_inicio = numero_fin - tamano + 1
+            conn.execute(insert(tabla_lotes).values(
+                panaderia_id=panaderia_id,
+                numero_inicio=numero_inicio,
+                numero_fin=numero_fin,
+                proceso=self._proceso(),
+                fecha_asignacion=datetime.utcnow()
+            ))
+
+        logger.info("🔢 [CONSECUTIVO] Bloque %s-%s de la panadería %s asignado a %s",
+                    numero_inicio, numero_fin, panaderia_id, self._proceso())
+        return {'inicio': numero_inicio, 'siguiente': numero_inicio, 'fin': numero_fin, 'devueltos': [],
+                'anteriores': deque(maxlen=BLOQUES_ANTERIORES)}
+
+    def auditar_lotes(self, panaderia_id, limite=50):
+        """
+        Resumen de los últimos bloques asignados: números usados y huecos de cada rango.
+        Los huecos de un bloque aún en uso corresponden a números todavía no vendidos.
+        """
+        lotes = LoteConsecutivoPOS.query.filter_by(
+            panaderia_id=panaderia_id
+        ).order_by(LoteConsecutivoPOS.numero_inicio.desc()).limit(limite).all()
+
+        if not lotes:
+            return []
+
+        minimo = min(l.numero_inicio for l in lotes)
+        maximo = max(l.numero_fin for l in lotes)
+        usados = set(
+            numero for (numero,) in db.session.query(Venta.consecutivo_pos).filter(
+                Venta.panaderia_id == panaderia_id,
+                Venta.tipo_documento == 'POS',
+                Venta.consecutivo_pos.between(minimo, maximo)
+            )
+        )
+
+        resumen = []
+        for lote in lotes:
+            rango = range(lote.numero_inicio, lote.numero_fin + 1)
+            huecos = [n for n in rango if n not in usados]
+            resumen.append({
+                'numero_inicio': lote.numero_inicio,
+                'numero_fin': lote.numero_fin,
+                'proceso': lote.proceso,
+                'fecha_asignacion': lote.fecha_asignacion.isoformat() if lote.fecha_asignacion else None,
+                'usados': len(rango) - len(huecos),
+                'huecos': huecos
+            })
+        return resumen
+
+
+# Instancia global del servicio de consecutivos
+secuencia_pos = ServicioSecuenciaPOS()
+
+def init_secuencia_pos(app):
+    """Inicializar la aplicación con el servicio de consecutivos POS"""
+    secuencia_pos.init_app(app)
+    return secuencia_pos
@@ -10,6 +10,10 @@ let productosFiltrados = [];
 let categoriaActual = '';
 let esDonacion = false; // 🆕 NUEVA VARIABLE PARA DONACIONES
 let motivoDonacion = ''; // 🆕 MOTIVO DE DONACIÓN
+let catalogoInstancia = null; // 🆕 VERSIÓN DEL CATÁLOGO RECIBIDA DEL SERVIDOR
+let catalogoVersion = 0;
+let sincronizandoCatalogo = false;
+const INTERVALO_SINCRONIZACION_CATALOGO = 10000; // ms
 
 // Iconos por categoría (Font Awesome)
 const iconosCategorias = {
@@ -83,6 +87,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Cargar productos y categorías
     cargarProductos();
     
+    // Mantener stock y precios al día con cambios incrementales
+    setInterval(sincronizarCatalogo, INTERVALO_SINCRONIZACION_CATALOGO);
+    
     // Iniciar dashboard en tiempo real
     iniciarDashboardTiempoReal();
     
@@ -153,6 +160,10 @@ function cargarCarritoPersistente() {
         const carritoGuardado = localStorage.getItem('carrito_pos_panaderia_' + tenant_id);
         if (carritoGuardado) {
             carrito = JSON.parse(carritoGuardado);
+            // Carritos guardados con IDs numéricos (externos con +10000) -> claves tipadas
+            carrito = carrito.map(item => typeof item.id === 'number'
+                ? { ...item, id: item.id > 10000 ? `E:${item.id - 10000}` : `P:${item.id}` }
+                : item);
             console.log('🛒 Carrito cargado desde localStorage:', carrito.length, 'items');
             actualizarCarrito();
         }
@@ -178,13 +189,16 @@ async function cargarProductos() {
         console.log('📦 Cargando productos...');
         mostrarLoadingProductos();
         
-        const response = await fetch('/buscar_producto?q=');
+        const response = await fetch('/api/catalogo/snapshot');
         
         if (!response.ok) {
             throw new Error(`Error ${response.status}: ${response.statusText}`);
         }
         
-        todosProductos = await response.json();
+        const snapshot = await response.json();
+        todosProductos = snapshot.productos || [];
+        catalogoInstancia = snapshot.instancia;
+        catalogoVersion = snapshot.version;
         console.log('📦 PRODUCTOS CARGADOS:', todosProductos);
         console.log('🔍 ESTRUCTURA del primer producto:', todosProductos[0]);
         console.log(`✅ ${todosProductos.length} productos cargados`);
@@ -204,6 +218,65 @@ async function cargarProductos() {
     }
 }
 
+// 🆕 Aplicar sólo los cambios de stock/precio ocurridos desde la última versión
+async function sincronizarCatalogo() {
+    if (sincronizandoCatalogo || catalogoInstancia === null) return;
+    sincronizandoCatalogo = true;
+    
+    try {
+        const response = await fetch(`/api/catalogo/cambios?instancia=${catalogoInstancia}&desde=${catalogoVersion}`);
+        if (!response.ok) return;
+        
+        const resultado = await response.json();
+        if (!resultado.success) return;
+        
+        if (resultado.reiniciar) {
+            console.log('🔄 Catálogo desactualizado en el servidor - recargando completo');
+            await cargarProductos();
+            return;
+        }
+        
+        catalogoVersion = resultado.version;
+        if (!resultado.cambios.length) return;
+        
+        let soloStock = true;
+        resultado.cambios.forEach(cambio => {
+            const indice = todosProductos.findIndex(p => p.id === cambio.id);
+            
+            if (!cambio.visible) {
+                if (indice !== -1) todosProductos.splice(indice, 1);
+                soloStock = false;
+                return;
+            }
+            
+            const { visible, ...producto } = cambio;
+            if (indice === -1) {
+                todosProductos.push(producto);
+                soloStock = false;
+            } else {
+                const actual = todosProductos[indice];
+                if (actual.precio !== producto.precio || actual.nombre !== producto.nombre) {
+                    soloStock = false;
+                }
+                todosProductos[indice] = { ...actual, ...producto };
+            }
+        });
+        
+        console.log(`📦 ${resultado.cambios.length} cambios de catálogo aplicados (versión ${catalogoVersion})`);
+        
+        if (soloStock) {
+            actualizarStockVisualmente();
+        } else {
+            filtrarProductos();
+        }
+        
+    } catch (error) {
+        console.error('❌ Error sincronizando catálogo:', error);
+    } finally {
+        sincronizandoCatalogo = false;
+    }
+}
+
 function procesarCategorias() {
     console.log('🔍 PROCESANDO CATEGORÍAS...');
     console.log('📦 Total productos:', todosProductos.length);
@@ -213,14 +286,8 @@ function procesarCategorias() {
     todosProductos.forEach(producto => {
         // Si el producto ya tiene categoría, mantenerla
         if (!producto.categoria) {
-            // Asignar categoría basada en ID (productos internos vs externos)
-            if (producto.id < 10000) {
-                producto.categoria = 'Panadería';
-            } else if (producto.id >= 10000) {
-                producto.categoria = 'Bebidas';
-            } else {
-                producto.categoria = 'General';
-            }
+            // Asignar categoría según el tipo (productos internos vs externos)
+            producto.categoria = producto.es_externo ? 'Bebidas' : 'Panadería';
             console.log(`🏷️ ${producto.nombre} -> ${producto.categoria}`);
         }
     });
@@ -395,10 +462,10 @@ function crearCardProductoModerno(producto) {
                             value="0" 
                             min="0" 
                             max="${producto.stock_actual}"
-                            onkeypress="manejarEnter(event, ${producto.id})"
+                            onkeypress="manejarEnter(event, '${producto.id}')"
                             placeholder="Cant.">
                         <button class="btn btn-success" 
-                                onclick="agregarAlCarritoConCantidad(${producto.id})"
+                                onclick="agregarAlCarritoConCantidad('${producto.id}')"
                                 title="Agregar al carrito (Enter)">
                             <i class="fas fa-plus"></i>
                         </button>
@@ -1080,8 +1147,8 @@ async function procesarVenta() {
 
             registrarVenta(resultado.total);
 
-            // Usar nuestra función que no resetea contadores
-            actualizarStockVisualmente();
+            // Traer del servidor sólo los cambios de stock de esta venta
+            sincronizarCatalogo();
 
             // Resetear inputs a 0 después de venta
             setTimeout(() => {
@@ -2019,8 +2086,8 @@ function mostrarModalDonacionExitosa(resultado) {
     actualizarCarrito();
     reiniciarContadorCarrito();
         
-        // Actualizar stock visualmente
-        actualizarStockVisualmente();
+        // Actualizar stock con los cambios del servidor
+        sincronizarCatalogo();
         
         // Resetear inputs
         setTimeout(() => {
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+REGISTRO DE ENGINES POR TENANT - Un pool de conexiones por base de datos
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+
+
+class RegistroEnginesTenant:
+    """
+    Mantiene un engine SQLAlchemy (con su pool) por cada archivo de BD de tenant.
+
+    El engine se elige según g.tenant en cada consulta, así que dos peticiones
+    concurrentes de panaderías distintas nunca comparten la configuración global
+    de la app. El número de engines abiertos se limita con desalojo LRU.
+    """
+
+    def __init__(self, app=None):
+        self.databases_dir = 'databases_tenants'
+        self.max_engines = 32
+        self.opciones_engine = {}
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Leer la configuración del registro desde la app"""
+        self.databases_dir = app.config.get('TENANT_DATABASES_DIR', self.databases_dir)
+        self.max_engines = app.config.get('TENANT_ENGINES_MAX', self.max_engines)
+        self.opciones_engine = dict(app.config.get('TENANT_ENGINE_OPTIONS', {}))
+        app.extensions['registro_engines_tenant'] = self
+
+    def ruta_bd(self, base_datos):
+        """Ruta del archivo SQLite de un tenant"""
+        return os.path.join(self.databases_dir, base_datos)
+
+    def obtener_engine(self, base_datos):
+        """Obtener (o crear) el engine del archivo de BD indicado"""
+        with self._lock:
+            engine = self._engines.get(base_datos)
+            if engine is not None:
+                self._engines.move_to_end(base_datos)
+                return engine
+
+            ruta = os.path.abspath(self.ruta_bd(base_datos))
+            engine = create_engine(f"sqlite:///{ruta}", **self.opciones_engine)
+            self._engines[base_datos] = engine
+
+            # Desalojar el engine usado hace más tiempo si superamos el límite
+            while len(self._engines) > self.max_engines:
+                _, engine_antiguo = self._engines.popitem(last=False)
+                engine_antiguo.dispose()
+
+            return engine
+
+    def engine_actual(self):
+        """Engine del tenant de la petición en curso, o None si no hay tenant"""
+        if not has_app_context():
+            return None
+
+        tenant = getattr(g, 'tenant', None)
+        if not tenant or not tenant.get('base_datos'):
+            return None
+
+        return self.obtener_engine(tenant['base_datos'])
+
+    def descartar(self, base_datos):
+        """Cerrar el engine de un tenant (p. ej. al eliminar su BD)"""
+        with self._lock:
+            engine = self._engines.pop(base_datos, None)
+        if engine is not None:
+            engine.dispose()
+
+    def cerrar_todos(self):
+        """Cerrar todos los engines abiertos"""
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+        for engine in engines:
+            engine.dispose()
+
+
+class SesionTenant(Session):
+    """Sesión de Flask-SQLAlchemy que enruta las consultas al engine del tenant actual"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+
+        engine = registro_engines.engine_actual()
+        if engine is not None:
+            return engine
+
+        # Sin tenant (arranque, CLI, scripts): usar la BD configurada en la app
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# Instancia global del registro de engines
+registro_engines = RegistroEnginesTenant()
+
+def init_registro_engines(app):
+    """Inicializar la aplicación con el registro de engines por tenant"""
+    registro_engines.init_app(app)
+    return registro_engines
@@ -1,84 +1,141 @@
 # consultas_filtradas.py
+"""
+Capa de consultas filtradas por tenant.
+
+La panadería actual se resuelve una sola vez por petición (memorizada en g) y las
+funciones devuelven queries sin ejecutar: quien las llama decide si hace .all(),
+.first(), .count() o las sigue filtrando.
+
+Las páginas que recorren detalles de venta cargan sus productos con las opciones de
+este módulo (selectinload / contains_eager) en lugar de una consulta perezosa por
+fila; el detector_n_mas_1 avisa en desarrollo cuando alguna se queda por fuera.
+"""
 import sys
 import os
 # Agregar el directorio raíz al path para imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import session
-from models import Producto, ProductoExterno
+import logging
 
-def productos_activos_con_stock():
-    """
-    Retorna query de productos de panadería activos con stock > 0
-    Filtrados por la panadería del usuario actual
-    """
-    try:
-        panaderia_id = obtener_panaderia_actual()
-        print(f"🔍 consultas_filtradas - Panadería actual: {panaderia_id}")
-        
-        query = Producto.query.filter_by(
-            activo=True,
-            panaderia_id=panaderia_id
-        ).filter(Producto.stock_actual > 0)
-        
-        # Debug: contar resultados
-        count = query.count()
-        print(f"🔍 consultas_filtradas - Productos panadería encontrados: {count}")
-        
-        return query
-    except Exception as e:
-        print(f"❌ Error en productos_activos_con_stock: {e}")
-        # Fallback seguro
-        return Producto.query.filter_by(activo=True).filter(Producto.stock_actual > 0)
+from flask import g, has_request_context, session
+from flask_login import current_user
+from sqlalchemy.orm import contains_eager, selectinload
+from models import db, Producto, ProductoExterno, Venta, DetalleVenta
 
-def productos_externos_activos_con_stock():
-    """
-    Retorna query de productos externos activos con stock > 0  
-    Filtrados por la panadería del usuario actual
-    """
-    try:
-        panaderia_id = obtener_panaderia_actual()
-        print(f"🔍 consultas_filtradas - Panadería externos: {panaderia_id}")
-        
-        query = ProductoExterno.query.filter_by(
-            activo=True,
-            panaderia_id=panaderia_id
-        ).filter(ProductoExterno.stock_actual > 0)
-        
-        # Debug: contar resultados
-        count = query.count()
-        print(f"🔍 consultas_filtradas - Productos externos encontrados: {count}")
-        
-        return query
-    except Exception as e:
-        print(f"❌ Error en productos_externos_activos_con_stock: {e}")
-        # Fallback seguro
-        return ProductoExterno.query.filter_by(activo=True).filter(ProductoExterno.stock_actual > 0)
+logger = logging.getLogger('consultas_filtradas')
+
+PANADERIA_POR_DEFECTO = 1
 
 def obtener_panaderia_actual():
     """
-    Obtiene la panadería actual del usuario
+    Obtiene la panadería actual del usuario (memorizada en g durante la petición)
     """
+    if not has_request_context():
+        return PANADERIA_POR_DEFECTO
+
+    panaderia_id = g.get('_panaderia_filtrada')
+    if panaderia_id is None:
+        panaderia_id = _resolver_panaderia_actual()
+        g._panaderia_filtrada = panaderia_id
+    return panaderia_id
+
+def _resolver_panaderia_actual():
     try:
         # 1. Primero de la sesión directa
         if 'panaderia_id' in session:
-            panaderia_id = session['panaderia_id']
-            print(f"🔍 obtener_panaderia_actual - Desde sesión: {panaderia_id}")
-            return panaderia_id
-        
-        # 2. Del usuario en base de datos
+            logger.debug("🔍 obtener_panaderia_actual - Desde sesión: %s", session['panaderia_id'])
+            return session['panaderia_id']
+
+        # 2. Del usuario ya cargado por Flask-Login (sin consultar la BD)
+        if current_user and current_user.is_authenticated and current_user.panaderia_id:
+            logger.debug("🔍 obtener_panaderia_actual - Desde usuario: %s", current_user.panaderia_id)
+            return current_user.panaderia_id
+
+        # 3. Del usuario en base de datos (usa el identity map de la sesión)
         from models import Usuario
         user_id = session.get('user_id')
         if user_id:
-            usuario = Usuario.query.get(user_id)
+            usuario = db.session.get(Usuario, user_id)
             if usuario and usuario.panaderia_id:
-                print(f"🔍 obtener_panaderia_actual - Desde usuario: {usuario.panaderia_id}")
+                logger.debug("🔍 obtener_panaderia_actual - Desde BD: %s", usuario.panaderia_id)
                 return usuario.panaderia_id
-        
-        # 3. Fallback por defecto
-        print("🔍 obtener_panaderia_actual - Usando fallback: 1")
-        return 1
-        
+
+        # 4. Fallback por defecto
+        logger.debug("🔍 obtener_panaderia_actual - Usando fallback: %s", PANADERIA_POR_DEFECTO)
+        return PANADERIA_POR_DEFECTO
+
     except Exception as e:
-        print(f"❌ Error en obtener_panaderia_actual: {e}")
-        return 1
\ No newline at end of file
+        logger.error("❌ Error en obtener_panaderia_actual: %s", e)
+        return PANADERIA_POR_DEFECTO
+
+def consulta_tenant(modelo):
+    """
+    Query del modelo filtrada por la panadería actual (sin ejecutar)
+    """
+    return modelo.query.filter(modelo.panaderia_id == obtener_panaderia_actual())
+
+def productos_activos_con_stock():
+    """
+    Retorna query de productos de panadería activos con stock > 0
+    Filtrados por la panadería del usuario actual
+    """
+    return consulta_tenant(Producto).filter(
+        Producto.activo == True,
+        Producto.stock_actual > 0
+    )
+
+def productos_externos_activos_con_stock():
+    """
+    Retorna query de productos externos activos con stock > 0
+    Filtrados por la panadería del usuario actual
+    """
+    return consulta_tenant(ProductoExterno).filter(
+        ProductoExterno.activo == True,
+        ProductoExterno.stock_actual > 0
+    )
+
+# =============================================
+# CARGA ANTICIPADA DE DETALLES DE VENTA
+# =============================================
+
+def opciones_productos_detalle(ruta=None):
+    """
+    Opciones que cargan producto y producto_externo de los DetalleVenta en bloque
+    (un SELECT ... IN por relación). ruta: la relación desde la que se llega a los
+    detalles, p. ej. selectinload(Venta.detalles).
+    """
+    if ruta is None:
+        return (selectinload(DetalleVenta.producto), selectinload(DetalleVenta.producto_externo))
+    return (ruta.selectinload(DetalleVenta.producto), ruta.selectinload(DetalleVenta.producto_externo))
+
+def con_productos(consulta):
+    """Query de DetalleVenta con sus productos (internos y externos) cargados"""
+    return consulta.options(*opciones_productos_detalle())
+
+def con_detalles(consulta):
+    """Query de Venta con sus detalles y los productos de cada detalle cargados"""
+    return consulta.options(*opciones_productos_detalle(selectinload(Venta.detalles)))
+
+def detalles_de_venta(venta_id, panaderia_id=None):
+    """
+    Detalles de una venta con sus productos, para facturas, recibos y XML
+    (panadería actual si no se indica)
+    """
+    if panaderia_id is None:
+        panaderia_id = obtener_panaderia_actual()
+    return con_productos(DetalleVenta.query.filter_by(venta_id=venta_id, panaderia_id=panaderia_id))
+
+def detalles_productos_externos(panaderia_id=None):
+    """
+    Detalles de venta de productos externos con producto_externo cargado desde el mismo
+    JOIN (contains_eager): una sola consulta. Ya trae unidas productos_externos y ventas
+    para seguir filtrando por Venta.fecha_hora, ProductoExterno.categoria, etc.
+    """
+    if panaderia_id is None:
+        panaderia_id = obtener_panaderia_actual()
+    return DetalleVenta.query.join(DetalleVenta.producto_externo).join(DetalleVenta.venta).options(
+        contains_eager(DetalleVenta.producto_externo)
+    ).filter(
+        DetalleVenta.producto_externo_id.isnot(None),
+        Venta.panaderia_id == panaderia_id
+    )
@@ -0,0 +1,103 @@
+# rangos_fechas.py
+"""
+Filtros de fecha que pueden usar índices.
+
+`func.date(Venta.fecha_hora) == dia` aplica una función a la columna y obliga a
+recorrer toda la tabla. Estas funciones comparan la columna directamente contra un
+rango semiabierto [inicio del día, inicio del día siguiente), así SQLite usa los
+índices de (panaderia_id, fecha_hora), fecha_fin, etc.
+
+Zona horaria: cada panadería tiene la suya (ConfiguracionPanaderia.zona_horaria,
+por defecto app.config['ZONA_HORARIA_POR_DEFECTO']). Ventas, órdenes de producción y
+pagos guardan la hora local sin zona, la hora UTC y la fecha de negocio (el día local
+de la panadería); los reportes diarios filtran por la fecha de negocio indexada.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+
+import pytz
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import and_
+
+ZONA_HORARIA_POR_DEFECTO = 'America/Bogota'
+
+
+def zona_horaria_valida(nombre):
+    return nombre in pytz.all_timezones_set
+
+def zona_horaria_tenant(panaderia_id=None):
+    """
+    Zona horaria (pytz) de la panadería indicada o de la actual. Sale del perfil del
+    tenant en caché y se memoriza en g, así que no consulta la BD en cada venta.
+    """
+    por_defecto = ZONA_HORARIA_POR_DEFECTO
+    if not has_app_context():
+        return pytz.timezone(por_defecto)
+    por_defecto = current_app.config.get('ZONA_HORARIA_POR_DEFECTO', por_defecto)
+
+    if panaderia_id is None:
+        if not has_request_context():
+            return pytz.timezone(por_defecto)
+        from utilidades.consultas_filtradas import obtener_panaderia_actual
+        panaderia_id = obtener_panaderia_actual()
+
+    memo = g.setdefault('_zonas_horarias', {})
+    if panaderia_id not in memo:
+        from perfil_tenant import obtener_perfil_tenant
+        nombre = getattr(obtener_perfil_tenant(panaderia_id), 'zona_horaria', None)
+        memo[panaderia_id] = pytz.timezone(nombre if nombre and zona_horaria_valida(nombre) else por_defecto)
+    return memo[panaderia_id]
+
+def marcas_tiempo(panaderia_id=None, instante_utc=None):
+    """
+    (hora local sin zona, hora UTC sin zona, fecha de negocio) del instante indicado
+    (ahora por defecto) en la zona de la panadería.
+    """
+    if instante_utc is None:
+        instante_utc = datetime.now(timezone.utc)
+    elif instante_utc.tzinfo is None:
+        instante_utc = instante_utc.replace(tzinfo=timezone.utc)
+    local = instante_utc.astimezone(zona_horaria_tenant(panaderia_id))
+    return local.replace(tzinfo=None), instante_utc.replace(tzinfo=None), local.date()
+
+def hoy_tenant(panaderia_id=None):
+    """Fecha de negocio actual de la panadería (no la del servidor)"""
+    return marcas_tiempo(panaderia_id)[2]
+
+
+def a_fecha(valor):
+    """date desde date, datetime o 'YYYY-MM-DD'"""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+def rango_dias(fecha_inicio, fecha_fin=None):
+    """
+    (inicio, fin) semiabierto que cubre los días fecha_inicio..fecha_fin completos.
+    Sin fecha_fin cubre un solo día.
+    """
+    fecha_inicio = a_fecha(fecha_inicio)
+    fecha_fin = a_fecha(fecha_fin) if fecha_fin is not None else fecha_inicio
+    inicio = datetime.combine(fecha_inicio, time.min)
+    fin = datetime.combine(fecha_fin + timedelta(days=1), time.min)
+    return inicio, fin
+
+def filtro_dia(columna, dia):
+    """columna dentro del día `dia` (reemplaza func.date(columna) == dia)"""
+    return filtro_rango(columna, dia, dia)
+
+def filtro_rango(columna, fecha_inicio, fecha_fin):
+    """columna entre los días fecha_inicio y fecha_fin, ambos completos"""
+    inicio, fin = rango_dias(fecha_inicio, fecha_fin)
+    return and_(columna >= inicio, columna < fin)
+
+def filtro_fechas(columna, fecha_inicio, fecha_fin=None):
+    """
+    Columna Date (fecha_negocio, fecha_pago, ...) en un día o entre dos días inclusive.
+    Acepta date, datetime o 'YYYY-MM-DD'.
+    """
+    fecha_inicio = a_fecha(fecha_inicio)
+    if fecha_fin is None:
+        return columna == fecha_inicio
+    return columna.between(fecha_inicio, a_fecha(fecha_fin))